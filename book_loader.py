@@ -1,5 +1,9 @@
 """
 book_loader.py — загрузка учебников из rpd_books/ в pipeline.
+
+[RESUME] --resume: подтверждённые upsert-ы пишутся в books.manifest.jsonl
+(index_manifest.py) — после сбоя загрузка продолжается с места остановки,
+векторы готовых батчей берутся из embed_store.
 """
 
 import argparse
@@ -9,9 +13,11 @@ import re
 import time
 from pathlib import Path
 
-import requests
 from docx import Document
-from utils import get_embedding as _get_embedding
+
+import http_client
+from index_manifest import IndexManifest
+from utils import get_embeddings_cached as _get_embeddings
 
 try:
     import fitz
@@ -29,6 +35,8 @@ COLLECTION = "rpd_rag"
 UPSERT_BATCH = 64
 RETRY_COUNT = 3
 RETRY_DELAY = 2.0
+EMBED_BATCH = 32  # [BATCH] чанков в одном запросе /api/embed
+MANIFEST_FILE = "books.manifest.jsonl"  # [RESUME]
 
 # [FIX-SYNC]
 try:
@@ -206,19 +214,8 @@ def update_config(entries: list[dict]):
 
 
 def upsert_batch(ids: list, vectors: list, payloads: list) -> tuple[bool, list]:
-    body = {"batch": {"ids": ids, "vectors": vectors, "payloads": payloads}}
-    try:
-        r = requests.put(f"{QDRANT_URL}/collections/{COLLECTION}/points", json=body, timeout=60)
-        if r.status_code == 206:
-            failed = r.json().get("result", {}).get("failed", [])
-            return True, [f["id"] for f in failed] if failed else []
-        if r.status_code != 200:
-            print(f"  Ошибка upsert: {r.status_code} {r.text[:300]}")
-            return False, ids
-        return True, []
-    except Exception as e:
-        print(f"  Исключение при upsert: {e}")
-        return False, ids
+    # [HTTP] keep-alive пул и разбор HTTP 206 — в http_client
+    return http_client.qdrant_upsert(QDRANT_URL, COLLECTION, ids, vectors, payloads)
 
 
 def upsert_batch_with_retry(ids: list, vectors: list, payloads: list) -> bool:
@@ -245,29 +242,65 @@ def upsert_batch_with_retry(ids: list, vectors: list, payloads: list) -> bool:
     return False
 
 
-def load_chunks_to_qdrant(all_chunks: list[dict]):
+def _chunks_fingerprint(chunks: list[dict]) -> str:
+    """[RESUME] Отпечаток набора книжных чанков для манифеста."""
+    h = hashlib.sha256(f"{COLLECTION}\x00bge-m3".encode("utf-8"))
+    for c in chunks:
+        h.update(f"\x00{c['id']}\x00{c.get('text', '')}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def load_chunks_to_qdrant(all_chunks: list[dict], resume: bool = False):
     print(f"  Загрузка {len(all_chunks)} книжных чанков в Qdrant (HTTP)...")
     time.sleep(5)
 
+    # [RESUME] Пропускаем чанки, upsert которых подтверждён в прошлом запуске
+    manifest = IndexManifest(MANIFEST_FILE, _chunks_fingerprint(all_chunks))
+    resumed = resume and manifest.load()
+    if resume and not resumed:
+        print(f"  ℹ️  {MANIFEST_FILE} не найден или от другого набора книг — загрузка с начала")
+    if resumed:
+        all_chunks = [c for c in all_chunks if c["id"] not in manifest.done]
+        print(f"  [RESUME] уже загружено: {len(manifest.done) - len(manifest.skipped)}, "
+              f"пропущено: {len(manifest.skipped)}, осталось: {len(all_chunks)}")
+        if not all_chunks:
+            manifest.close(completed=True)
+            print("✅ Все книжные чанки уже загружены")
+            return
+    manifest.start(resume=resumed)
+
     # [FIX-VALIDATE]
     MIN_EMBED_CHARS = 20
     validated_chunks = []
-    skipped_validation = 0
+    skipped_validation = []
     for chunk in all_chunks:
         text = (chunk.get("text") or "").strip()
         if not text or len(text) < MIN_EMBED_CHARS:
-            skipped_validation += 1
+            skipped_validation.append(chunk["id"])
             print(f"  ⚠️  Пропуск чанка {chunk['id']} — текст пуст или слишком короткий ({len(text)} симв.)")
             continue
         chunk["text"] = text
         validated_chunks.append(chunk)
     if skipped_validation:
-        print(f"  ℹ️  Пропущено при валидации: {skipped_validation} чанков")
+        manifest.skip(skipped_validation)   # [RESUME] не перепроверять при --resume
+        print(f"  ℹ️  Пропущено при валидации: {len(skipped_validation)} чанков")
+
+    # [BATCH] Эмбеддинги пачками по EMBED_BATCH — один запрос на пачку
+    # [STORE] Повторная загрузка тех же книг берёт векторы из embed_store
+    vectors_all: list = []
+    for batch_start in range(0, len(validated_chunks), EMBED_BATCH):
+        batch = validated_chunks[batch_start: batch_start + EMBED_BATCH]
+        vectors_all.extend(
+            _get_embeddings([c["text"] for c in batch], prefix="passage", retry=RETRY_COUNT)
+        )
+        print(f"    embedded {min(batch_start + EMBED_BATCH, len(validated_chunks))}"
+              f"/{len(validated_chunks)}")
 
     points = []
-    for i, chunk in enumerate(validated_chunks):
-        vec = _get_embedding(chunk["text"], prefix="passage", retry=RETRY_COUNT)
+    skipped_embed = []
+    for chunk, vec in zip(validated_chunks, vectors_all):
         if not vec:
+            skipped_embed.append(chunk["id"])
             print(f"  ⚠️  Пропуск чанка {chunk['id']} — embedding не получен")
             continue
 
@@ -293,11 +326,17 @@ def load_chunks_to_qdrant(all_chunks: list[dict]):
             "embedding_model": "bge-m3",
         }
         points.append({"id": point_id, "vector": vec, "payload": payload})
-        if (i + 1) % 10 == 0:
-            print(f"    embedded {i+1}/{len(validated_chunks)}")
+
+    # [RESUME] Чанки без эмбеддинга (сбой Ollama) не подтверждаются —
+    # --resume повторит их, манифест не закрывается как завершённый
+    if skipped_embed:
+        print(f"  ⚠️  Без эмбеддинга: {len(skipped_embed)} чанков")
 
     if not points:
+        manifest.close(completed=not skipped_embed)
         print("  ⚠️  Нет точек для загрузки")
+        if skipped_embed:
+            print(f"  ℹ️  Повторите с --resume ({MANIFEST_FILE})")
         return
 
     uploaded = 0
@@ -308,17 +347,27 @@ def load_chunks_to_qdrant(all_chunks: list[dict]):
         payloads = [p["payload"] for p in batch]
 
         if upsert_batch_with_retry(ids, vectors, payloads):
+            manifest.ack([p["payload"]["chunk_id"] for p in batch])  # [RESUME]
             uploaded += len(batch)
             print(f"    Загружено: {uploaded}/{len(points)}")
         else:
             print(f"    ❌ Не удалось загрузить батч {batch_start}-{batch_start+len(batch)}")
 
-    print(f"✅ Загружено в Qdrant: {uploaded} чанков (stype=book_content)")
+    completed = uploaded == len(validated_chunks)
+    manifest.close(completed)
+    if completed:
+        print(f"✅ Загружено в Qdrant: {uploaded} чанков (stype=book_content)")
+    else:
+        print(f"⚠️  Загружено в Qdrant: {uploaded} из {len(validated_chunks)} чанков (stype=book_content)")
+        print(f"  ℹ️  Загружено не всё — повторите с --resume ({MANIFEST_FILE})")
+    http_client.print_http_stats()  # [HTTP]
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--meta-only", action="store_true")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"[RESUME] Продолжить прерванную загрузку по {MANIFEST_FILE}")
     args = parser.parse_args()
 
     books = sorted(BOOKS_DIR.glob("*.*"))
@@ -347,7 +396,7 @@ def main():
     update_config(all_entries)
 
     if not args.meta_only and all_chunks:
-        load_chunks_to_qdrant(all_chunks)
+        load_chunks_to_qdrant(all_chunks, resume=args.resume)
 
 
 if __name__ == "__main__":
@@ -51,7 +51,13 @@ chunking.py — нарезка очищенных текстов РПД на ч
   - [З-R4] ИСПРАВЛЕНО: 16 дублей в chunks.jsonl — одинаковые табличные чанки
     типов place/hours из разных РПД не дедуплицировались, так как хеш включал
     source. text_hash() теперь использует source="" для типов из SOURCELESS_TYPES
-    (place, hours), схлопывая идентичные шаблонные тексты в один чанк."""
+    (place, hours), схлопывая идентичные шаблонные тексты в один чанк.
+
+Исправления v3.6:
+  - [ID] Стабильные id чанков: вместо сквозного счётчика global_chunk_id
+    id выводится из text_hash() (stable_chunk_id). Добавление одного DOCX
+    в корпус больше не сдвигает id всех последующих чанков, и
+    load_qdrant.py --sync перезагружает только новые/изменённые чанки."""
 
 import json
 import hashlib
@@ -225,6 +231,17 @@ def text_hash(text: str, source: str = "", stype: str = "") -> str:
     ).hexdigest()
 
 
+def stable_chunk_id(h: str) -> int:
+    """
+    [ID] Контентный id чанка (= id точки Qdrant) из text_hash().
+
+    60 бит sha256 — целое без знака, как требует Qdrant; та же схема, что
+    у point_id в book_loader.py. Хеш уже дедуплицирован в main(), поэтому
+    id уникален в пределах chunks.jsonl и не зависит от порядка документов.
+    """
+    return int(h[:15], 16)
+
+
 NOISE_LINE_PATTERNS = re.compile(
     r"^(продолжение\s+таблицы|таблица\s+\d+|окончание\s+таблицы|примечание[\s:—]|"
     r"рисунок\s+\d+|рис\.\s+\d+|источник:|составлено\s+автором)",
@@ -461,7 +478,6 @@ def main():
     print(f"Записей после группировки: {len(records)} (было {len(raw_records)})")
 
     chunks_out:      list[dict] = []
-    global_chunk_id: int        = 0
     seen_hashes:     set        = set()
     stats_source:    dict       = {}
     dup_count  = 0
@@ -540,7 +556,7 @@ def main():
             )
 
             chunks_out.append({
-                "id":              global_chunk_id,
+                "id":              stable_chunk_id(h),  # [ID]
                 "doc_id":          doc_id,
                 "chunk_index":     idx,
                 "doc_position":    doc_pos_start + idx,
@@ -561,7 +577,6 @@ def main():
                 # Обратная совместимость с load_qdrant.py
                 "metadata": {**chunk_meta, "section_type": sec_meta["section_type"]},
             })
-            global_chunk_id += 1
             stats_source[source]["chunks"] += 1
             stype_count += 1
             stats_source[source]["by_stype"][stype_for_limit] = stype_count
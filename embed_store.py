@@ -0,0 +1,200 @@
+"""
+embed_store.py — общий бинарный кэш эмбеддингов (memory-mapped).
+
+Заменяет embed-часть JSON-кэшей rpd_cache.json / test_cache.json /
+eval_cache.json: раньше каждый скрипт держал свой словарь text → list[float],
+при старте целиком парсил JSON (1.8 МБ на 124 вектора) и целиком переписывал
+его при сохранении. Одинаковые запросы эмбеддились заново в каждом скрипте.
+
+Хранилище контентно-адресуемое: ключ = blake2b(модель, prefix, текст),
+поэтому один каталог безопасно делят все скрипты пайплайна и разные модели.
+
+Формат каталога:
+  meta.json    — {"dim": 1024, "dtype": "float16"}
+  keys.bin     — 16-байтные ключи, по одному на строку vectors.bin
+  vectors.bin  — строки dim × dtype, только дозапись (append-only)
+  lru.bin      — uint32 «тик» последнего обращения к строке (пишется в flush)
+
+Старт: читаются только keys.bin (16 байт на вектор) и lru.bin, vectors.bin
+отображается в память (np.memmap) — векторы не парсятся. Запись: новые
+строки дописываются в конец keys.bin/vectors.bin. При превышении max_rows
+flush() сжимает хранилище, оставляя max_rows последних использованных
+строк (LRU).
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+KEY_BYTES = 16
+
+
+def make_key(model: str, prefix: str, text: str) -> bytes:
+    """Контентный ключ вектора: (модель, prefix, текст) → 16 байт."""
+    return hashlib.blake2b(
+        f"{model}\x00{prefix}\x00{text}".encode("utf-8"), digest_size=KEY_BYTES
+    ).digest()
+
+
+class EmbedStore:
+    """
+    Append-only хранилище векторов с LRU-ограничением размера.
+
+    Потокобезопасно в пределах процесса (load_qdrant эмбеддит в несколько
+    потоков). Одновременная запись из нескольких процессов не поддерживается —
+    скрипты пайплайна запускаются последовательно.
+    """
+
+    def __init__(self, path: str, dtype: str = "float16", max_rows: int = 200_000):
+        self.path     = Path(path)
+        self.dtype    = np.dtype(dtype)
+        self.max_rows = max_rows
+        self.dim      = 0
+        self._lock    = threading.Lock()
+        self._index: dict = {}          # key → номер строки
+        self._lru     = np.zeros(0, dtype=np.uint32)
+        self._tick    = 0
+        self._mm      = None            # np.memmap по vectors.bin
+        self._dirty   = False
+        self._open()
+
+    # -- файлы ---------------------------------------------------------------
+
+    @property
+    def _meta_file(self) -> Path:
+        return self.path / "meta.json"
+
+    @property
+    def _keys_file(self) -> Path:
+        return self.path / "keys.bin"
+
+    @property
+    def _vec_file(self) -> Path:
+        return self.path / "vectors.bin"
+
+    @property
+    def _lru_file(self) -> Path:
+        return self.path / "lru.bin"
+
+    def _open(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        if not self._meta_file.exists():
+            return
+        meta = json.loads(self._meta_file.read_text(encoding="utf-8"))
+        self.dim   = int(meta["dim"])
+        self.dtype = np.dtype(meta.get("dtype", self.dtype.name))
+
+        keys = self._keys_file.read_bytes() if self._keys_file.exists() else b""
+        row_bytes = self.dim * self.dtype.itemsize
+        vec_rows  = (self._vec_file.stat().st_size // row_bytes
+                     if self._vec_file.exists() else 0)
+        # Оборванная дозапись (падение процесса) — доверяем меньшему из двух
+        # и обрезаем оба файла: иначе следующий put_many допишет строки после
+        # «осиротевших» байтов, и номера строк разойдутся со смещениями
+        count = min(len(keys) // KEY_BYTES, vec_rows)
+        if self._vec_file.exists() and self._vec_file.stat().st_size != count * row_bytes:
+            os.truncate(self._vec_file, count * row_bytes)
+        if len(keys) != count * KEY_BYTES:
+            os.truncate(self._keys_file, count * KEY_BYTES)
+        for row in range(count):
+            self._index[keys[row * KEY_BYTES:(row + 1) * KEY_BYTES]] = row
+
+        self._lru = np.zeros(count, dtype=np.uint32)
+        if self._lru_file.exists():
+            saved = np.fromfile(self._lru_file, dtype=np.uint32)[:count]
+            self._lru[:len(saved)] = saved
+        self._tick = int(self._lru.max()) if count else 0
+        self._remap(count)
+
+    def _remap(self, count: int) -> None:
+        self._mm = (np.memmap(self._vec_file, dtype=self.dtype, mode="r",
+                              shape=(count, self.dim))
+                    if count else None)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    # -- чтение/запись -------------------------------------------------------
+
+    def get_many(self, keys: list) -> list:
+        """Векторы (np.float32) по ключам; None для отсутствующих."""
+        out: list = []
+        with self._lock:
+            self._tick += 1
+            for key in keys:
+                row = self._index.get(key)
+                if row is None:
+                    out.append(None)
+                    continue
+                self._lru[row] = self._tick
+                out.append(np.asarray(self._mm[row], dtype=np.float32))
+            self._dirty = True
+        return out
+
+    def put_many(self, keys: list, vectors: list) -> None:
+        """Дописывает новые векторы в конец хранилища (дубли ключей пропускаются)."""
+        with self._lock:
+            new = [(k, v) for k, v in zip(keys, vectors)
+                   if v is not None and len(v) and k not in self._index]
+            # Дубли внутри одного вызова
+            new = list(dict(new).items())
+            if not new:
+                return
+            if not self.dim:
+                self.dim = len(new[0][1])
+                self._meta_file.write_text(
+                    json.dumps({"dim": self.dim, "dtype": self.dtype.name}),
+                    encoding="utf-8",
+                )
+            new = [(k, v) for k, v in new if len(v) == self.dim]
+            if not new:
+                return
+            block = np.asarray([v for _, v in new], dtype=self.dtype)
+            start = len(self._index)
+            with open(self._vec_file, "ab") as f:
+                f.write(block.tobytes())
+            with open(self._keys_file, "ab") as f:
+                f.write(b"".join(k for k, _ in new))
+            self._tick += 1
+            for i, (k, _) in enumerate(new):
+                self._index[k] = start + i
+            self._lru = np.concatenate(
+                [self._lru, np.full(len(new), self._tick, dtype=np.uint32)]
+            )
+            self._remap(len(self._index))
+            self._dirty = True
+
+    def flush(self) -> None:
+        """Сохраняет LRU-тики; при превышении max_rows сжимает хранилище."""
+        with self._lock:
+            if not self._dirty:
+                return
+            if self.max_rows and len(self._index) > self.max_rows:
+                self._compact()
+            self._lru.tofile(self._lru_file)
+            self._dirty = False
+
+    def _compact(self) -> None:
+        """Оставляет max_rows строк с самыми свежими тиками (порядок строк сохраняется)."""
+        keep = np.sort(np.argsort(self._lru, kind="stable")[-self.max_rows:])
+        by_row = {row: key for key, row in self._index.items()}
+        keys   = [by_row[int(r)] for r in keep]
+        block  = np.asarray(self._mm[keep])
+        lru    = self._lru[keep]
+        self._mm = None   # отпускаем mmap до замены файла (Windows)
+
+        tmp_vec, tmp_keys = self._vec_file.with_suffix(".tmp"), self._keys_file.with_suffix(".tmp")
+        block.tofile(tmp_vec)
+        tmp_keys.write_bytes(b"".join(keys))
+        os.replace(tmp_vec, self._vec_file)
+        os.replace(tmp_keys, self._keys_file)
+
+        removed = len(self._index) - len(keys)
+        self._index = {k: i for i, k in enumerate(keys)}
+        self._lru   = lru
+        self._remap(len(keys))
+        print(f"  ♻️  embed_store: вытеснено {removed} векторов (лимит {self.max_rows})")
@@ -29,33 +29,32 @@ import requests
 from docx import Document                        # [FIX-PEP8] перенесён из середины файла
 from nltk.stem.snowball import SnowballStemmer   # [FIX-ROUGE] для стемминга русских токенов
 # [FIX-#18]
-from utils import get_embedding as _embed_raw
+from utils import get_embeddings_cached as _embed_cached, import_legacy_embed_cache, get_embed_store
 
-# [FIX-#9]
-_EMBED_CACHE: dict = {}
+# [FIX-#9] [STORE] Эмбеддинги кэшируются в общем embed_store/ (utils).
+# eval_cache.json старого формата {text: vector} переносится при первом запуске.
 _EVAL_CACHE_FILE = "eval_cache.json"
 
 
 def _load_eval_cache() -> None:
-    global _EMBED_CACHE
     from pathlib import Path as _Path
     p = _Path(_EVAL_CACHE_FILE)
     if p.exists():
         try:
-            _EMBED_CACHE = json.loads(p.read_text(encoding="utf-8"))
-            print(f"📦 eval_cache: {len(_EMBED_CACHE)} эмбеддингов загружено")
+            migrated = import_legacy_embed_cache(
+                json.loads(p.read_text(encoding="utf-8")), prefix="query"
+            )
+            p.unlink()
+            print(f"📦 eval_cache: {migrated} эмбеддингов перенесено в embed_store")
         except Exception as e:
             print(f"⚠️  Ошибка загрузки eval_cache: {e}")
 
 
 def _save_eval_cache() -> None:
-    from pathlib import Path as _Path
     try:
-        _Path(_EVAL_CACHE_FILE).write_text(
-            json.dumps(_EMBED_CACHE, ensure_ascii=False), encoding="utf-8"
-        )
+        get_embed_store().flush()
     except Exception as e:
-        print(f"⚠️  Ошибка сохранения eval_cache: {e}")
+        print(f"⚠️  Ошибка сохранения embed_store: {e}")
 
 
 from nltk.translate.bleu_score import SmoothingFunction, corpus_bleu
@@ -123,16 +122,22 @@ _ST_MAP: dict = {
 # Embedding + cosine similarity (локальный Ollama / bge-m3)
 # ---------------------------------------------------------------------------
 def embed(text: str) -> list[float]:
-    """Получает эмбеддинг через utils.get_embedding с локальным кэшем. [FIX-#9, #18]"""
-    if text in _EMBED_CACHE:
-        return _EMBED_CACHE[text]
-    vec = _embed_raw(text, prefix="query", retry=3)
+    """Получает эмбеддинг через utils.get_embeddings_cached (embed_store). [FIX-#9, #18]"""
+    vec = _embed_cached([text], prefix="query", retry=3)[0]
     if not vec:
         raise RuntimeError(f"embed failed for text[:50]={text[:50]!r}")
-    _EMBED_CACHE[text] = vec
     return vec
 
 
+def embed_many(texts: list[str]) -> None:
+    """
+    [BATCH] Прогревает embed_store: все промахи — одним пакетным запросом.
+    Последующие embed() по этим текстам берутся из кэша; неудачные тексты
+    не кэшируются, и embed() для них поднимет RuntimeError как раньше.
+    """
+    _embed_cached([t for t in texts if t], prefix="query", retry=3)
+
+
 def cosine_sim(a: list[float], b: list[float]) -> float:
     va, vb = np.array(a, dtype=float), np.array(b, dtype=float)
     denom = np.linalg.norm(va) * np.linalg.norm(vb)
@@ -397,6 +402,7 @@ def find_reference(
             return src, data, 1.0
 
     print(f"  📚 Сравнение с {len(sources)} источниками (по title)...")
+    embed_many([data.get("title", "") for _, data in sources])  # [BATCH]
 
     best_src, best_score, best_entry = "", -1.0, {}
     for src, data in sources:
@@ -420,6 +426,8 @@ def find_reference(
               f"title=«{best_title[:60]}»)\n"
               f"  🔄 Fallback: сравнение по тексту секции competencies...")
         fb_best_src, fb_best_score, fb_best_entry = "", -1.0, {}
+        embed_many([data.get("sections", {}).get("competencies", "")[:300]
+                    for _, data in sources])  # [BATCH]
         for src, data in sources:
             comp_text = data.get("sections", {}).get("competencies", "")
             if not comp_text:
@@ -459,6 +467,10 @@ def find_section_reference(
     При отсутствии подходящих секций в корпусе возвращает ("", "", 0.0).
     """
     # Берём первые 400 символов — достаточно для характеристики тематики
+    embed_many([section_text[:400]] + [  # [BATCH]
+        data.get("sections", {}).get(section_key, "").strip()[:400]
+        for data in corpus.values()
+    ])
     query_vec = embed(section_text[:400])
     best_src, best_score, best_text = "", -1.0, ""
     for src, data in corpus.items():
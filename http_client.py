@@ -0,0 +1,363 @@
+"""
+http_client.py — общий HTTP-слой для Ollama и Qdrant.
+
+Раньше utils.get_embedding, load_qdrant.upsert_batch, book_loader.upsert_batch,
+rpd_generate._search_qdrant/llm и test_generate._search_qdrant/llm вызывали
+голый requests.post/put: каждый вызов открывал новое TCP-соединение, у каждого
+была своя копия retry/backoff, а _search_qdrant при каждой ошибке заново
+пробовал /points/query → /points/search.
+
+Здесь:
+  - один requests.Session с keep-alive пулом (configure_pool(workers) — под
+    число потоков вызывающего скрипта);
+  - request(): единый retry с экспоненциальной паузой для сетевых ошибок,
+    таймаутов, 5xx и ответов, не прошедших проверку accept(r);
+  - счётчики по endpoint-меткам (вызовы, ошибки, повторы, время) —
+    print_http_stats() в конце скрипта;
+  - qdrant_search()/qdrant_search_batch()/qdrant_upsert(): версия API Qdrant
+    определяется один раз на URL (GET / → version), /points/query[/batch]
+    для ≥1.10, иначе /points/search[/batch];
+  - qdrant_scroll()/qdrant_delete(): обход и удаление точек — синхронизация
+    с chunks.jsonl (load_qdrant --sync) и выгрузка в local_index.py.
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 8
+RETRY_STATUSES    = {429, 500, 502, 503, 504}
+
+_lock         = threading.Lock()
+_session      = None
+_pool_size    = DEFAULT_POOL_SIZE
+_stats: dict  = {}   # endpoint → {"calls", "errors", "retries", "total_s", "max_s"}
+_qdrant_api: dict = {}   # base_url → "query" | "search"
+_qdrant_detected: set = set()   # base_url, для которых версия Qdrant известна
+
+
+# ---------------------------------------------------------------------------
+# Сессия и пул соединений
+# ---------------------------------------------------------------------------
+
+def configure_pool(workers: int) -> None:
+    """
+    Увеличивает пул keep-alive соединений до числа рабочих потоков
+    (+2 на служебные запросы). Пул только растёт — уменьшать его при
+    параллельной работе нескольких компонентов небезопасно.
+    """
+    global _session, _pool_size
+    with _lock:
+        size = max(DEFAULT_POOL_SIZE, workers + 2)
+        if size <= _pool_size and _session is not None:
+            return
+        _pool_size = max(_pool_size, size)
+        _session = None   # пересоздаётся в get_session() с новым размером
+
+
+def get_session() -> requests.Session:
+    global _session
+    with _lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=_pool_size)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            _session = s
+        return _session
+
+
+# ---------------------------------------------------------------------------
+# Счётчики
+# ---------------------------------------------------------------------------
+
+def _record(endpoint: str, elapsed: float, error: bool, retried: bool) -> None:
+    with _lock:
+        st = _stats.setdefault(endpoint, {"calls": 0, "errors": 0, "retries": 0,
+                                          "total_s": 0.0, "max_s": 0.0})
+        st["calls"]   += 1
+        st["errors"]  += int(error)
+        st["retries"] += int(retried)
+        st["total_s"] += elapsed
+        st["max_s"]    = max(st["max_s"], elapsed)
+
+
+def http_stats() -> dict:
+    """Копия счётчиков: endpoint → calls/errors/retries/total_s/avg_s/max_s."""
+    with _lock:
+        return {
+            ep: {**st,
+                 "total_s": round(st["total_s"], 3),
+                 "max_s":   round(st["max_s"], 3),
+                 "avg_s":   round(st["total_s"] / st["calls"], 3) if st["calls"] else 0.0}
+            for ep, st in _stats.items()
+        }
+
+
+def print_http_stats() -> None:
+    stats = http_stats()
+    if not stats:
+        return
+    print("\n⏱️  HTTP по endpoint-ам:")
+    print(f"  {'endpoint':<22} {'вызовов':>8} {'ошибок':>7} {'повторов':>9} "
+          f"{'всего, с':>9} {'сред, с':>8} {'макс, с':>8}")
+    for ep, st in sorted(stats.items(), key=lambda x: -x[1]["total_s"]):
+        print(f"  {ep:<22} {st['calls']:>8} {st['errors']:>7} {st['retries']:>9} "
+              f"{st['total_s']:>9.2f} {st['avg_s']:>8.3f} {st['max_s']:>8.3f}")
+
+
+# ---------------------------------------------------------------------------
+# Запрос с retry
+# ---------------------------------------------------------------------------
+
+def request(method: str, url: str, *, endpoint: str, json=None, timeout: float = 60,
+            retry: int = 1, backoff: float = 2.0, accept=None,
+            quiet: bool = False, stream: bool = False) -> requests.Response:
+    """
+    HTTP-запрос через общий пул с единым retry.
+
+    Повторяются: сетевые ошибки/таймауты, статусы RETRY_STATUSES и ответы,
+    для которых accept(r) вернул False. Прочие 4xx возвращаются caller-у
+    сразу (например 206/404 Qdrant разбираются на месте).
+    После исчерпания попыток поднимает последнее исключение
+    (для статусов — requests.HTTPError через raise_for_status()).
+    stream=True — тело не читается (llm_client: потоковый /api/generate);
+    время в счётчиках — до заголовков ответа.
+    """
+    delay = backoff
+    last_exc: Exception | None = None
+    for attempt in range(retry):
+        t0 = time.perf_counter()
+        try:
+            r = get_session().request(method, url, json=json, timeout=timeout, stream=stream)
+            bad = r.status_code in RETRY_STATUSES or (
+                r.status_code < 400 and accept is not None and not accept(r)
+            )
+            _record(endpoint, time.perf_counter() - t0, error=bad, retried=attempt > 0)
+            if not bad:
+                return r
+            if r.status_code >= 400:
+                r.raise_for_status()
+            last_exc = ValueError(f"{endpoint}: ответ не прошёл проверку")
+        except requests.RequestException as e:
+            if not isinstance(e, requests.HTTPError):
+                _record(endpoint, time.perf_counter() - t0, error=True, retried=attempt > 0)
+            last_exc = e
+        if attempt < retry - 1:
+            if not quiet:
+                print(f"  ↻ {endpoint}: попытка {attempt + 1}/{retry} не удалась "
+                      f"({last_exc}), ждём {delay:.0f}с")
+            time.sleep(delay)
+            delay *= 2
+    raise last_exc
+
+
+def post(url: str, *, endpoint: str, json=None, **kw) -> requests.Response:
+    return request("POST", url, endpoint=endpoint, json=json, **kw)
+
+
+def put(url: str, *, endpoint: str, json=None, **kw) -> requests.Response:
+    return request("PUT", url, endpoint=endpoint, json=json, **kw)
+
+
+def get(url: str, *, endpoint: str, **kw) -> requests.Response:
+    return request("GET", url, endpoint=endpoint, **kw)
+
+
+def delete(url: str, *, endpoint: str, **kw) -> requests.Response:
+    return request("DELETE", url, endpoint=endpoint, **kw)
+
+
+# ---------------------------------------------------------------------------
+# Qdrant
+# ---------------------------------------------------------------------------
+
+def _parse_version(v: str) -> tuple:
+    parts = []
+    for p in str(v).split(".")[:3]:
+        digits = "".join(ch for ch in p if ch.isdigit())
+        parts.append(int(digits) if digits else 0)
+    return tuple(parts)
+
+
+def qdrant_api(base_url: str) -> str:
+    """
+    Один раз на base_url определяет поисковый API Qdrant:
+    "query" (/points/query, Qdrant ≥1.10) или "search" (/points/search).
+    Если версию узнать не удалось, "query" — предположение: 404/405 от
+    /points/query понижает его до "search" (_query_unavailable).
+    """
+    with _lock:
+        mode = _qdrant_api.get(base_url)
+    if mode:
+        return mode
+    mode = "query"
+    try:
+        r = get(f"{base_url}/", endpoint="qdrant.version", timeout=5)
+        version = r.json().get("version", "")
+        if version:
+            with _lock:
+                _qdrant_detected.add(base_url)
+            if _parse_version(version) < (1, 10):
+                mode = "search"
+    except Exception:
+        pass   # версия неизвестна — пробуем query, при 404 понизим до search
+    with _lock:
+        _qdrant_api.setdefault(base_url, mode)
+        return _qdrant_api[base_url]
+
+
+def _query_unavailable(base_url: str, r: requests.Response) -> bool:
+    """
+    True — /points/query на сервере нет, API понижен до search. Понижение
+    только при неизвестной версии: у сервера ≥1.10 404 — это, например,
+    отсутствующая коллекция, и ошибка уходит caller-у.
+    """
+    with _lock:
+        detected = base_url in _qdrant_detected
+    if r.status_code not in (404, 405) or detected:
+        r.raise_for_status()
+        return False
+    with _lock:
+        if _qdrant_api.get(base_url) != "search":
+            print(f"  ℹ️  Qdrant {base_url}: /points/query недоступен — используется /points/search")
+        _qdrant_api[base_url] = "search"
+    return True
+
+
+def qdrant_search(base_url: str, collection: str, vec: list, payload_filter: dict | None,
+                  top_k: int, timeout: float = 30, retry: int = 2) -> list:
+    """Поиск top_k точек (с payload) — через API, определённый qdrant_api()."""
+    mode = qdrant_api(base_url)
+    if mode == "query":
+        body = {"query": vec, "limit": top_k, "with_payload": True}
+        if payload_filter:
+            body["filter"] = payload_filter
+        r = post(f"{base_url}/collections/{collection}/points/query",
+                 endpoint="qdrant.query", json=body, timeout=timeout, retry=retry)
+        if not _query_unavailable(base_url, r):
+            return r.json().get("result", {}).get("points", [])
+
+    body = {"vector": vec, "limit": top_k, "with_payload": True}
+    if payload_filter:
+        body["filter"] = payload_filter
+    r = post(f"{base_url}/collections/{collection}/points/search",
+             endpoint="qdrant.search", json=body, timeout=timeout, retry=retry)
+    r.raise_for_status()
+    return r.json().get("result", [])
+
+
+def qdrant_search_batch(base_url: str, collection: str, vecs: list,
+                        payload_filter: dict | None, top_k: int,
+                        timeout: float = 30, retry: int = 2) -> list:
+    """
+    Пакетный поиск: один запрос /points/query/batch (или /points/search/batch)
+    на все векторы. Возвращает списки хитов в порядке vecs.
+    """
+    if not vecs:
+        return []
+    if len(vecs) == 1:
+        return [qdrant_search(base_url, collection, vecs[0], payload_filter, top_k,
+                              timeout=timeout, retry=retry)]
+    mode = qdrant_api(base_url)
+    if mode == "query":
+        searches = [{"query": v, "limit": top_k, "with_payload": True} for v in vecs]
+        if payload_filter:
+            for body in searches:
+                body["filter"] = payload_filter
+        r = post(f"{base_url}/collections/{collection}/points/query/batch",
+                 endpoint="qdrant.query_batch", json={"searches": searches},
+                 timeout=timeout, retry=retry)
+        if not _query_unavailable(base_url, r):
+            return [res.get("points", []) for res in r.json().get("result", [])]
+
+    searches = [{"vector": v, "limit": top_k, "with_payload": True} for v in vecs]
+    if payload_filter:
+        for body in searches:
+            body["filter"] = payload_filter
+    r = post(f"{base_url}/collections/{collection}/points/search/batch",
+             endpoint="qdrant.search_batch", json={"searches": searches},
+             timeout=timeout, retry=retry)
+    r.raise_for_status()
+    return r.json().get("result", [])
+
+
+def qdrant_upsert(base_url: str, collection: str, ids: list, vectors: list,
+                  payloads: list, timeout: float = 60) -> tuple[bool, list]:
+    """
+    Upsert батча в формате batch (ids/vectors/payloads).
+    Возвращает (ok, failed_ids): HTTP 206 — частичный успех со списком
+    незагруженных точек; прочие ошибки — (False, ids). Повтор батча
+    (в т.ч. только failed_ids) остаётся за caller-ом.
+    """
+    body = {"batch": {"ids": ids, "vectors": vectors, "payloads": payloads}}
+    try:
+        r = put(f"{base_url}/collections/{collection}/points",
+                endpoint="qdrant.upsert", json=body, timeout=timeout)
+    except requests.RequestException as e:
+        print(f"  Исключение при upsert: {e}")
+        return False, ids
+    if r.status_code == 206:
+        try:
+            failed = r.json().get("result", {}).get("failed", [])
+        except Exception:
+            failed = []
+        if failed:
+            print(f"  ⚠️  HTTP 206: {len(failed)} точек не загружено: {failed[:5]}")
+        return True, [f["id"] for f in failed] if failed else []
+    if r.status_code != 200:
+        print(f"  Ошибка upsert: {r.status_code} {r.text[:300]}")
+        return False, ids
+    return True, []
+
+
+def qdrant_scroll(base_url: str, collection: str, fields,
+                  payload_filter: dict | None = None, page: int = 1000,
+                  timeout: float = 30, with_vector: bool = False):
+    """
+    Генератор точек коллекции ({"id", "payload"[, "vector"]}).
+    fields — список полей payload (для синхронизации хватает хешей)
+    или True для полного payload.
+    """
+    offset = None
+    while True:
+        body = {"limit": page, "with_payload": fields, "with_vector": with_vector}
+        if payload_filter:
+            body["filter"] = payload_filter
+        if offset is not None:
+            body["offset"] = offset
+        r = post(f"{base_url}/collections/{collection}/points/scroll",
+                 endpoint="qdrant.scroll", json=body, timeout=timeout, retry=2)
+        r.raise_for_status()
+        result = r.json().get("result", {})
+        yield from result.get("points", [])
+        offset = result.get("next_page_offset")
+        if offset is None:
+            return
+
+
+def qdrant_delete(base_url: str, collection: str, ids: list,
+                  timeout: float = 60) -> bool:
+    """Удаление точек по id (ожидает применения — wait=true)."""
+    try:
+        r = post(f"{base_url}/collections/{collection}/points/delete?wait=true",
+                 endpoint="qdrant.delete", json={"points": ids}, timeout=timeout, retry=2)
+    except requests.RequestException as e:
+        print(f"  Исключение при delete: {e}")
+        return False
+    if r.status_code != 200:
+        print(f"  Ошибка delete: {r.status_code} {r.text[:300]}")
+        return False
+    return True
+
+
+def has_json_field(field: str):
+    """accept-предикат для request(): ответ — JSON с непустым полем field."""
+    def _accept(r: requests.Response) -> bool:
+        try:
+            return bool(r.json().get(field))
+        except ValueError:
+            return False
+    return _accept
@@ -0,0 +1,115 @@
+"""
+index_manifest.py — манифест загрузки в Qdrant для возобновления (--resume).
+
+Если Ollama или Qdrant падали посреди load_qdrant.main или
+book_loader.load_chunks_to_qdrant, следующий запуск начинал с нуля.
+Векторы уже посчитанных батчей сохраняются в embed_store сразу после
+получения (дозапись в vectors.bin), поэтому повторный embedding — это
+чтение из кэша. Манифест фиксирует вторую половину работы — id точек,
+upsert которых Qdrant подтвердил.
+
+Формат — JSONL рядом с исходными чанками:
+  {"fingerprint": "...", "created": "..."}   — заголовок
+  {"ids": [...]}                              — по строке на успешный upsert
+  {"skipped": [...]}                          — чанки, отброшенные валидацией
+
+fingerprint описывает вход (файл чанков, коллекция, модель): манифест от
+другого входа при --resume игнорируется. Строки дописываются с flush, так
+что оборванный процесс теряет максимум один батч; битая последняя строка
+пропускается при чтении.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+
+def file_fingerprint(path: str, *extra: str) -> str:
+    """sha256 содержимого файла + дополнительные параметры запуска."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    for part in extra:
+        h.update(b"\x00" + str(part).encode("utf-8"))
+    return h.hexdigest()
+
+
+class IndexManifest:
+    """Журнал подтверждённых upsert-ов одного входа (fingerprint)."""
+
+    def __init__(self, path: str, fingerprint: str):
+        self.path        = Path(path)
+        self.fingerprint = fingerprint
+        self.done: set   = set()
+        self.skipped: set = set()   # подмножество done: не загружались
+        self._fh         = None
+
+    def load(self) -> bool:
+        """
+        Читает манифест. True — манифест от того же входа (self.done заполнен),
+        False — манифеста нет или он от другого входа.
+        """
+        if not self.path.exists():
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        try:
+            header = json.loads(lines[0]) if lines else {}
+        except json.JSONDecodeError:
+            header = {}
+        if header.get("fingerprint") != self.fingerprint:
+            return False
+        for line in lines[1:]:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue   # оборванная последняя запись
+            self.done.update(rec.get("ids", []))
+            self.done.update(rec.get("skipped", []))
+            self.skipped.update(rec.get("skipped", []))
+        return True
+
+    def start(self, resume: bool) -> None:
+        """Открывает манифест на дозапись; без resume — начинает новый."""
+        if resume and self.path.exists():
+            self._fh = open(self.path, "a", encoding="utf-8")
+            return
+        self.done = set()
+        self.skipped = set()
+        self._fh = open(self.path, "w", encoding="utf-8")
+        self._write({"fingerprint": self.fingerprint,
+                     "created": datetime.now().isoformat(timespec="seconds")})
+
+    def ack(self, ids: list) -> None:
+        """Фиксирует id точек, upsert которых подтверждён Qdrant."""
+        self.done.update(ids)
+        if self._fh is not None:
+            self._write({"ids": list(ids)})
+
+    def skip(self, ids: list) -> None:
+        """
+        Фиксирует id чанков, отброшенных валидацией (пустой или слишком
+        короткий текст): результат не изменится, поэтому --resume их больше
+        не перебирает. Сбои эмбеддинга сюда не пишутся — их повторяет --resume.
+        """
+        if not ids:
+            return
+        self.done.update(ids)
+        self.skipped.update(ids)
+        if self._fh is not None:
+            self._write({"skipped": list(ids)})
+
+    def close(self, completed: bool) -> None:
+        """completed=True — всё загружено, манифест больше не нужен."""
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        if completed and self.path.exists():
+            os.remove(self.path)
+
+    def _write(self, obj: dict) -> None:
+        self._fh.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        self._fh.flush()
@@ -0,0 +1,154 @@
+"""
+lexical_index.py — BM25-индекс по chunks.jsonl для гибридного retrieval.
+
+Запросы SECTION_QUERIES ключевые по природе («УК ОПК ПК формируемые
+компетенции шифр индекс ФГОС»), а retrieve был только плотным (bge-m3):
+чанки с точным совпадением шифров/терминов не проходили min_score, и
+retrieve уходил во второй поиск без фильтра. Здесь — обратный индекс
+с русским стеммингом Snowball (nltk, как в evaluate.py) и BM25 (k1, b),
+фильтры payload — те же, что у Qdrant (local_index.PayloadMasks).
+
+Слияние с плотным поиском — reciprocal rank fusion (rrf_fuse): ранги
+списков складываются как Σ 1 / (RRF_K + rank), шкалы cosine и BM25 не
+смешиваются.
+
+Индекс строится в памяти при первом обращении (несколько тысяч чанков —
+доли секунды: стемминг кэшируется по словоформе). Точки book_loader.py
+в chunks.jsonl отсутствуют — книги находит только плотный поиск.
+"""
+
+import json
+import math
+import re
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from local_index import PayloadMasks
+
+try:
+    from nltk.stem.snowball import SnowballStemmer
+    _stemmer = SnowballStemmer("russian")
+except ImportError:   # nltk не установлен — усечение до 6 символов (грубый стемминг)
+    _stemmer = None
+
+CHUNKS_FILE = "chunks.jsonl"
+BM25_K1     = 1.2
+BM25_B      = 0.75
+RRF_K       = 60
+
+_TOKEN_RE = re.compile(r"[^\w\s]")
+_lock = threading.Lock()
+_indexes: dict = {}   # (path, mtime) → BM25Index
+
+
+@lru_cache(maxsize=200_000)
+def _stem(token: str) -> str:
+    return _stemmer.stem(token) if _stemmer is not None else token[:6]
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase, без пунктуации, Snowball-стемминг (токены короче 2 символов — мимо)."""
+    return [_stem(t) for t in _TOKEN_RE.sub(" ", text.lower()).split() if len(t) > 1]
+
+
+class BM25Index(PayloadMasks):
+    """Okapi BM25 над чанками; search() возвращает хиты в формате Qdrant."""
+
+    def __init__(self, chunks: list):
+        from load_qdrant import build_payload
+
+        ids      = [ch["id"] for ch in chunks]
+        payloads = [build_payload(ch) for ch in chunks]
+        self._init_masks(ids, payloads)
+
+        postings: dict = {}   # term → {doc: tf}
+        lengths = np.zeros(len(chunks), dtype=np.float32)
+        for doc, ch in enumerate(chunks):
+            tokens = tokenize(ch.get("text", ""))
+            lengths[doc] = len(tokens)
+            for t in tokens:
+                tf = postings.setdefault(t, {})
+                tf[doc] = tf.get(doc, 0) + 1
+
+        n = len(chunks)
+        avgdl = float(lengths.mean()) if n else 0.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avgdl) if avgdl else lengths
+        self._postings: dict = {}   # term → (idf, docs, веса tf-части)
+        for term, tf_map in postings.items():
+            docs = np.fromiter(tf_map.keys(), dtype=np.int64, count=len(tf_map))
+            tf   = np.fromiter(tf_map.values(), dtype=np.float32, count=len(tf_map))
+            idf  = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            self._postings[term] = (idf, docs, tf * (BM25_K1 + 1) / (tf + norm[docs]))
+
+    def search(self, query: str, payload_filter: dict | None, top_k: int) -> list:
+        if not len(self.ids):
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            entry = self._postings.get(term)
+            if entry is not None:
+                idf, docs, weights = entry
+                scores[docs] += idf * weights
+        mask = self.filter_mask(payload_filter)
+        if mask is not None:
+            scores[~mask] = 0.0
+        hit_rows = np.flatnonzero(scores > 0)
+        if not len(hit_rows):
+            return []
+        top_k = min(top_k, len(hit_rows))
+        top = hit_rows[np.argpartition(-scores[hit_rows], top_k - 1)[:top_k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            {"id": self.ids[i], "score": float(scores[i]), "payload": self.payloads[i]}
+            for i in top
+        ]
+
+
+def get_index(path: str = CHUNKS_FILE) -> BM25Index | None:
+    """BM25 по chunks.jsonl (перестраивается при изменении файла); None — файла нет."""
+    p = Path(path)
+    if not p.exists():
+        return None
+    key = (str(p), p.stat().st_mtime_ns)
+    with _lock:
+        idx = _indexes.get(key)
+        if idx is None:
+            t0 = time.perf_counter()
+            with open(p, encoding="utf-8") as f:
+                chunks = [json.loads(line) for line in f if line.strip()]
+            idx = BM25Index(chunks)
+            _indexes.clear()
+            _indexes[key] = idx
+            stem = "Snowball" if _stemmer is not None else "усечение (nltk не установлен)"
+            print(f"  ✅ BM25: {len(idx)} чанков, {len(idx._postings)} термов, "
+                  f"стемминг: {stem} ({time.perf_counter() - t0:.2f}с)")
+        return idx
+
+
+def rrf_fuse(dense_lists: list, lexical_lists: list, k: int = RRF_K) -> list:
+    """
+    Reciprocal rank fusion: каждый список хитов отсортирован по убыванию.
+    Возвращает хиты по убыванию h["rrf"]. Поле "score" — лучший плотный
+    cosine точки (0.0, если её нашёл только BM25), "bm25" — лучший BM25.
+    """
+    fused: dict = {}
+    for hits in dense_lists:
+        for rank, h in enumerate(hits, 1):
+            entry = fused.get(h.get("id"))
+            if entry is None:
+                entry = fused[h.get("id")] = {**h, "rrf": 0.0}
+            elif h.get("score", 0) > entry.get("score", 0):
+                entry.update(h)
+            entry["rrf"] += 1.0 / (k + rank)
+    for hits in lexical_lists:
+        for rank, h in enumerate(hits, 1):
+            entry = fused.get(h.get("id"))
+            if entry is None:
+                entry = fused[h.get("id")] = {**h, "score": 0.0, "rrf": 0.0}
+            entry["bm25"] = max(entry.get("bm25", 0.0), h.get("score", 0.0))
+            entry["rrf"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda h: h["rrf"], reverse=True)
@@ -0,0 +1,159 @@
+"""
+llm_budget.py — адаптивные num_ctx и num_predict для вызовов llm_client.
+
+rpd_generate.llm всегда запрашивал num_ctx=8192, test_generate — 4096,
+а num_predict был фиксированной догадкой на месте вызова. Лишний контекст —
+лишняя KV-память и медленнее prompt eval; промпт длиннее num_ctx Ollama
+молча обрезает с начала.
+
+Здесь перед каждым вызовом:
+  - токены промпта оцениваются как len(prompt) / chars_per_token. Токенизатор
+    qwen в окружении не нужен: отношение калибруется по prompt_eval_count
+    ответов Ollama и берётся минимальное (т.е. оценка сверху); до первой
+    калибровки — консервативные CHARS_PER_TOKEN;
+  - num_predict — квантиль PREDICT_QUANTILE наблюдённых eval_count этого
+    места вызова (секция + исходный num_predict) с запасом PREDICT_MARGIN,
+    не больше исходного значения; до MIN_OBSERVATIONS наблюдений — исходное;
+  - num_ctx — наименьшая корзина CTX_BUCKETS, вмещающая промпт + num_predict,
+    не больше max_ctx. Смена num_ctx перезагружает модель в Ollama, поэтому
+    в пределах прогона корзина только растёт (не более len(CTX_BUCKETS)
+    перезагрузок), а уменьшается между прогонами.
+
+Наблюдения хранятся в BUDGET_FILE между прогонами: rpd_generate вызывает
+каждую секцию один раз, и гистограмма копится от прогона к прогону.
+config.json["llm_budget"]: enabled, max_ctx.
+"""
+
+import json
+import math
+import os
+import threading
+from pathlib import Path
+
+BUDGET_FILE       = "llm_budget.json"
+CTX_BUCKETS       = (2048, 4096, 8192, 16384, 32768)
+CHARS_PER_TOKEN   = 2.5     # русский текст, токенизатор qwen2.5 — с запасом
+CTX_MARGIN        = 128     # служебные токены шаблона модели
+HISTORY           = 50
+MIN_OBSERVATIONS  = 3
+PREDICT_QUANTILE  = 0.95
+PREDICT_MARGIN    = 1.25
+MIN_PREDICT       = 128
+
+DEFAULTS = {"enabled": True, "max_ctx": 16384}
+
+_lock    = threading.Lock()
+_policy  = dict(DEFAULTS)
+_state   = {"chars_per_token": {}, "outputs": {}}   # модель → ratio, ключ места вызова → [eval_count]
+_loaded  = False
+_ctx_floor: dict = {}   # модель → num_ctx, уже запрошенный в этом прогоне
+_stats   = {"calls": 0, "predict_requested": 0, "predict_sent": 0}
+
+
+def configure(cfg: dict | None) -> dict:
+    """Применяет config.json["llm_budget"]; неизвестные ключи игнорируются."""
+    with _lock:
+        _policy.clear()
+        _policy.update(DEFAULTS)
+        _policy.update({k: v for k, v in (cfg or {}).items() if k in DEFAULTS})
+        return dict(_policy)
+
+
+def _load() -> None:
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    if Path(BUDGET_FILE).exists():
+        try:
+            data = json.loads(Path(BUDGET_FILE).read_text(encoding="utf-8"))
+            _state["chars_per_token"].update(data.get("chars_per_token", {}))
+            _state["outputs"].update(data.get("outputs", {}))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"  ⚠️  {BUDGET_FILE} не прочитан: {e}")
+
+
+def _key(section: str, options: dict) -> str:
+    return f"{section or '-'}:{options.get('num_predict')}"
+
+
+def estimate_tokens(model: str, text: str) -> int:
+    with _lock:
+        _load()
+        ratio = _state["chars_per_token"].get(model, CHARS_PER_TOKEN)
+    return math.ceil(len(text) / ratio)
+
+
+def adapt(model: str, section: str, prompt: str, options: dict) -> dict:
+    """options с подобранными num_predict и num_ctx (исходный dict не меняется)."""
+    if not _policy["enabled"]:
+        return options
+    requested = int(options.get("num_predict", 0)) or None
+    predict = requested
+    with _lock:
+        _load()
+        observed = sorted(_state["outputs"].get(_key(section, options), []))
+    if requested and len(observed) >= MIN_OBSERVATIONS:
+        q = observed[min(len(observed) - 1, int(PREDICT_QUANTILE * len(observed)))]
+        predict = min(requested, max(MIN_PREDICT, math.ceil(q * PREDICT_MARGIN)))
+
+    needed = estimate_tokens(model, prompt) + (predict or 0) + CTX_MARGIN
+    max_ctx = int(_policy["max_ctx"])
+    ctx = next((b for b in CTX_BUCKETS if b >= needed and b <= max_ctx), max_ctx)
+    with _lock:
+        ctx = max(ctx, _ctx_floor.get(model, 0))
+        if ctx > _ctx_floor.get(model, 0):
+            if _ctx_floor.get(model):
+                print(f"  📏 num_ctx {_ctx_floor[model]} → {ctx} (промпт ≈{needed - (predict or 0)} ток.)")
+            _ctx_floor[model] = ctx
+        _stats["calls"] += 1
+        _stats["predict_requested"] += requested or 0
+        _stats["predict_sent"] += predict or 0
+    return {**options, "num_predict": predict, "num_ctx": ctx}
+
+
+def observe(model: str, section: str, prompt: str, options: dict, meta: dict) -> None:
+    """
+    Учитывает ответ: options — исходные (ключ места вызова), meta — из
+    llm_client. Досрочно остановленный поток — полный ответ (eval_count по
+    фрагментам), обрезанный по num_predict записывается как num_predict.
+    """
+    if meta.get("cached") or not _policy["enabled"]:
+        return
+    with _lock:
+        _load()
+        if meta.get("eval_count"):
+            hist = _state["outputs"].setdefault(_key(section, options), [])
+            hist.append(int(meta["eval_count"]))
+            del hist[:-HISTORY]
+        if meta.get("prompt_eval_count", 0) > 0:
+            # с переиспользованным префиксом prompt_eval_count меньше длины
+            # промпта — отношение завышено, min() такие наблюдения отбрасывает
+            ratio = len(prompt) / meta["prompt_eval_count"]
+            cur = _state["chars_per_token"].get(model)
+            _state["chars_per_token"][model] = round(ratio if cur is None else min(cur, ratio), 3)
+
+
+def save() -> None:
+    with _lock:
+        if not _loaded:
+            return
+        tmp = BUDGET_FILE + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(_state, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, BUDGET_FILE)
+        except OSError as e:
+            print(f"  ⚠️  {BUDGET_FILE} не сохранён: {e}")
+
+
+def print_stats() -> None:
+    with _lock:
+        st = dict(_stats)
+        ctx = dict(_ctx_floor)
+    if not st["calls"]:
+        return
+    saved = st["predict_requested"] - st["predict_sent"]
+    print(f"📏 num_ctx: {', '.join(f'{m}={c}' for m, c in ctx.items())}; "
+          f"num_predict: {st['predict_sent']} из {st['predict_requested']} "
+          f"({saved} токенов бюджета сэкономлено за {st['calls']} вызовов)")
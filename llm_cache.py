@@ -0,0 +1,179 @@
+"""
+llm_cache.py — персистентный кэш ответов LLM (rpd_generate.llm, test_generate.llm).
+
+rpd_cache.json/test_cache.json хранят только retrieval, поэтому повторный
+запуск после правки шаблона или заполнения таблиц заново генерировал все
+секции — самый дорогой шаг пайплайна. Здесь ответ Ollama кэшируется по
+ключу sha256(модель, options, полный промпт): тот же промпт с теми же
+параметрами генерации не отправляется в модель повторно.
+
+Формат — JSONL (LLM_CACHE_FILE), по строке на ответ:
+  {"k": ключ, "text": ответ, "section": метка, "created": ts, "used": ts}
+Новые ответы дописываются с flush сразу после генерации — оборванный
+прогон сохраняет всё, что успел сгенерировать. save() в конце прогона
+переписывает файл с вытеснением: записи старше max_age_days и сверх
+max_entries (по давности последнего использования, LRU) удаляются.
+
+Ответ, который caller не смог разобрать, нужно убрать discard_last():
+иначе retry с тем же промптом получит из кэша тот же невалидный ответ.
+Каждый вызов LLM начинается с reset_last() — discard_last() действует
+только на ответ последнего вызова.
+
+config.json["llm_cache"]: enabled, max_entries, max_age_days и
+skip_sections — метки секций, которые всегда генерируются заново.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+LLM_CACHE_FILE = "llm_cache.jsonl"
+
+DEFAULTS = {
+    "enabled":       True,
+    "max_entries":   5000,
+    "max_age_days":  90,
+    "skip_sections": [],
+}
+
+_lock     = threading.Lock()
+_local    = threading.local()   # last_key — последний ответ текущего потока
+_policy   = dict(DEFAULTS)
+_entries: dict = {}             # ключ → запись
+_loaded   = False
+_fh       = None
+_stats    = {"hits": 0, "misses": 0, "discarded": 0}
+
+
+def configure(cfg: dict | None) -> dict:
+    """Применяет config.json["llm_cache"]; неизвестные ключи игнорируются."""
+    with _lock:
+        _policy.clear()
+        _policy.update(DEFAULTS)
+        _policy.update({k: v for k, v in (cfg or {}).items() if k in DEFAULTS})
+        return dict(_policy)
+
+
+def allowed(section: str = "") -> bool:
+    return bool(_policy["enabled"]) and section not in _policy["skip_sections"]
+
+
+def make_key(model: str, options: dict, prompt: str) -> str:
+    blob = json.dumps({"model": model, "options": options, "prompt": prompt},
+                      ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _load() -> None:
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    if not Path(LLM_CACHE_FILE).exists():
+        return
+    with open(LLM_CACHE_FILE, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue   # оборванная последняя запись
+            if entry.get("k") is None:
+                _entries.pop(entry.get("discard"), None)
+            else:
+                _entries[entry["k"]] = entry
+    print(f"  ✅ Кэш LLM: {len(_entries)} ответов ({LLM_CACHE_FILE})")
+
+
+def _append(obj: dict) -> None:
+    global _fh
+    if _fh is None:
+        _fh = open(LLM_CACHE_FILE, "a", encoding="utf-8")
+    _fh.write(json.dumps(obj, ensure_ascii=False) + "\n")
+    _fh.flush()
+
+
+def get(key: str) -> str | None:
+    with _lock:
+        _load()
+        entry = _entries.get(key)
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+        entry["used"] = time.time()
+        _stats["hits"] += 1
+        _local.last_key = key
+        return entry["text"]
+
+
+def put(key: str, text: str, section: str = "") -> None:
+    now = time.time()
+    entry = {"k": key, "text": text, "section": section, "created": now, "used": now}
+    with _lock:
+        _load()
+        _entries[key] = entry
+        _local.last_key = key
+        _append(entry)
+
+
+def reset_last() -> None:
+    """
+    Начало нового вызова LLM: без этого discard_last() после вызова, не
+    дошедшего до get/put (ошибка, пустой ответ), удалил бы предыдущий ответ.
+    """
+    _local.last_key = None
+
+
+def discard_last() -> None:
+    """Удаляет последний ответ текущего потока (не прошёл разбор у caller-а)."""
+    key = getattr(_local, "last_key", None)
+    _local.last_key = None
+    if key is None:
+        return
+    with _lock:
+        if _entries.pop(key, None) is not None:
+            _stats["discarded"] += 1
+            _append({"k": None, "discard": key})
+
+
+def save() -> None:
+    """Переписывает файл с вытеснением по max_age_days и max_entries (LRU)."""
+    global _fh
+    with _lock:
+        if not _loaded:
+            return
+        if _fh is not None:
+            _fh.close()
+            _fh = None
+        cutoff = time.time() - float(_policy["max_age_days"]) * 86400
+        alive = sorted((e for e in _entries.values() if e.get("used", 0) >= cutoff),
+                       key=lambda e: e.get("used", 0), reverse=True)
+        alive = alive[:int(_policy["max_entries"])]
+        evicted = len(_entries) - len(alive)
+        _entries.clear()
+        _entries.update((e["k"], e) for e in alive)
+        tmp = LLM_CACHE_FILE + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for e in reversed(alive):
+                    f.write(json.dumps(e, ensure_ascii=False) + "\n")
+            os.replace(tmp, LLM_CACHE_FILE)
+        except OSError as e:
+            print(f"  ⚠️  Кэш LLM не сохранён: {e}")
+            return
+        if evicted:
+            print(f"  ♻️  Кэш LLM: вытеснено {evicted} ответов")
+
+
+def stats() -> dict:
+    with _lock:
+        return dict(_stats)
+
+
+def print_stats() -> None:
+    st = stats()
+    if st["hits"] or st["misses"]:
+        print(f"🗄️  Кэш LLM: {st['hits']} попаданий, {st['misses']} генераций"
+              + (f", {st['discarded']} отброшено" if st["discarded"] else ""))
@@ -0,0 +1,378 @@
+"""
+llm_client.py — общий вызов Ollama /api/generate для rpd_generate.llm и test_generate.llm.
+
+Обе функции llm() повторяли одну и ту же цепочку (кэш → охлаждение →
+запрос → учёт токенов → кэш) и отличались только параметрами генерации и
+постобработкой. Цепочка — здесь, llm() остаются обёртками со своими
+options, clean() и форматом ошибок.
+
+[STREAM] Запрос с "stream": false ждал, пока модель сгенерирует num_predict
+токенов или сама остановится, — а модель часто дописывает пояснения после
+JSON-массива, которые парсеры всё равно отбрасывают. В потоковом режиме
+ответ читается по токенам, и stop(text) проверяется по мере поступления:
+  - JsonStop — закрылось первое JSON-значение верхнего уровня и оно
+    разбирается json.loads (секции rpd_generate);
+  - BlockStop — получено нужное число завершённых строк по шаблону
+    (блоки «ЗАДАНИЕ: … ПРАВИЛЬНЫЙ: …» в test_generate).
+После срабатывания соединение закрывается — Ollama прекращает генерацию.
+Время до первого токена (TTFT) и число досрочных остановок — в stats().
+
+[PREFIX] Ollama переиспользует KV-кэш общего префикса соседних запросов к
+той же модели, поэтому промпты строятся «стабильное — в начале, переменное —
+в конце», а keep_alive держит модель загруженной между вызовами. Эффект
+виден по prompt_eval_duration (ответы, дочитанные до done) и по TTFT
+(досрочно остановленные — итоговых счётчиков у них нет). При попадании в
+кэш prompt_eval_count меньше длины промпта: telemetry() сравнивает его с
+оценкой llm_budget.estimate_tokens и пишет по секциям долю
+переиспользованного префикса (prefix_reuse). /api/chat и передача context
+между вызовами не используются — переиспользование только по префиксу.
+
+[ROUTE] Модель выбирается по метке секции (route(), config.json
+"llm_routing"): механические списки — малой модели, связный текст —
+основной. Caller, у которого ответ малой модели не прошёл валидацию,
+повторяет вызов на основной (ROUTING["escalate"]). Модель, которой нет
+на сервере (HTTP 404), до конца прогона из маршрутизации исключается, а
+вызов, на котором это выяснилось, повторяется на основной модели.
+
+[TELEM] Итоговый ответ Ollama содержит prompt_eval_count/_duration,
+eval_count/_duration и load_duration — они копятся по меткам секций
+(telemetry()) и пишутся в generation_log.json и coverage_report.json.
+У досрочно остановленного потока итоговых счётчиков нет: prompt eval
+оценивается как TTFT (включая загрузку модели), декодирование — как
+остаток времени вызова; такие вызовы считаются в "estimated".
+"""
+
+import json
+import re
+import threading
+import time
+
+import http_client
+import llm_budget
+import llm_cache
+import llm_governor
+
+# config.json: "llm_stream": false — старое поведение ("stream": false)
+STREAM = {"enabled": True}
+# config.json: "llm_keep_alive" — сколько Ollama держит модель (и KV-кэш) после вызова
+KEEP_ALIVE = {"value": "30m"}
+# config.json: "llm_routing" — {"sections": {метка: модель}, "escalate": true}
+ROUTING = {"sections": {}, "escalate": True}
+
+_lock = threading.Lock()
+_schema_rejected: set = set()   # generate_url, где Ollama отклонила JSON-схему
+_missing_models: set = set()    # модели, на которые Ollama ответила 404
+_route_default: dict = {}       # [ROUTE] модель из llm_routing → основная модель
+_stats = {"calls": 0, "streamed": 0, "stopped_early": 0, "ttft_s": 0.0,
+          "prompt_eval_calls": 0, "prompt_eval_count": 0, "prompt_eval_s": 0.0,
+          "escalations": 0, "by_model": {}}
+_sections: dict = {}   # [TELEM] метка секции → накопленные счётчики
+
+
+class JsonStop:
+    """Стоп-условие: первое JSON-значение верхнего уровня закрылось и разбирается."""
+
+    def __init__(self):
+        self._pos    = 0
+        self._start  = -1
+        self._depth  = 0
+        self._in_str = False
+        self._esc    = False
+
+    def __call__(self, text: str) -> bool:
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._start < 0:
+                if ch in "[{":
+                    self._start, self._depth = i, 1
+                continue
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        json.loads(text[self._start:i + 1])
+                        self._pos = i + 1
+                        return True
+                    except json.JSONDecodeError:
+                        self._start = -1   # не JSON (например «[...]» в пояснении) — ищем дальше
+        self._pos = len(text)
+        return False
+
+
+class BlockStop:
+    """Стоп-условие: n завершённых (с переводом строки) строк по шаблону pattern."""
+
+    def __init__(self, pattern: str, n: int):
+        self._re    = re.compile(pattern, re.M | re.I)
+        self._n     = n
+        self._pos   = 0
+        self._count = 0
+
+    def __call__(self, text: str) -> bool:
+        end = text.rfind("\n")
+        if end < self._pos:
+            return False
+        self._count += len(self._re.findall(text, self._pos, end + 1))
+        self._pos = end + 1
+        return self._count >= self._n
+
+
+def schema_supported(url: str) -> bool:
+    return url not in _schema_rejected
+
+
+def route(section: str, default: str) -> str:
+    """Модель для секции по ROUTING["sections"]; default — если не задана или недоступна."""
+    model = ROUTING["sections"].get(section, default)
+    if model in _missing_models:
+        return default
+    if model != default:
+        with _lock:
+            _route_default[model] = default
+    return model
+
+
+def escalation_model(section: str, used: str, default: str) -> str | None:
+    """
+    Основная модель, если ответ малой (used) не прошёл валидацию и эскалация
+    включена; иначе None. Печатает и учитывает эскалацию.
+    """
+    if used == default or not ROUTING["escalate"]:
+        return None
+    print(f"  ⬆️  [{section}] ответ {used} не прошёл валидацию — повтор на {default}")
+    with _lock:
+        _stats["escalations"] += 1
+        _section_stats(section)["escalations"] += 1
+    return default
+
+
+def generate(url: str, model: str, prompt: str, options: dict, *,
+             section: str = "", schema: dict | None = None, stop=None,
+             timeout: float = 300) -> tuple[str, dict]:
+    """
+    Один вызов LLM: (ответ, meta). Сетевые/HTTP-ошибки — исключением caller-у.
+
+    section — метка для llm_cache (skip_sections), schema — JSON-схема для
+    "format" (Ollama ≥0.5; при HTTP 400 схемы для url отключаются до конца
+    прогона), stop — JsonStop/BlockStop для досрочной остановки потока.
+    meta: cached, streamed, ttft_s, stopped_early, eval_count,
+    prompt_eval_count/prompt_eval_s (если ответ дочитан до done).
+    """
+    if schema is not None and not schema_supported(url):
+        schema = None
+    llm_cache.reset_last()   # [LLMC] discard_last() — только про этот вызов
+    cache_key = None
+    if llm_cache.allowed(section):
+        cache_key = llm_cache.make_key(model, {**options, "format": schema} if schema else options,
+                                       prompt)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            _record_section(section, model, {"cached": True}, 0.0)
+            return cached, {"cached": True}
+
+    stream = STREAM["enabled"]
+    # [BUDGET] num_ctx/num_predict по длине промпта и истории ответов; ключ
+    # кэша — по исходным options, чтобы подстройка не сбрасывала кэш
+    sent = llm_budget.adapt(model, section, prompt, options)
+    payload = {"model": model, "prompt": prompt, "stream": stream, "options": sent,
+               "keep_alive": KEEP_ALIVE["value"]}
+    if schema is not None:
+        payload["format"] = schema
+
+    llm_governor.wait()
+    t0 = time.perf_counter()
+    # [HTTP] 3 попытки; без потока пустой response тоже повторяется
+    r = http_client.post(url, endpoint="ollama.generate", json=payload, timeout=timeout,
+                         retry=3, backoff=5.0, stream=stream,
+                         accept=None if stream else http_client.has_json_field("response"))
+    if r.status_code == 404:
+        with _lock:
+            _missing_models.add(model)   # [ROUTE] route() больше её не выберет
+            fallback = _route_default.get(model)
+        if fallback:
+            r.close()
+            print(f"  ⚠️  Модели {model} нет в Ollama (ollama pull {model}) — "
+                  f"[{section or '-'}] на {fallback}")
+            return generate(url, fallback, prompt, options, section=section, schema=schema,
+                            stop=stop, timeout=timeout)
+    if schema is not None and r.status_code == 400:
+        msg = r.text[:120]   # тело ошибки — до close(), иначе потоковый ответ уже не прочитать
+        r.close()
+        print(f"  ⚠️  Ollama отклонила JSON-схему ({msg}) — генерация без format")
+        with _lock:
+            _schema_rejected.add(url)
+        return generate(url, model, prompt, options, section=section, stop=stop, timeout=timeout)
+    r.raise_for_status()
+
+    if stream:
+        text, meta = _read_stream(r, t0, stop)
+    else:
+        data = r.json()
+        text, meta = data.get("response", ""), _timing(data)
+    wall = time.perf_counter() - t0
+    if "prompt_eval_count" in meta:
+        meta["prompt_est"] = llm_budget.estimate_tokens(model, prompt)   # [PREFIX]
+    llm_governor.record(meta.get("eval_count"), wall)
+    _record_section(section, model, meta, wall)
+    llm_budget.observe(model, section, prompt, options, meta)
+
+    with _lock:
+        _stats["calls"] += 1
+        _stats["by_model"][model] = _stats["by_model"].get(model, 0) + 1
+        if meta.get("streamed"):
+            _stats["streamed"] += 1
+            _stats["stopped_early"] += int(meta["stopped_early"])
+            _stats["ttft_s"] += meta["ttft_s"] or 0.0
+        if meta.get("prompt_eval_s") is not None:
+            _stats["prompt_eval_calls"] += 1
+            _stats["prompt_eval_count"] += meta.get("prompt_eval_count") or 0
+            _stats["prompt_eval_s"]     += meta["prompt_eval_s"]
+
+    if text and cache_key is not None:
+        llm_cache.put(cache_key, text, section)
+    return text, meta
+
+
+def _read_stream(r, t0: float, stop) -> tuple[str, dict]:
+    """Читает NDJSON-поток /api/generate до done или до срабатывания stop."""
+    text    = ""
+    ttft    = None
+    chunks  = 0
+    stopped = False
+    final: dict = {}
+    try:
+        for line in r.iter_lines():
+            if not line:
+                continue
+            d = json.loads(line)
+            if d.get("error"):
+                raise RuntimeError(d["error"])
+            piece = d.get("response", "")
+            if piece:
+                if ttft is None:
+                    ttft = time.perf_counter() - t0
+                text   += piece
+                chunks += 1
+                if stop is not None and stop(text):
+                    stopped = True
+                    break
+            if d.get("done"):
+                final = d
+                break
+    finally:
+        r.close()   # при досрочной остановке обрывает генерацию на сервере
+    meta = _timing(final)
+    # поток обрезан — итоговых счётчиков Ollama нет, фрагмент ≈ токен
+    meta.setdefault("eval_count", chunks)
+    meta.update(streamed=True, ttft_s=ttft, stopped_early=stopped)
+    return text, meta
+
+
+def _timing(d: dict) -> dict:
+    """Счётчики итогового ответа Ollama; длительности — из наносекунд в секунды."""
+    meta = {}
+    if "eval_count" in d:
+        meta["eval_count"] = d["eval_count"]
+    if "prompt_eval_duration" in d:
+        meta["prompt_eval_count"] = d.get("prompt_eval_count", 0)
+        meta["prompt_eval_s"]     = d["prompt_eval_duration"] / 1e9
+    if "eval_duration" in d:
+        meta["eval_s"] = d["eval_duration"] / 1e9
+    if "load_duration" in d:
+        meta["load_s"] = d["load_duration"] / 1e9
+    return meta
+
+
+def _section_stats(section: str) -> dict:
+    """Счётчики секции (вызывать под _lock)."""
+    return _sections.setdefault(section or "-", {
+        "calls": 0, "cached": 0, "estimated": 0, "escalations": 0, "models": {},
+        "prompt_tokens": 0, "prompt_est_tokens": 0, "prompt_eval_s": 0.0,
+        "eval_tokens": 0, "eval_s": 0.0,
+        "load_s": 0.0, "wall_s": 0.0,
+    })
+
+
+def _record_section(section: str, model: str, meta: dict, wall: float) -> None:
+    """[TELEM] Добавляет вызов к счётчикам секции."""
+    with _lock:
+        st = _section_stats(section)
+        if meta.get("cached"):
+            st["cached"] += 1
+            return
+        st["calls"] += 1
+        st["models"][model] = st["models"].get(model, 0) + 1
+        st["wall_s"]      += wall
+        st["eval_tokens"] += meta.get("eval_count") or 0
+        if "eval_s" in meta:
+            st["prompt_tokens"] += meta.get("prompt_eval_count", 0)
+            st["prompt_est_tokens"] += meta.get("prompt_est", 0)
+            st["prompt_eval_s"] += meta.get("prompt_eval_s", 0.0)
+            st["eval_s"]        += meta["eval_s"]
+            st["load_s"]        += meta.get("load_s", 0.0)
+        else:
+            ttft = meta.get("ttft_s") or 0.0
+            st["estimated"]     += 1
+            st["prompt_eval_s"] += ttft
+            st["eval_s"]        += max(0.0, wall - ttft)
+
+
+def telemetry() -> dict:
+    """[TELEM] Счётчики по секциям с производной tokens_per_s (декодирование)."""
+    with _lock:
+        out = {}
+        for section, st in _sections.items():
+            row = {k: round(v, 3) if isinstance(v, float) else v for k, v in st.items()}
+            row["models"] = dict(st["models"])
+            row["tokens_per_s"] = round(st["eval_tokens"] / st["eval_s"], 2) if st["eval_s"] else None
+            # [PREFIX] доля промпта, взятая из KV-кэша (оценка сверху: длина
+            # промпта — по llm_budget, с запасом)
+            row["prefix_reuse"] = (round(max(0.0, 1 - st["prompt_tokens"] / st["prompt_est_tokens"]), 3)
+                                   if st["prompt_est_tokens"] else None)
+            out[section] = row
+        return out
+
+
+def print_telemetry() -> None:
+    rows = telemetry()
+    if not any(r["calls"] for r in rows.values()):
+        return
+    print("\n⏱️  LLM по секциям:")
+    print(f"  {'секция':<20} {'вызовов':>8} {'кэш':>5} {'токенов':>8} {'ток/с':>7} "
+          f"{'prompt ток.':>11} {'префикс':>8} {'prompt, с':>10} {'decode, с':>10} {'load, с':>8}")
+    for section, r in sorted(rows.items(), key=lambda x: -x[1]["wall_s"]):
+        tps = f"{r['tokens_per_s']:.1f}" if r["tokens_per_s"] else "—"
+        reuse = f"{r['prefix_reuse']:.0%}" if r["prefix_reuse"] is not None else "—"
+        print(f"  {section:<20} {r['calls']:>8} {r['cached']:>5} {r['eval_tokens']:>8} {tps:>7} "
+              f"{r['prompt_tokens']:>11} {reuse:>8} "
+              f"{r['prompt_eval_s']:>10.1f} {r['eval_s']:>10.1f} {r['load_s']:>8.1f}")
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_stats, "by_model": dict(_stats["by_model"])}
+
+
+def print_stats() -> None:
+    st = stats()
+    if st["streamed"]:
+        print(f"⚡ LLM-поток: {st['streamed']} вызовов, TTFT сред. "
+              f"{st['ttft_s'] / st['streamed']:.2f} с, досрочно остановлено {st['stopped_early']}")
+    if st["prompt_eval_calls"]:
+        n = st["prompt_eval_calls"]
+        print(f"⚡ Prompt eval ({n} ответов с итоговыми счётчиками): "
+              f"сред. {st['prompt_eval_count'] / n:.0f} ток., {st['prompt_eval_s'] / n:.2f} с")
+    if len(st["by_model"]) > 1 or st["escalations"]:
+        print(f"🔀 Модели: {', '.join(f'{m} — {c}' for m, c in st['by_model'].items())}; "
+              f"эскалаций: {st['escalations']}")
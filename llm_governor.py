@@ -0,0 +1,150 @@
+"""
+llm_governor.py — политика охлаждения GPU для LLM-вызовов Ollama.
+
+Раньше rpd_generate.llm и test_generate.llm спали 3 с после каждого
+успешного ответа, а test_generate.main — ещё 5 с между разделами: на
+прогоне из ~30 вызовов это минуты чистого простоя, независимо от того,
+нужно ли охлаждение на конкретной машине.
+
+Здесь охлаждение — политика из config.json ("llm_throttle"), по умолчанию
+выключенная:
+  - tokens_per_sec / burst_tokens — token bucket на сгенерированные токены
+    (eval_count из ответа Ollama): при исчерпании запаса следующий вызов
+    ждёт, пока bucket наполнится;
+  - max_duty_cycle — доля времени, которую GPU занят генерацией (0 < d ≤ 1):
+    после вызова длительностью busy следующий начнётся не раньше чем через
+    busy·(1 − d)/d; естественные паузы между вызовами (парсинг, retrieval)
+    засчитываются;
+  - section_pause_s — явная пауза между разделами test_generate.
+
+Пауза берётся перед следующим вызовом (wait()), а не после текущего, так
+что последний вызов скрипта не ждёт впустую. При параллельных вызовах
+(llm_parallel) wait() резервирует слот под lock: следующий поток встаёт в
+очередь на интервал последнего вызова (генерация + пауза) позже, а record()
+поправляет резерв на фактическую длительность. Фактический простой по
+политике копится в stats() / print_stats().
+"""
+
+import threading
+import time
+
+DEFAULTS = {
+    "tokens_per_sec":  0,      # 0 — без ограничения
+    "burst_tokens":    2000,
+    "max_duty_cycle":  1.0,    # 1.0 — без ограничения
+    "section_pause_s": 0,
+}
+
+_lock    = threading.Lock()
+_policy  = dict(DEFAULTS)
+_bucket  = float(DEFAULTS["burst_tokens"])
+_refill_at    = time.monotonic()
+_next_allowed = 0.0
+_interval     = 0.0    # генерация + пауза последнего вызова — шаг резерва слотов
+_local   = threading.local()   # слот, зарезервированный wait() этого потока
+_stats   = {"calls": 0, "tokens": 0, "busy_s": 0.0, "idle_s": 0.0}
+
+
+def configure(cfg: dict | None) -> dict:
+    """Применяет config.json["llm_throttle"]; неизвестные ключи игнорируются."""
+    global _bucket, _refill_at, _next_allowed, _interval
+    with _lock:
+        _policy.clear()
+        _policy.update(DEFAULTS)
+        _policy.update({k: v for k, v in (cfg or {}).items() if k in DEFAULTS})
+        _bucket       = float(_policy["burst_tokens"])
+        _refill_at    = time.monotonic()
+        _next_allowed = 0.0
+        _interval     = 0.0
+        return dict(_policy)
+
+
+def enabled() -> bool:
+    return (float(_policy["tokens_per_sec"]) > 0
+            or 0 < float(_policy["max_duty_cycle"]) < 1)
+
+
+def _sleep(seconds: float) -> None:
+    if seconds > 0:
+        time.sleep(seconds)
+        with _lock:
+            _stats["idle_s"] += seconds
+
+
+def wait() -> None:
+    """
+    Вызывается перед LLM-запросом: резервирует слот и ждёт его начала.
+    Резерв под lock — иначе параллельные потоки прочитают один и тот же
+    _next_allowed и пройдут барьер одновременно.
+    """
+    global _next_allowed
+    if not enabled():
+        return
+    with _lock:
+        now   = time.monotonic()
+        start = max(now, _next_allowed)
+        _next_allowed = start + _interval
+        _local.slot = (start, _interval)
+    _sleep(start - now)
+
+
+def record(tokens: int | None, busy_s: float) -> None:
+    """
+    Вызывается после LLM-запроса: tokens — eval_count ответа Ollama
+    (None — неизвестно, bucket не расходуется), busy_s — время вызова.
+    """
+    global _bucket, _refill_at, _next_allowed, _interval
+    with _lock:
+        _stats["calls"]  += 1
+        _stats["tokens"] += int(tokens or 0)
+        _stats["busy_s"] += busy_s
+        now = time.monotonic()
+        delay = 0.0
+
+        rate = float(_policy["tokens_per_sec"])
+        if rate > 0:
+            burst = float(_policy["burst_tokens"])
+            _bucket = min(burst, _bucket + (now - _refill_at) * rate) - int(tokens or 0)
+            _refill_at = now
+            if _bucket < 0:
+                delay = -_bucket / rate
+
+        duty = float(_policy["max_duty_cycle"])
+        if 0 < duty < 1:
+            delay = max(delay, busy_s * (1 - duty) / duty)
+
+        # Резерв wait() был оценкой по прошлому вызову: сдвигаем очередь на
+        # ошибку оценки (при одном потоке — ровно now + delay)
+        slot = getattr(_local, "slot", None)
+        _local.slot = None
+        if slot is None:
+            _next_allowed = max(_next_allowed, now + delay)
+        else:
+            start, estimate = slot
+            error = (now + delay) - (start + estimate)
+            _next_allowed = max(now + delay, _next_allowed + error)
+        _interval = busy_s + delay
+
+
+def section_pause() -> None:
+    """Пауза между разделами (section_pause_s), 0 — без паузы."""
+    seconds = float(_policy["section_pause_s"])
+    if seconds > 0:
+        print(f"  ⏸️  Пауза {seconds:g} с между разделами (llm_throttle)")
+        _sleep(seconds)
+
+
+def stats() -> dict:
+    with _lock:
+        return {**{k: round(v, 2) if isinstance(v, float) else v for k, v in _stats.items()},
+                "policy": dict(_policy)}
+
+
+def print_stats() -> None:
+    st = stats()
+    if not st["calls"]:
+        return
+    rate = st["tokens"] / st["busy_s"] if st["busy_s"] else 0.0
+    print(f"\n🌡️  LLM: {st['calls']} вызовов, {st['tokens']} токенов, "
+          f"генерация {st['busy_s']:.1f} с ({rate:.1f} ток/с), "
+          f"простой по llm_throttle {st['idle_s']:.1f} с")
@@ -35,20 +35,25 @@ load_qdrant.py — загрузка чанков в Qdrant через чисты
 """
 
 import argparse
+import hashlib
 import json
+import queue
+import threading
 import time
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
 # [FIX-#18]
 # [FIX-§5]
-from utils import get_embedding as _embed_raw_utils, EMBED_MODEL
+import http_client
+from index_manifest import IndexManifest, file_fingerprint
+from utils import get_embedding as _embed_raw_utils, get_embeddings_cached as _embed_many_utils, EMBED_MODEL
 
 COLLECTION     = "rpd_rag"
 QDRANT_URL     = "http://localhost:6333"
 BATCH_EMBED    = 2       # [M] количество параллельных потоков embedding
+EMBED_REQUEST_BATCH = 32  # [BATCH] чанков в одном запросе /api/embed (на поток)
 # [FIX-#16]
 UPSERT_BATCH   = 128
 CHUNKS_FILE    = "chunks.jsonl"
+MANIFEST_FILE  = "chunks.manifest.jsonl"   # [RESUME] подтверждённые upsert-ы
 RETRY_COUNT    = 3
 RETRY_DELAY    = 2.0
 PROGRESS_EVERY = 50
@@ -78,6 +83,19 @@ def embed_text(text: str) -> list | None:
     return vec if vec else None
 
 
+def embed_texts(texts: list[str]) -> list:
+    """
+    [BATCH] Пакетный аналог embed_text(): один запрос на пачку текстов.
+    [STORE] Уже посчитанные векторы берутся из embed_store.
+    Порядок сохраняется; для неудачных текстов — None.
+    """
+    for text in texts:
+        if len(text) > MAX_EMBED_CHARS:
+            print(f"  ⚠️  Текст обрезан: {len(text)} → {MAX_EMBED_CHARS} символов")
+    vecs = _embed_many_utils(texts, prefix="passage", retry=RETRY_COUNT)
+    return [vec if vec else None for vec in vecs]
+
+
 # ---------------------------------------------------------------------------
 # Payload индексы
 # ---------------------------------------------------------------------------
@@ -102,8 +120,9 @@ def create_payload_indexes(collection: str) -> None:
     ]
     for field_name, schema_type in fields:
         try:
-            r = requests.put(
+            r = http_client.put(
                 f"{QDRANT_URL}/collections/{collection}/index",
+                endpoint="qdrant.index",
                 json={"field_name": field_name, "field_schema": schema_type},
                 timeout=15,
             )
@@ -124,32 +143,9 @@ def upsert_batch(ids: list, vectors: list, payloads: list) -> tuple[bool, list]:
     
     HTTP 206 Partial Content раньше считался полным успехом, но тело содержит
     failed points — они не перезагружались даже при retry.
+    [HTTP] Разбор 206/ошибок — в http_client.qdrant_upsert.
     """
-    body = {
-        "batch": {
-            "ids":      ids,
-            "vectors":  vectors,
-            "payloads": payloads,
-        }
-    }
-    r = requests.put(
-        f"{QDRANT_URL}/collections/{COLLECTION}/points",
-        json=body,
-        timeout=60,
-    )
-    if r.status_code == 206:
-        # Частичная ошибка — разбираем failed points
-        try:
-            failed = r.json().get("result", {}).get("failed", [])
-        except Exception:
-            failed = []
-        if failed:
-            print(f"  ⚠️  HTTP 206: {len(failed)} точек не загружено: {failed[:5]}")
-        return True, [f["id"] for f in failed] if failed else []
-    if r.status_code not in (200,):
-        print(f"  Ошибка upsert: {r.status_code} {r.text[:300]}")
-        return False, ids  # всё провалилось
-    return True, []
+    return http_client.qdrant_upsert(QDRANT_URL, COLLECTION, ids, vectors, payloads)
 
 
 def upsert_batch_with_retry(ids: list, vectors: list, payloads: list) -> bool:
@@ -190,83 +186,285 @@ def upsert_batch_with_retry(ids: list, vectors: list, payloads: list) -> bool:
 
 
 
+# ---------------------------------------------------------------------------
+# Payload
+# ---------------------------------------------------------------------------
+
+def build_payload(ch: dict) -> dict:
+    """Payload точки Qdrant для чанка из chunks.jsonl (с [SYNC] content_hash)."""
+    payload = _base_payload(ch)
+    payload["content_hash"] = content_hash(payload)
+    return payload
+
+
+def content_hash(payload: dict) -> str:
+    """
+    [SYNC] Хеш содержимого точки: текст, метаданные и модель эмбеддинга.
+    Изменение любого поля payload (или EMBED_MODEL) → точка перезагружается.
+    """
+    body = {k: v for k, v in payload.items() if k != "content_hash"}
+    return hashlib.sha256(
+        json.dumps(body, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def _base_payload(ch: dict) -> dict:
+    meta = ch.get("metadata", {})
+    return {
+        # [P] chunk_id дублируется как именованное поле
+        "chunk_id":      ch["id"],
+        "id":            ch["id"],
+        "doc_id":        ch.get("doc_id", ""),
+        "source":        ch.get("source", ""),
+        # [FIX-#8]
+        "source_file":   ch.get("source", ""),
+        "section_title": ch.get("section_title", ""),
+        "section_level": ch.get("section_level", ""),
+        "doc_position":  ch.get("doc_position", 0),  # [H] из chunking.py
+        "text":          ch["text"],
+        # [S] section_type на верхнем уровне для прямой фильтрации
+        "section_type":  meta.get("section_type", "other"),
+        "metadata":      meta,
+        # [B] Доменные поля для фильтрации по направлению/уровню
+        "direction":     ch.get("direction", ""),
+        "level":         ch.get("level", ""),
+        "department":    ch.get("department", ""),
+        "embedding_model": EMBED_MODEL,
+    }
+
+
+# ---------------------------------------------------------------------------
+# [PIPE] Потоковый конвейер embed → upsert
+# ---------------------------------------------------------------------------
+# Раньше main() эмбеддил весь chunks.jsonl в список results и только потом
+# грузил его в Qdrant: пиковая память — весь корпус, время — сумма двух стадий.
+# Теперь: читатель → очередь пачек → BATCH_EMBED потоков embedding → очередь
+# результатов → upsert в главном потоке, как только набран UPSERT_BATCH.
+# Число пачек «в полёте» ограничено семафором PIPELINE_WINDOW, поэтому в
+# памяти одновременно не больше нескольких батчей, а время ≈ max(embed, upsert).
+PIPELINE_WINDOW = BATCH_EMBED * 2 + 2   # пачек EMBED_REQUEST_BATCH в полёте
+
+
+def iter_chunks(path: str, only_ids: set | None = None, skip_ids: set | None = None):
+    """
+    Читает chunks.jsonl построчно.
+    only_ids — [SYNC] только эти id; skip_ids — [RESUME] уже загруженные.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            ch = json.loads(line)
+            if only_ids is not None and ch["id"] not in only_ids:
+                continue
+            if skip_ids and ch["id"] in skip_ids:
+                continue
+            yield ch
+
+
+def _batched(items, size: int):
+    batch: list = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_pipeline(chunks, total: int, on_uploaded=None) -> tuple[int, int, bool]:
+    """
+    [PIPE] Эмбеддинг и upsert с перекрытием для потока чанков chunks.
+    Возвращает (uploaded, skipped, ok); ok=False — прервано по [З-L3]
+    или из-за исключения в потоке эмбеддинга.
+    on_uploaded(ids) вызывается после каждого подтверждённого upsert ([RESUME]).
+
+    [Q] Порядок точек сохраняется: результаты потоков переупорядочиваются
+    по номеру пачки перед upsert (окно переупорядочивания ≤ PIPELINE_WINDOW).
+    """
+    task_q:   queue.Queue = queue.Queue()
+    result_q: queue.Queue = queue.Queue()
+    window = threading.Semaphore(PIPELINE_WINDOW)
+    abort  = threading.Event()
+
+    def reader() -> None:
+        try:
+            for seq, sub in enumerate(_batched(chunks, EMBED_REQUEST_BATCH)):
+                while not window.acquire(timeout=0.5):
+                    if abort.is_set():
+                        return
+                if abort.is_set():
+                    return
+                task_q.put((seq, sub))
+        finally:
+            for _ in range(BATCH_EMBED):
+                task_q.put(None)
+
+    def embed_worker() -> None:
+        # None в result_q — всегда, даже при исключении (например, OSError
+        # EmbedStore.put_many на полном диске): иначе главный цикл ждёт вечно
+        try:
+            while True:
+                item = task_q.get()
+                if item is None:
+                    return
+                seq, sub = item
+                vecs = [None] * len(sub) if abort.is_set() else embed_texts([ch["text"] for ch in sub])
+                result_q.put((seq, sub, vecs))
+        except Exception as e:
+            print(f"❌ Ошибка эмбеддинга: {e}")
+            abort.set()
+        finally:
+            result_q.put(None)
+
+    threads = [threading.Thread(target=reader, daemon=True)]
+    threads += [threading.Thread(target=embed_worker, daemon=True) for _ in range(BATCH_EMBED)]
+    for t in threads:
+        t.start()
+
+    uploaded = skipped = done = 0
+    pending: dict = {}
+    next_seq = 0
+    buf: list = []          # [(vector, chunk)] до UPSERT_BATCH
+    finished_workers = 0
+
+    def flush(batch: list) -> None:
+        nonlocal uploaded
+        ids     = [ch["id"] for _, ch in batch]
+        vectors = [vec for vec, _ in batch]
+        if upsert_batch_with_retry(ids, vectors, [build_payload(ch) for _, ch in batch]):  # [O]
+            if on_uploaded is not None:
+                on_uploaded(ids)
+            uploaded += len(batch)
+            print(f"  Загружено: {uploaded}/{total}")
+
+    while finished_workers < BATCH_EMBED:
+        item = result_q.get()
+        if item is None:
+            finished_workers += 1
+            continue
+        seq, sub, vecs = item
+        pending[seq] = (sub, vecs)
+        while next_seq in pending:
+            sub, vecs = pending.pop(next_seq)
+            next_seq += 1
+            window.release()
+            if abort.is_set():
+                continue   # дренируем очередь, чтобы потоки завершились
+            for chunk, vector in zip(sub, vecs):
+                done += 1
+                if vector is None:
+                    skipped += 1
+                    continue
+                # [З-L3]
+                if len(vector) != EMBED_DIM:
+                    print(
+                        f"❌ Размерность вектора {len(vector)} ≠ EMBED_DIM={EMBED_DIM}.\n"
+                        f"   Модель: {EMBED_MODEL}. Обновите EMBED_DIM в load_qdrant.py "
+                        f"или проверьте конфигурацию Ollama."
+                    )
+                    abort.set()
+                    break
+                buf.append((vector, chunk))
+                if done % PROGRESS_EVERY == 0 or done == total:
+                    print(f"  [{done}/{total}] {done/total*100:.0f}%  пропущено: {skipped}")
+            while len(buf) >= UPSERT_BATCH and not abort.is_set():
+                flush(buf[:UPSERT_BATCH])
+                buf = buf[UPSERT_BATCH:]
+
+    if buf and not abort.is_set():
+        flush(buf)
+    for t in threads:
+        t.join()
+    return uploaded, skipped, not abort.is_set()
+
+
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 
-def main(append_mode: bool = False):
+# [SYNC] Точки book_loader.py живут в той же коллекции, но не в chunks.jsonl —
+# синхронизация их не видит и не удаляет.
+SYNC_SCOPE_FILTER = {"must_not": [{"key": "content_type", "match": {"value": "textbook"}}]}
+
+
+def plan_sync(chunks_path: str) -> tuple[set, list, int]:
+    """
+    [SYNC] Сравнивает chunks.jsonl с коллекцией по content_hash.
+    Возвращает (id чанков к загрузке, id точек к удалению, без изменений).
+    """
+    stored: dict = {
+        p["id"]: (p.get("payload") or {}).get("content_hash")
+        for p in http_client.qdrant_scroll(
+            QDRANT_URL, COLLECTION, ["content_hash"], payload_filter=SYNC_SCOPE_FILTER
+        )
+    }
+    to_upload: set = set()
+    seen: set = set()
+    for ch in iter_chunks(chunks_path):
+        seen.add(ch["id"])
+        if stored.get(ch["id"]) != build_payload(ch)["content_hash"]:
+            to_upload.add(ch["id"])
+    stale = [pid for pid in stored if pid not in seen]
+    return to_upload, stale, len(seen) - len(to_upload)
+
+
+def main(append_mode: bool = False, sync_mode: bool = False, resume: bool = False):
     with open(CHUNKS_FILE, encoding="utf-8") as f:
-        chunks = [json.loads(line) for line in f]
+        total = sum(1 for line in f if line.strip())
+
+    # [RESUME] Манифест прошлого запуска по тому же chunks.jsonl
+    manifest = IndexManifest(
+        MANIFEST_FILE, file_fingerprint(CHUNKS_FILE, COLLECTION, EMBED_MODEL)
+    )
+    resumed = resume and manifest.load()
+    if resume and not resumed:
+        print(f"ℹ️  {MANIFEST_FILE} не найден или от другого chunks.jsonl — загрузка с начала")
 
-    print(f"Чанков к загрузке: {len(chunks)}")
+    print(f"Чанков в {CHUNKS_FILE}: {total}")
     print(f"Модель: {EMBED_MODEL}, потоков: {BATCH_EMBED}")
-    if append_mode:
+    http_client.configure_pool(BATCH_EMBED)  # [HTTP]
+    if resumed:
+        print(f"Режим: RESUME (уже загружено по манифесту: {len(manifest.done)})")
+    elif sync_mode:
+        print("Режим: SYNC (загрузка новых/изменённых, удаление исчезнувших)")
+    elif append_mode:
         print("Режим: APPEND (коллекция не пересоздаётся)")
     else:
         print("Режим: RECREATE (коллекция будет пересоздана)")
 
-    # [З-L1]
-    EMBED_QUEUE_BATCH = 200
-    results: list = []
-    skipped = 0
-    done = 0
-
-    for batch_start in range(0, len(chunks), EMBED_QUEUE_BATCH):
-        batch_chunks = chunks[batch_start: batch_start + EMBED_QUEUE_BATCH]
-        with ThreadPoolExecutor(max_workers=BATCH_EMBED) as executor:
-            futures = {executor.submit(embed_text, ch["text"]): ch for ch in batch_chunks}
-            for future in as_completed(futures):
-                chunk  = futures[future]
-                vector = future.result()
-                done  += 1
-                if vector is None:
-                    skipped += 1
-                else:
-                    results.append((vector, chunk))
-                if done % PROGRESS_EVERY == 0 or done == len(chunks):
-                    print(f"  [{done}/{len(chunks)}] {done/len(chunks)*100:.0f}%  "
-                          f"пропущено: {skipped}")
-
-    # [Q] Сортировка результатов по chunk id — предсказуемый порядок
-    results.sort(key=lambda x: x[1]["id"])
-
-    print(f"\nEmbedding готов. Успешно: {len(results)}, пропущено: {skipped}")
-
-    if not results:
+    if not total and not sync_mode:
         print("Нет данных для загрузки.")
         return
 
-    # Проверка Qdrant
+    # [PIPE] Qdrant и коллекция проверяются до embedding — конвейер сразу
+    # грузит готовые батчи, а недоступный Qdrant не стоит часа эмбеддинга.
     print("\nПроверка Qdrant...")
     try:
-        requests.get(f"{QDRANT_URL}/collections", timeout=10).raise_for_status()
+        http_client.get(f"{QDRANT_URL}/collections", endpoint="qdrant.collections",
+                        timeout=10).raise_for_status()
         print("  Qdrant готов")
     except Exception as e:
         print(f"  Qdrant недоступен: {e}")
         return
 
-    vector_size = len(results[0][0])
-    # [З-L3]
-    if vector_size != EMBED_DIM:
-        print(
-            f"❌ Размерность вектора {vector_size} ≠ EMBED_DIM={EMBED_DIM}.\n"
-            f"   Модель: {EMBED_MODEL}. Обновите EMBED_DIM в load_qdrant.py "
-            f"или проверьте конфигурацию Ollama."
-        )
-        return
-
     # Создание / проверка коллекции
     collection_exists = (
-        requests.get(f"{QDRANT_URL}/collections/{COLLECTION}", timeout=10).status_code == 200
+        http_client.get(f"{QDRANT_URL}/collections/{COLLECTION}",
+                        endpoint="qdrant.collections", timeout=10).status_code == 200
     )
 
-    if not append_mode:
+    only_ids = None
+    if not append_mode and not sync_mode and not resumed:
         # [I] RECREATE — полная пересборка коллекции
         if collection_exists:
-            requests.delete(f"{QDRANT_URL}/collections/{COLLECTION}", timeout=10)
+            http_client.delete(f"{QDRANT_URL}/collections/{COLLECTION}",
+                               endpoint="qdrant.collections", timeout=10)
             print(f"Старая коллекция '{COLLECTION}' удалена.")
-        r = requests.put(
+        r = http_client.put(
             f"{QDRANT_URL}/collections/{COLLECTION}",
+            endpoint="qdrant.collections",
             json={"vectors": {"size": EMBED_DIM, "distance": "Cosine"}},
             timeout=10,
         )
@@ -274,55 +472,51 @@ def main(append_mode: bool = False):
         print(f"Коллекция '{COLLECTION}' создана (вектор: {EMBED_DIM}d).")
         create_payload_indexes(COLLECTION)
     else:
-        # [I] APPEND — коллекция должна существовать
+        # [I] APPEND / [SYNC] / [RESUME] — коллекция должна существовать
         if not collection_exists:
+            flag = "--sync" if sync_mode else "--resume" if resumed else "--append"
             print(f"  ❌ Коллекция '{COLLECTION}' не найдена. "
-                  f"Запустите без --append для первоначальной загрузки.")
+                  f"Запустите без {flag} для первоначальной загрузки.")
+            return
+        if append_mode and not resumed:
+            print(f"  Коллекция '{COLLECTION}' существует — добавляем новые точки.")
+
+    if sync_mode:
+        only_ids, stale, unchanged = plan_sync(CHUNKS_FILE)
+        print(f"  [SYNC] без изменений: {unchanged}, к загрузке: {len(only_ids)}, "
+              f"к удалению: {len(stale)}")
+        deleted = 0
+        for batch in _batched(stale, UPSERT_BATCH * 4):
+            if http_client.qdrant_delete(QDRANT_URL, COLLECTION, batch):
+                deleted += len(batch)
+        if stale:
+            print(f"  Удалено устаревших точек: {deleted}/{len(stale)}")
+        total = len(only_ids)
+        if not total:
+            print("\nГотово. Коллекция актуальна.")
+            http_client.print_http_stats()  # [HTTP]
             return
-        print(f"  Коллекция '{COLLECTION}' существует — добавляем новые точки.")
-
-    # Загрузка батчами с retry
-    uploaded = 0
-    i = 0
-
-    while i < len(results):
-        batch = results[i: i + UPSERT_BATCH]
-
-        ids     = [ch["id"] for _, ch in batch]
-        vectors = [vec for vec, _ in batch]
 
-        payloads = []
-        for vec, ch in batch:
-            meta = ch.get("metadata", {})
-            payloads.append({
-                # [P] chunk_id дублируется как именованное поле
-                "chunk_id":      ch["id"],
-                "id":            ch["id"],
-                "doc_id":        ch.get("doc_id", ""),
-                "source":        ch.get("source", ""),
-                # [FIX-#8]
-                "source_file":   ch.get("source", ""),
-                "section_title": ch.get("section_title", ""),
-                "section_level": ch.get("section_level", ""),
-                "doc_position":  ch.get("doc_position", 0),  # [H] из chunking.py
-                "text":          ch["text"],
-                # [S] section_type на верхнем уровне для прямой фильтрации
-                "section_type":  meta.get("section_type", "other"),
-                "metadata":      meta,
-                # [B] Доменные поля для фильтрации по направлению/уровню
-                "direction":     ch.get("direction", ""),
-                "level":         ch.get("level", ""),
-                "department":    ch.get("department", ""),
-                "embedding_model": EMBED_MODEL,
-            })
-
-        if upsert_batch_with_retry(ids, vectors, payloads):  # [O]
-            uploaded += len(batch)
-            print(f"  Загружено: {uploaded}/{len(results)}")
+    if resumed:
+        total = sum(1 for _ in iter_chunks(CHUNKS_FILE, only_ids, manifest.done))
+        print(f"  [RESUME] осталось загрузить: {total}")
 
-        i += UPSERT_BATCH
+    # [PIPE] Embedding и загрузка батчами с retry — с перекрытием
+    manifest.start(resume=resumed)
+    uploaded, skipped, ok = run_pipeline(
+        iter_chunks(CHUNKS_FILE, only_ids, manifest.done if resumed else None),
+        total, on_uploaded=manifest.ack,
+    )
+    # Манифест удаляется только когда загружено всё; иначе --resume дозагрузит
+    completed = ok and uploaded == total
+    manifest.close(completed)
+    if not ok:
+        return
 
     print(f"\nГотово. Загружено: {uploaded}, пропущено: {skipped}")
+    if not completed:
+        print(f"ℹ️  Загружено не всё — повторите с --resume ({MANIFEST_FILE})")
+    http_client.print_http_stats()  # [HTTP]
 
 
 if __name__ == "__main__":
@@ -331,5 +525,13 @@ if __name__ == "__main__":
         "--append", action="store_true",
         help="[I] Добавить новые точки в существующую коллекцию без пересоздания"
     )
+    parser.add_argument(
+        "--sync", action="store_true",
+        help="[SYNC] Загрузить только новые/изменённые чанки и удалить исчезнувшие"
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help=f"[RESUME] Продолжить прерванную загрузку по {MANIFEST_FILE}"
+    )
     args = parser.parse_args()
-    main(append_mode=args.append)
\ No newline at end of file
+    main(append_mode=args.append, sync_mode=args.sync, resume=args.resume)
\ No newline at end of file
@@ -0,0 +1,528 @@
+"""
+local_index.py — встроенный (in-process) бэкенд векторного поиска.
+
+Корпус — несколько тысяч 1024-мерных векторов bge-m3, а каждый retrieval в
+rpd_generate.retrieve и test_generate.retrieve_for_section шёл по HTTP в
+Qdrant в Docker. Для такого объёма точный перебор быстрее сетевого запроса:
+одно умножение матрицы на вектор (~5 млн FLOP) — порядка миллисекунды.
+
+Формат каталога (по умолчанию local_index/):
+  meta.json      — {"dim", "count", "model", "source", "built"}
+  vectors.npy    — float32 (count × dim), L2-нормированные строки;
+                   открывается через np.load(mmap_mode="r")
+  points.jsonl   — {"id", "payload"} по строке на строку vectors.npy
+
+При загрузке для полей MASK_FIELDS (section_type, direction, level, …)
+строятся булевы маски по значениям, поэтому фильтры Qdrant вида
+must/should/must_not + match.value/any сводятся к операциям над масками.
+Поля вне MASK_FIELDS (например metadata.section_type) маскируются лениво
+при первом обращении.
+
+Сборка:
+  python local_index.py build                 # chunks.jsonl + embed_store
+  python local_index.py build --from-qdrant   # снимок коллекции (вкл. книги)
+
+Выбор бэкенда — config.json: "retrieval_backend": "qdrant" | "local" | "ann",
+"local_index_dir": "local_index", "local_index_nprobe": 8.
+
+[ANN] Для корпусов за пределами точного перебора (book_loader добавляет
+десятки тысяч книжных чанков) — IVF-индекс (inverted file): строки
+vectors.npy упорядочены по кластерам сферического k-means, так что каждый
+список — непрерывный срез memmap. Дополнительные файлы:
+  ivf_centroids.npy — float32 (n_lists × dim), нормированные центроиды
+  ivf_offsets.npy   — int64 (n_lists + 1), границы списков в vectors.npy
+Поиск просматривает nprobe ближайших списков; при фильтре просмотр
+расширяется, пока не наберётся top_k подходящих строк, а очень селективный
+фильтр (≤ EXACT_FILTER_ROWS строк) ищется точно — как Qdrant переключается
+на полный перебор при малой мощности фильтра. Порядок строк общий для
+точного и IVF-поиска, поэтому "local" и "ann" работают с одним каталогом.
+
+  python local_index.py build --ivf            # + IVF (n_lists ≈ 4·√N)
+  python local_index.py ivf --lists 256        # IVF поверх готового индекса
+  python local_index.py bench --nprobe 1,4,16  # recall@k / латентность vs точный
+"""
+
+import argparse
+import json
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+INDEX_DIR   = "local_index"
+MASK_FIELDS = ("section_type", "direction", "level", "department", "content_type", "source")
+
+# [ANN]
+DEFAULT_NPROBE    = 8
+EXACT_FILTER_ROWS = 2000     # фильтр не шире — точный поиск по отфильтрованным строкам
+KMEANS_ITERS      = 20
+KMEANS_SAMPLE     = 50_000   # строк для обучения центроидов
+
+_lock = threading.Lock()
+_indexes: dict = {}   # (path, ann) → ExactIndex | IVFIndex
+
+
+# ---------------------------------------------------------------------------
+# Фильтры Qdrant → маски
+# ---------------------------------------------------------------------------
+
+def _payload_value(payload: dict, key: str):
+    """Значение поля payload по ключу Qdrant (поддерживается "a.b")."""
+    value = payload
+    for part in key.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+class PayloadMasks:
+    """
+    Фильтры payload в формате Qdrant над списком точек (ids/payloads).
+    Общая часть ExactIndex/IVFIndex и lexical_index.BM25Index.
+    """
+
+    def _init_masks(self, ids: list, payloads: list) -> None:
+        self.ids      = ids
+        self.payloads = payloads
+        self._masks: dict = {}   # key → {value → np.bool_ array}
+        self._mask_lock = threading.Lock()
+        for key in MASK_FIELDS:
+            self._field_masks(key)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _field_masks(self, key: str) -> dict:
+        masks = self._masks.get(key)
+        if masks is not None:
+            return masks
+        rows: dict = {}
+        for i, payload in enumerate(self.payloads):
+            value = _payload_value(payload, key)
+            for v in (value if isinstance(value, list) else [value]):
+                if isinstance(v, (str, int, bool)):
+                    rows.setdefault(v, []).append(i)
+        masks = {}
+        for v, idx in rows.items():
+            m = np.zeros(len(self.ids), dtype=bool)
+            m[idx] = True
+            masks[v] = m
+        with self._mask_lock:
+            self._masks.setdefault(key, masks)
+        return self._masks[key]
+
+    def _condition_mask(self, cond: dict) -> np.ndarray:
+        if "key" not in cond:
+            return self.filter_mask(cond)   # вложенный фильтр
+        masks = self._field_masks(cond["key"])
+        match = cond.get("match", {})
+        values = match["any"] if "any" in match else [match.get("value")]
+        out = np.zeros(len(self.ids), dtype=bool)
+        for v in values:
+            m = masks.get(v)
+            if m is not None:
+                out |= m
+        return out
+
+    def filter_mask(self, flt: dict | None) -> np.ndarray | None:
+        """Фильтр Qdrant (must/should/must_not) → булева маска строк; None — без фильтра."""
+        if not flt:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        for cond in flt.get("must", []):
+            mask &= self._condition_mask(cond)
+        if flt.get("should"):
+            any_mask = np.zeros(len(self.ids), dtype=bool)
+            for cond in flt["should"]:
+                any_mask |= self._condition_mask(cond)
+            mask &= any_mask
+        for cond in flt.get("must_not", []):
+            mask &= ~self._condition_mask(cond)
+        return mask
+
+
+class ExactIndex(PayloadMasks):
+    """Точный поиск top-k по косинусу с фильтрами payload в формате Qdrant."""
+
+    def __init__(self, path: str = INDEX_DIR):
+        self.path = Path(path)
+        meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        self.dim     = int(meta["dim"])
+        self.model   = meta.get("model", "")
+        self.vectors = np.load(self.path / "vectors.npy", mmap_mode="r")
+        ids: list      = []
+        payloads: list = []
+        with open(self.path / "points.jsonl", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    p = json.loads(line)
+                    ids.append(p["id"])
+                    payloads.append(p.get("payload") or {})
+        if len(ids) != self.vectors.shape[0]:
+            raise ValueError(f"{self.path}: points.jsonl ({len(ids)}) "
+                             f"≠ vectors.npy ({self.vectors.shape[0]})")
+        self._init_masks(ids, payloads)
+
+    def search(self, vec, payload_filter: dict | None, top_k: int) -> list:
+        """top_k точек в формате ответа Qdrant: [{"id", "score", "payload"}]."""
+        if not len(self.ids):
+            return []
+        q = np.asarray(vec, dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        if not norm or q.shape[0] != self.dim:
+            return []
+        scores = self.vectors @ (q / norm)
+        mask = self.filter_mask(payload_filter)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+            top_k = min(top_k, int(mask.sum()))
+        top_k = min(top_k, len(scores))
+        if top_k <= 0:
+            return []
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            {"id": self.ids[i], "score": float(scores[i]), "payload": self.payloads[i]}
+            for i in top
+        ]
+
+
+class IVFIndex(ExactIndex):
+    """[ANN] Приближённый поиск по nprobe ближайшим спискам IVF."""
+
+    def __init__(self, path: str = INDEX_DIR, nprobe: int = DEFAULT_NPROBE):
+        super().__init__(path)
+        self.centroids = np.load(self.path / "ivf_centroids.npy")
+        self.offsets   = np.load(self.path / "ivf_offsets.npy")
+        self.nprobe    = nprobe
+
+    def search(self, vec, payload_filter: dict | None, top_k: int,
+               nprobe: int | None = None) -> list:
+        if not len(self.ids):
+            return []
+        q = np.asarray(vec, dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        if not norm or q.shape[0] != self.dim:
+            return []
+        q = q / norm
+        mask = self.filter_mask(payload_filter)
+        if mask is not None and int(mask.sum()) <= EXACT_FILTER_ROWS:
+            return super().search(q, payload_filter, top_k)
+
+        nprobe = nprobe or self.nprobe
+        order = np.argsort(-(self.centroids @ q))
+        cand_rows: list = []
+        cand_scores: list = []
+        found = 0
+        for probed, lst in enumerate(order):
+            a, b = int(self.offsets[lst]), int(self.offsets[lst + 1])
+            if a == b:
+                continue
+            rows = np.arange(a, b)
+            if mask is not None:
+                rows = rows[mask[a:b]]
+                if not len(rows):
+                    continue
+                scores = self.vectors[rows] @ q
+            else:
+                scores = self.vectors[a:b] @ q
+            cand_rows.append(rows)
+            cand_scores.append(scores)
+            found += len(rows)
+            # Фильтр мог «выесть» ближайшие списки — расширяем до top_k кандидатов
+            if probed + 1 >= nprobe and found >= top_k:
+                break
+        if not cand_rows:
+            return []
+        rows   = np.concatenate(cand_rows)
+        scores = np.concatenate(cand_scores)
+        top_k  = min(top_k, len(rows))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            {"id": self.ids[rows[i]], "score": float(scores[i]), "payload": self.payloads[rows[i]]}
+            for i in top
+        ]
+
+
+def get_index(path: str = INDEX_DIR, ann: bool = False,
+              nprobe: int = DEFAULT_NPROBE) -> ExactIndex:
+    """Индекс каталога path (загружается один раз на процесс)."""
+    with _lock:
+        idx = _indexes.get((path, ann))
+        if idx is None:
+            t0 = time.perf_counter()
+            idx = IVFIndex(path, nprobe) if ann else ExactIndex(path)
+            _indexes[(path, ann)] = idx
+            kind = f"IVF, {len(idx.centroids)} списков, nprobe={nprobe}" if ann else "точный"
+            print(f"  ✅ local_index: {len(idx)} векторов из {path} ({kind}, "
+                  f"{time.perf_counter() - t0:.2f}с)")
+        return idx
+
+
+def search(path: str, vec, payload_filter: dict | None, top_k: int,
+           ann: bool = False, nprobe: int = DEFAULT_NPROBE) -> list:
+    return get_index(path, ann, nprobe).search(vec, payload_filter, top_k)
+
+
+def search_batch(path: str, vecs: list, payload_filter: dict | None, top_k: int,
+                 ann: bool = False, nprobe: int = DEFAULT_NPROBE) -> list:
+    """Аналог qdrant_search_batch: списки хитов в порядке vecs."""
+    idx = get_index(path, ann, nprobe)
+    return [idx.search(v, payload_filter, top_k) for v in vecs]
+
+
+def index_exists(path: str = INDEX_DIR) -> bool:
+    return (Path(path) / "meta.json").exists()
+
+
+def ivf_exists(path: str = INDEX_DIR) -> bool:
+    return (Path(path) / "ivf_centroids.npy").exists()
+
+
+def backend_from_config(cfg: dict) -> dict:
+    """
+    {"backend", "index_dir", "nprobe"} из config.json ("retrieval_backend",
+    "local_index_dir", "local_index_nprobe"). Нет собранного индекса —
+    fallback на Qdrant; нет IVF для "ann" — точный локальный поиск.
+    """
+    backend   = cfg.get("retrieval_backend", "qdrant")
+    index_dir = cfg.get("local_index_dir", INDEX_DIR)
+    nprobe    = int(cfg.get("local_index_nprobe", DEFAULT_NPROBE))
+    if backend not in ("qdrant", "local", "ann"):
+        print(f"  ⚠️  retrieval_backend={backend!r} не поддерживается — используется qdrant")
+        backend = "qdrant"
+    if backend != "qdrant" and not index_exists(index_dir):
+        print(f"  ⚠️  local_index: {index_dir}/ не найден — используется Qdrant "
+              f"(соберите: python local_index.py build)")
+        backend = "qdrant"
+    if backend == "ann" and not ivf_exists(index_dir):
+        print(f"  ⚠️  local_index: в {index_dir}/ нет IVF — точный поиск "
+              f"(соберите: python local_index.py ivf)")
+        backend = "local"
+    if backend != "qdrant":
+        kind = f"IVF, nprobe={nprobe}" if backend == "ann" else "точный"
+        print(f"  ℹ️  Retrieval: локальный индекс {index_dir}/ ({kind}, без Qdrant)")
+    return {"backend": backend, "index_dir": index_dir, "nprobe": nprobe}
+
+
+# ---------------------------------------------------------------------------
+# Сборка
+# ---------------------------------------------------------------------------
+
+def write_index(path: str, ids: list, vectors: list, payloads: list,
+                model: str, source: str) -> None:
+    """Записывает индекс: нормированные векторы, id/payload, meta.json."""
+    out = Path(path)
+    out.mkdir(parents=True, exist_ok=True)
+    mat = np.asarray(vectors, dtype=np.float32)
+    if mat.ndim != 2 or not len(mat):
+        raise ValueError("Нет векторов для индекса")
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    mat /= np.where(norms == 0, 1.0, norms)
+    for stale in ("ivf_centroids.npy", "ivf_offsets.npy"):
+        (out / stale).unlink(missing_ok=True)
+    np.save(out / "vectors.npy", mat)
+    with open(out / "points.jsonl", "w", encoding="utf-8") as f:
+        for pid, payload in zip(ids, payloads):
+            f.write(json.dumps({"id": pid, "payload": payload}, ensure_ascii=False) + "\n")
+    (out / "meta.json").write_text(json.dumps({
+        "dim": int(mat.shape[1]), "count": int(mat.shape[0]), "model": model,
+        "source": source, "built": datetime.now().isoformat(timespec="seconds"),
+    }, ensure_ascii=False, indent=2), encoding="utf-8")
+    _forget(path)
+    print(f"✅ local_index: {mat.shape[0]} × {mat.shape[1]} → {out}")
+
+
+def _forget(path: str) -> None:
+    with _lock:
+        for key in [k for k in _indexes if k[0] == str(path)]:
+            _indexes.pop(key)
+
+
+def _kmeans(mat: np.ndarray, n_lists: int, seed: int = 0) -> np.ndarray:
+    """Сферический k-means (косинус): нормированные центроиды n_lists × dim."""
+    rng = np.random.default_rng(seed)
+    train = mat if len(mat) <= KMEANS_SAMPLE else mat[rng.choice(len(mat), KMEANS_SAMPLE, replace=False)]
+    train = np.asarray(train, dtype=np.float32)
+    cent = train[rng.choice(len(train), n_lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERS):
+        assign = np.argmax(train @ cent.T, axis=1)
+        for c in range(n_lists):
+            members = train[assign == c]
+            if len(members):
+                cent[c] = members.sum(axis=0)
+            else:   # пустой кластер — переносим в случайную точку
+                cent[c] = train[rng.integers(len(train))]
+        cent /= np.maximum(np.linalg.norm(cent, axis=1, keepdims=True), 1e-12)
+    return cent
+
+
+def build_ivf(path: str = INDEX_DIR, n_lists: int | None = None) -> None:
+    """
+    [ANN] Добавляет IVF к готовому индексу: обучает центроиды, переупорядочивает
+    vectors.npy/points.jsonl по спискам и пишет ivf_centroids/ivf_offsets.
+    """
+    out = Path(path)
+    mat = np.load(out / "vectors.npy")
+    with open(out / "points.jsonl", encoding="utf-8") as f:
+        points = [line for line in f if line.strip()]
+    n = len(mat)
+    n_lists = max(1, min(n_lists or int(4 * np.sqrt(n)), n))
+    t0 = time.perf_counter()
+    cent = _kmeans(mat, n_lists)
+    assign = np.empty(n, dtype=np.int64)
+    for start in range(0, n, 8192):
+        assign[start:start + 8192] = np.argmax(mat[start:start + 8192] @ cent.T, axis=1)
+    order = np.argsort(assign, kind="stable")
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(assign, minlength=n_lists))
+
+    np.save(out / "vectors.npy", mat[order])
+    with open(out / "points.jsonl", "w", encoding="utf-8") as f:
+        f.writelines(points[i] for i in order)
+    np.save(out / "ivf_centroids.npy", cent)
+    np.save(out / "ivf_offsets.npy", offsets)
+    meta = json.loads((out / "meta.json").read_text(encoding="utf-8"))
+    meta["ivf"] = {"n_lists": n_lists, "built": datetime.now().isoformat(timespec="seconds")}
+    (out / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    _forget(path)
+    sizes = np.diff(offsets)
+    print(f"✅ IVF: {n_lists} списков (размер: мин {sizes.min()}, сред {sizes.mean():.0f}, "
+          f"макс {sizes.max()}) за {time.perf_counter() - t0:.1f}с")
+
+
+def build_from_chunks(chunks_file: str = "chunks.jsonl", path: str = INDEX_DIR,
+                      batch: int = 64) -> None:
+    """
+    Индекс из chunks.jsonl: payload как у load_qdrant, векторы из embed_store
+    (после load_qdrant — без обращений к Ollama, промахи эмбеддятся).
+    """
+    from load_qdrant import build_payload, iter_chunks
+    from utils import EMBED_MODEL, get_embeddings_cached
+
+    ids, vectors, payloads = [], [], []
+    chunks = list(iter_chunks(chunks_file))
+    for start in range(0, len(chunks), batch):
+        part = chunks[start:start + batch]
+        vecs = get_embeddings_cached([c["text"] for c in part], prefix="passage")
+        for ch, vec in zip(part, vecs):
+            if not vec:
+                print(f"  ⚠️  Пропуск чанка {ch['id']} — embedding не получен")
+                continue
+            ids.append(ch["id"])
+            vectors.append(vec)
+            payloads.append(build_payload(ch))
+    write_index(path, ids, vectors, payloads, EMBED_MODEL, source=chunks_file)
+
+
+def build_from_qdrant(url: str, collection: str, path: str = INDEX_DIR) -> None:
+    """Индекс-снимок коллекции Qdrant (включая книжные точки book_loader)."""
+    import http_client
+
+    ids, vectors, payloads = [], [], []
+    for p in http_client.qdrant_scroll(url, collection, True, with_vector=True):
+        vec = p.get("vector")
+        if isinstance(vec, dict):   # именованные векторы — берём первый
+            vec = next(iter(vec.values()), None)
+        if not vec:
+            continue
+        ids.append(p["id"])
+        vectors.append(vec)
+        payloads.append(p.get("payload") or {})
+    model = next((pl.get("embedding_model") for pl in payloads if pl.get("embedding_model")), "")
+    write_index(path, ids, vectors, payloads, model, source=f"{url}/{collection}")
+
+
+# ---------------------------------------------------------------------------
+# [ANN] Бенчмарк recall/латентности IVF против точного поиска
+# ---------------------------------------------------------------------------
+
+def bench(path: str = INDEX_DIR, nprobes: tuple = (1, 2, 4, 8, 16, 32),
+          n_queries: int = 200, top_k: int = 8, noise: float = 0.05, seed: int = 0) -> list:
+    """
+    recall@top_k и латентность IVF при разных nprobe относительно ExactIndex.
+
+    Запросы — векторы корпуса с гауссовым шумом (реальные запросы bge-m3 к
+    чанкам ведут себя так же: ближайший сосед — «свой» чанк и его окрестность).
+    Проверяется поиск без фильтра и с фильтром по самому частому section_type.
+    """
+    exact = ExactIndex(path)
+    ivf   = IVFIndex(path)
+    rng   = np.random.default_rng(seed)
+    rows  = rng.choice(len(exact), min(n_queries, len(exact)), replace=False)
+    queries = np.asarray(exact.vectors[rows], dtype=np.float32)
+    queries += rng.normal(0, noise, queries.shape).astype(np.float32)
+
+    filters: dict = {"без фильтра": None}
+    st_masks = exact._field_masks("section_type")
+    if st_masks:
+        st = max(st_masks, key=lambda v: int(st_masks[v].sum()))
+        filters[f"section_type={st}"] = {"must": [{"key": "section_type", "match": {"value": st}}]}
+
+    def run(fn):
+        lat, res = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            hits = fn(q)
+            lat.append((time.perf_counter() - t0) * 1000)
+            res.append({h["id"] for h in hits})
+        return res, np.asarray(lat)
+
+    report = []
+    print(f"\n📊 local_index bench: {len(exact)} векторов, {len(ivf.centroids)} списков, "
+          f"{len(queries)} запросов, top_k={top_k}")
+    print(f"  {'фильтр':<28} {'режим':<12} {'recall':>7} {'сред, мс':>9} {'p95, мс':>8}")
+    for fname, flt in filters.items():
+        truth, lat = run(lambda q: exact.search(q, flt, top_k))
+        print(f"  {fname:<28} {'exact':<12} {1.0:>7.3f} {lat.mean():>9.3f} "
+              f"{np.percentile(lat, 95):>8.3f}")
+        report.append({"filter": fname, "mode": "exact", "recall": 1.0,
+                       "mean_ms": float(lat.mean()), "p95_ms": float(np.percentile(lat, 95))})
+        for nprobe in nprobes:
+            got, lat = run(lambda q: ivf.search(q, flt, top_k, nprobe=nprobe))
+            recall = float(np.mean([len(g & t) / max(len(t), 1) for g, t in zip(got, truth)]))
+            print(f"  {fname:<28} {f'nprobe={nprobe}':<12} {recall:>7.3f} {lat.mean():>9.3f} "
+                  f"{np.percentile(lat, 95):>8.3f}")
+            report.append({"filter": fname, "mode": f"nprobe={nprobe}", "recall": recall,
+                           "mean_ms": float(lat.mean()), "p95_ms": float(np.percentile(lat, 95))})
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальный индекс для retrieval без Qdrant")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="Собрать индекс")
+    b.add_argument("--out", default=INDEX_DIR)
+    b.add_argument("--chunks", default="chunks.jsonl")
+    b.add_argument("--from-qdrant", action="store_true",
+                   help="Выгрузить векторы и payload из коллекции Qdrant")
+    b.add_argument("--qdrant-url", default="http://localhost:6333")
+    b.add_argument("--collection", default="rpd_rag")
+    b.add_argument("--ivf", action="store_true", help="[ANN] Сразу построить IVF")
+    b.add_argument("--lists", type=int, default=None, help="Число списков IVF (по умолчанию 4·√N)")
+    v = sub.add_parser("ivf", help="[ANN] Построить IVF поверх готового индекса")
+    v.add_argument("--out", default=INDEX_DIR)
+    v.add_argument("--lists", type=int, default=None)
+    m = sub.add_parser("bench", help="[ANN] recall/латентность IVF против точного поиска")
+    m.add_argument("--out", default=INDEX_DIR)
+    m.add_argument("--nprobe", default="1,2,4,8,16,32")
+    m.add_argument("--queries", type=int, default=200)
+    m.add_argument("--top-k", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        if args.from_qdrant:
+            build_from_qdrant(args.qdrant_url, args.collection, args.out)
+        else:
+            build_from_chunks(args.chunks, args.out)
+        if args.ivf:
+            build_ivf(args.out, args.lists)
+    elif args.cmd == "ivf":
+        build_ivf(args.out, args.lists)
+    elif args.cmd == "bench":
+        bench(args.out, tuple(int(x) for x in args.nprobe.split(",")),
+              n_queries=args.queries, top_k=args.top_k)
@@ -0,0 +1,117 @@
+"""
+near_dup.py — инкрементальный поиск почти-дубликатов (MinHash + LSH).
+
+test_generate._filter_near_duplicate_questions сравнивал каждый новый
+вопрос со всеми оставленными (Jaccard биграм), пересчитывая множество
+биграм оставленного вопроса во внутреннем цикле, — O(n²) построений
+множеств, и только внутри одного ранга: дубликаты между рангами и
+разделами проходили.
+
+Здесь каждому множеству шинглов ставится MinHash-подпись из NUM_PERM
+значений (универсальное хеширование a·x + b mod 2³¹−1 по стабильному
+crc32 шингла — результат одинаков между запусками), подпись режется на
+BANDS полос по NUM_PERM / BANDS строк, полосы — ключи хеш-таблиц LSH.
+Кандидаты — элементы, совпавшие хотя бы в одной полосе; решение «дубликат»
+принимается по точному Jaccard с сохранёнными множествами, так что порог
+имеет прежний смысл. LSH только отсеивает сравнения: пара с Jaccard s
+становится кандидатом с вероятностью 1 − (1 − s^r)^b, при 128 / 32 и
+s = 0.72 пропуск — ≈ 5·10⁻⁵.
+
+remove() исключает элемент из индекса (вопрос, отбракованный позже другим
+фильтром, не должен гасить свои почти-дубликаты); id остальных не меняются.
+"""
+
+import zlib
+
+import numpy as np
+
+NUM_PERM = 128
+BANDS    = 32
+_PRIME   = (1 << 31) - 1
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    union = len(a | b)
+    return len(a & b) / union if union else 0.0
+
+
+class MinHashLSH:
+    """Индекс множеств строк; find() — первый сохранённый элемент с Jaccard ≥ threshold."""
+
+    def __init__(self, threshold: float, num_perm: int = NUM_PERM,
+                 bands: int = BANDS, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm={num_perm} не делится на bands={bands}")
+        rng = np.random.default_rng(seed)
+        self.threshold = threshold
+        self.rows   = num_perm // bands
+        self._a     = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b     = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+        self._bands = [dict() for _ in range(bands)]   # полоса → ключ → [id]
+        self._sets: list[set | None] = []   # None — удалён
+        self._keys: list[list[bytes]] = []   # ключи полос элемента — для remove()
+        self.stats  = {"added": 0, "removed": 0, "queries": 0, "candidates": 0, "duplicates": 0}
+
+    def __len__(self) -> int:
+        return self.stats["added"] - self.stats["removed"]
+
+    def signature(self, shingles: set) -> np.ndarray:
+        if not shingles:
+            return np.full(len(self._a), _PRIME, dtype=np.uint64)
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles),
+                        dtype=np.uint64, count=len(shingles)) % _PRIME
+        return ((np.outer(self._a, x) + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def _band_keys(self, sig: np.ndarray) -> list[bytes]:
+        return [sig[i * self.rows:(i + 1) * self.rows].tobytes()
+                for i in range(len(self._bands))]
+
+    def find(self, shingles: set, sig: np.ndarray | None = None) -> tuple[int, float] | None:
+        """(id, jaccard) самого раннего сохранённого дубликата или None."""
+        self.stats["queries"] += 1
+        if sig is None:
+            sig = self.signature(shingles)
+        cand: set = set()
+        for table, key in zip(self._bands, self._band_keys(sig)):
+            cand.update(table.get(key, ()))
+        self.stats["candidates"] += len(cand)
+        for idx in sorted(cand):
+            sim = jaccard(shingles, self._sets[idx])
+            if sim >= self.threshold:
+                self.stats["duplicates"] += 1
+                return idx, sim
+        return None
+
+    def add(self, shingles: set, sig: np.ndarray | None = None) -> int:
+        if sig is None:
+            sig = self.signature(shingles)
+        idx  = len(self._sets)
+        keys = self._band_keys(sig)
+        self._sets.append(shingles)
+        self._keys.append(keys)
+        for table, key in zip(self._bands, keys):
+            table.setdefault(key, []).append(idx)
+        self.stats["added"] += 1
+        return idx
+
+    def add_if_new(self, shingles: set) -> int | None:
+        """Добавляет множество, если в индексе нет дубликата; id добавленного или None."""
+        sig = self.signature(shingles)
+        if self.find(shingles, sig) is not None:
+            return None
+        return self.add(shingles, sig)
+
+    def remove(self, idx: int) -> None:
+        """Убирает элемент из полос: find() его больше не возвращает."""
+        if self._sets[idx] is None:
+            return
+        for table, key in zip(self._bands, self._keys[idx]):
+            bucket = table[key]
+            bucket.remove(idx)
+            if not bucket:
+                del table[key]
+        self._sets[idx] = None
+        self._keys[idx] = []
+        self.stats["removed"] += 1
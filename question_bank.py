@@ -0,0 +1,166 @@
+"""
+question_bank.py — банк вопросов test_generate между прогонами (SQLite).
+
+Каждый прогон test_generate генерировал все вопросы заново, даже если
+разделы и темы РПД не менялись или та же тема есть в другой дисциплине.
+Здесь вопросы, прошедшие фильтры прогона (дубли дистракторов, почти-
+дубликаты), сохраняются в BANK_FILE с ключом sha256 нормализованного
+текста темы (для дозапроса — названия раздела), рангом и компетенциями
+раздела. Следующий прогон сначала берёт вопросы из банка (draw), а LLM
+запрашивается только на нехватку.
+
+draw() детерминирован при неизменном банке: сперва вопросы с
+пересечением по компетенциям, затем реже использованные, затем старые.
+Счётчик использований обновляется mark_used() после генерации, поэтому
+--resume после падения берёт те же вопросы. Один вопрос выдаётся не
+более одного раза за прогон; совпадения с новыми вопросами отсекает
+общий индекс почти-дубликатов test_generate ([LSH]).
+
+config.json["question_bank"]: enabled — сохранять вопросы, reuse —
+брать из банка.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import time
+
+BANK_FILE = "question_bank.sqlite3"
+
+DEFAULTS = {"enabled": True, "reuse": True}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id              INTEGER PRIMARY KEY,
+    topic_hash      TEXT NOT NULL,
+    rank            INTEGER NOT NULL,
+    task            TEXT NOT NULL,
+    task_hash       TEXT NOT NULL UNIQUE,
+    answers         TEXT NOT NULL,     -- JSON: метка → текст
+    correct_letters TEXT NOT NULL,     -- JSON: [метка]
+    qtype           INTEGER NOT NULL,
+    topic           TEXT,
+    discipline      TEXT,
+    created         REAL,
+    used_count      INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_questions_topic_rank ON questions(topic_hash, rank);
+CREATE TABLE IF NOT EXISTS question_comps (
+    question_id INTEGER NOT NULL REFERENCES questions(id) ON DELETE CASCADE,
+    comp        TEXT NOT NULL,
+    PRIMARY KEY (question_id, comp)
+);
+CREATE INDEX IF NOT EXISTS idx_question_comps_comp ON question_comps(comp);
+"""
+
+_policy = dict(DEFAULTS)
+_conn: sqlite3.Connection | None = None
+_drawn: set = set()   # id, выданные в этом прогоне
+_stats = {"drawn": 0, "stored": 0}
+
+
+def configure(cfg: dict | None) -> dict:
+    """Применяет config.json["question_bank"]; неизвестные ключи игнорируются."""
+    _policy.clear()
+    _policy.update(DEFAULTS)
+    _policy.update({k: v for k, v in (cfg or {}).items() if k in DEFAULTS})
+    return dict(_policy)
+
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(BANK_FILE)
+        _conn.execute("PRAGMA foreign_keys = ON")
+        _conn.executescript(_SCHEMA)
+    return _conn
+
+
+def _norm(text: str) -> str:
+    return re.sub(r"\s+", " ", text.lower()).strip(" .;:")
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(_norm(text).encode("utf-8")).hexdigest()
+
+
+def _valid(answers: dict, letters: list) -> bool:
+    return len(answers) >= 2 and bool(letters) and all(l in answers for l in letters)
+
+
+def draw(topic: str, rank: int, limit: int, comps: list[str]) -> list[dict]:
+    """
+    До limit вопросов по теме и рангу. Возвращает dict-ы с полями id, task,
+    answers, correct_letters, qtype — без нумерации (её присваивает caller).
+    """
+    if limit <= 0 or not (_policy["enabled"] and _policy["reuse"]):
+        return []
+    marks = ",".join("?" * len(comps)) or "NULL"
+    rows = _db().execute(f"""
+        SELECT q.id, q.task, q.answers, q.correct_letters, q.qtype,
+               EXISTS (SELECT 1 FROM question_comps c
+                       WHERE c.question_id = q.id AND c.comp IN ({marks})) AS comp_match
+        FROM questions q
+        WHERE q.topic_hash = ? AND q.rank = ?
+        ORDER BY comp_match DESC, q.used_count, q.id
+    """, (*comps, text_hash(topic), rank)).fetchall()
+    out = []
+    for qid, task, answers, letters, qtype, _ in rows:
+        if qid in _drawn:
+            continue
+        answers, letters = json.loads(answers), json.loads(letters)
+        if not _valid(answers, letters):
+            continue
+        _drawn.add(qid)
+        out.append({"id": qid, "task": task, "answers": answers,
+                    "correct_letters": letters, "qtype": qtype})
+        if len(out) >= limit:
+            break
+    _stats["drawn"] += len(out)
+    return out
+
+
+def put_many(items: list[tuple[str, dict]], comps: list[str], discipline: str) -> int:
+    """Сохраняет (тема, вопрос) пары; вопрос с тем же текстом задания не дублируется."""
+    if not items or not _policy["enabled"]:
+        return 0
+    db, now, stored = _db(), time.time(), 0
+    with db:
+        for topic, q in items:
+            cur = db.execute("""
+                INSERT OR IGNORE INTO questions
+                    (topic_hash, rank, task, task_hash, answers, correct_letters,
+                     qtype, topic, discipline, created)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (text_hash(topic), q["rank"], q["task"], text_hash(q["task"]),
+                  json.dumps(q["answers"], ensure_ascii=False),
+                  json.dumps(q["correct_letters"], ensure_ascii=False),
+                  q["qtype"], topic, discipline, now))
+            if cur.rowcount:
+                stored += 1
+                db.executemany("INSERT OR IGNORE INTO question_comps VALUES (?, ?)",
+                               [(cur.lastrowid, c) for c in comps])
+    _stats["stored"] += stored
+    return stored
+
+
+def mark_used(ids: list[int]) -> None:
+    if not ids:
+        return
+    with _db() as db:
+        db.executemany("UPDATE questions SET used_count = used_count + 1 WHERE id = ?",
+                       [(i,) for i in ids])
+
+
+def stats() -> dict:
+    total = _db().execute("SELECT COUNT(*) FROM questions").fetchone()[0] if _policy["enabled"] else 0
+    return {**_stats, "total": total}
+
+
+def print_stats() -> None:
+    if not _policy["enabled"]:
+        return
+    st = stats()
+    print(f"🏦 Банк вопросов: взято {st['drawn']}, добавлено {st['stored']}, "
+          f"всего {st['total']} ({BANK_FILE})")
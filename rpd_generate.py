@@ -58,11 +58,26 @@ import sys
 import os
 import shutil
 import time
+import threading
 import copy
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-import requests
+# [HTTP] keep-alive пул, единый retry, однократное определение API Qdrant
+import http_client
+# [GOV] Охлаждение GPU по политике config.json["llm_throttle"] вместо sleep
+import llm_governor
+# [LLMC] Персистентный кэш ответов LLM (llm_cache.jsonl)
+import llm_cache
+# [STREAM] Общий вызов /api/generate: поток, досрочная остановка, TTFT
+import llm_client
+# [BUDGET] Адаптивные num_ctx/num_predict по длине промпта и истории ответов
+import llm_budget
+# [LOCAL] Встроенный бэкенд поиска (config.json: retrieval_backend = "local")
+import local_index
+# [HYB] BM25 по chunks.jsonl + reciprocal rank fusion с плотным поиском
+import lexical_index
 # [FIX-#18]
-from utils import get_embedding as _embed_raw
+from utils import get_embeddings_cached as _embed_cached, import_legacy_embed_cache, get_embed_store
 from typing import Optional
 from lxml import etree
 from docx import Document
@@ -73,6 +88,9 @@ OUTPUT_DOCX     = "output_rpd.docx"
 GENERATION_LOG  = "generation_log.json"
 
 QDRANT = {"url": "http://localhost:6333", "collection": "rpd_rag"}
+# [LOCAL] "qdrant" — HTTP к Qdrant; "local"/"ann" — local_index.py (точный/IVF)
+SEARCH_BACKEND = {"backend": "qdrant", "index_dir": local_index.INDEX_DIR,
+                  "nprobe": local_index.DEFAULT_NPROBE}
 OLLAMA = {
     "embed_url":    "http://localhost:11434/api/embed",      # Ollama ≥0.6: /api/embed
     "generate_url": "http://localhost:11434/api/generate",
@@ -83,19 +101,28 @@ OLLAMA = {
     "llm_model":    "qwen2.5:14b",
 }
 GENERATION = {"top_k": 8, "min_score": 0.45}
+# [HYB] Гибридный retrieval (config.json: "retrieval_hybrid": true)
+HYBRID = {"enabled": False, "bm25_top_k": 20, "bm25_min_rel": 0.5}
+# [DAG] Секций одновременно в Ollama (config.json: "llm_parallel");
+# имеет смысл до OLLAMA_NUM_PARALLEL сервера, 1 — последовательно
+LLM_PARALLEL = {"workers": 1}
 
 # [З-13]
 RERANK_ENABLED  = False          # переключается через args.rerank в main()
 RERANK_TOP_K    = 20             # первичный пул для cross-encoder
 _RERANKER_MODEL = "BAAI/bge-reranker-v2-m3"
 _reranker       = None           # None = не инициализирован; False = недоступен
+_reranker_lock  = threading.Lock()
 
 
 def _get_reranker():
     """Lazy-init CrossEncoder. False = попытка была, модель недоступна."""
+    with _reranker_lock:   # [PF] retrieve может вызываться из потоков prefetch
+        return _load_reranker() if _reranker is None else _reranker
+
+
+def _load_reranker():
     global _reranker
-    if _reranker is not None:
-        return _reranker
     try:
         from sentence_transformers import CrossEncoder  # noqa: PLC0415
         _reranker = CrossEncoder(_RERANKER_MODEL, max_length=512)
@@ -154,7 +181,8 @@ _MAX_PER_SOURCE_OVERRIDE: dict = {
     "competencies": 1,
 }
 
-EMBED_CACHE    = {}
+# [STORE] Эмбеддинги хранятся в общем utils.get_embed_store() (embed_store/),
+# в rpd_cache.json остаётся только retrieval-кэш.
 RETRIEVE_CACHE = {}
 
 # [З-R5]
@@ -170,21 +198,29 @@ def _make_retrieval_conf_hash(top_k: int, min_score: float) -> str:
         json.dumps(SECTION_TYPE_FILTER, sort_keys=True).encode()
     ).hexdigest()[:8]
     _chunks_mtime = int(_os.path.getmtime("chunks.jsonl")) if _os.path.exists("chunks.jsonl") else 0
-    return f"k{top_k}_s{min_score:.3f}_stf{stf_hash}_ct{_chunks_mtime}"
+    conf = f"k{top_k}_s{min_score:.3f}_stf{stf_hash}_ct{_chunks_mtime}"
+    # [LOCAL] Результаты локального индекса кэшируются отдельно от Qdrant
+    if SEARCH_BACKEND["backend"] != "qdrant":
+        conf += f"_{SEARCH_BACKEND['backend']}"
+    if HYBRID["enabled"]:   # [HYB]
+        conf += f"_hyb{HYBRID['bm25_top_k']}r{HYBRID['bm25_min_rel']}"
+    return conf
 
 def _load_cache() -> None:
     """Загружает кэш из файла, если он существует."""
-    global EMBED_CACHE, RETRIEVE_CACHE
+    global RETRIEVE_CACHE
     if not os.path.exists(_CACHE_FILE):
         return
     try:
         with open(_CACHE_FILE, encoding="utf-8") as f:
             data = json.load(f)
-        EMBED_CACHE    = data.get("embed", {})
+        # [STORE] Старый формат с секцией "embed" — переносим векторы в embed_store
+        migrated = import_legacy_embed_cache(data.get("embed", {}), prefix="query")
         RETRIEVE_CACHE = {
             k: (v[0], v[1]) for k, v in data.get("retrieve", {}).items()
         }
-        print(f"  Кэш загружен: {len(EMBED_CACHE)} эмбеддингов, "
+        print(f"  Кэш загружен: {len(get_embed_store())} эмбеддингов (embed_store"
+              f"{f', +{migrated} из {_CACHE_FILE}' if migrated else ''}), "
               f"{len(RETRIEVE_CACHE)} retrieval-запросов")
     except Exception as e:
         print(f"  ⚠️  Кэш не загружен: {e}")
@@ -272,14 +308,15 @@ def _print_similar_disciplines(discipline: str, corpus_dir: str = "rpd_corpus",
         print("  ⚠️  [SIM] Корпус не найден — список похожих дисциплин недоступен")
         return
 
-    query_vec = get_embedding(discipline)
+    # [BATCH] Запрос и все названия дисциплин — одним пакетом
+    names = list(title_by_src.values())
+    query_vec, *name_vecs = get_embeddings([discipline] + names)
     if not query_vec:
         print("  ⚠️  [SIM] Embedding недоступен — пропускаю поиск похожих")
         return
 
     scored = []
-    for src, name in title_by_src.items():
-        vec = get_embedding(name)
+    for (src, name), vec in zip(title_by_src.items(), name_vecs):
         if vec:
             scored.append((name, src, _cosine(query_vec, vec)))
 
@@ -298,11 +335,11 @@ def _print_similar_disciplines(discipline: str, corpus_dir: str = "rpd_corpus",
 def _save_cache() -> None:
     """Сохраняет кэш в файл."""
     try:
+        with _state_lock:   # [DAG] снимок — prefetch может дописывать кэш
+            snapshot = dict(RETRIEVE_CACHE)
         with open(_CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump(
-                {"embed": EMBED_CACHE, "retrieve": RETRIEVE_CACHE},
-                f, ensure_ascii=False
-            )
+            json.dump({"retrieve": snapshot}, f, ensure_ascii=False)
+        get_embed_store().flush()  # [STORE]
     except Exception as e:
         print(f"  ⚠️  Кэш не сохранён: {e}")
 
@@ -337,6 +374,8 @@ SECTION_QUERIES = {
 
 # Глобальный лог генерации — [C]
 _generation_log: dict = {}
+# [DAG] Секции пишут RETRIEVE_CACHE/_generation_log из потоков _run_dag
+_state_lock = threading.RLock()
 
 
 # ---------------------------------------------------------------------------
@@ -351,35 +390,73 @@ def clean(text: str) -> str:
 
 
 def get_embedding(text: str):
-    # [FIX-#18]
-    if text in EMBED_CACHE:
-        return EMBED_CACHE[text]
-    vec = _embed_raw(text, prefix="query", retry=3)
-    if vec:
-        EMBED_CACHE[text] = vec
-    return vec
+    # [FIX-#18] [STORE]
+    return _embed_cached([text], prefix="query", retry=3)[0]
+
+
+def get_embeddings(texts: list[str]) -> list:
+    """
+    [BATCH] Пакетный get_embedding: промахи embed_store эмбеддятся одним
+    запросом /api/embed. Порядок результатов совпадает с texts.
+    """
+    return _embed_cached(texts, prefix="query", retry=3)
 
 
 def _search_qdrant(vec: list, payload_filter: dict | None, top_k: int) -> list:
-    """Поиск в Qdrant с fallback query → search."""
-    try:
-        body = {"query": vec, "limit": top_k, "with_payload": True}
-        if payload_filter:
-            body["filter"] = payload_filter
-        r = requests.post(
-            f"{QDRANT['url']}/collections/{QDRANT['collection']}/points/query",
-            json=body, timeout=30)
-        r.raise_for_status()
-        return r.json().get("result", {}).get("points", [])
-    except requests.HTTPError:
-        body = {"vector": vec, "limit": top_k, "with_payload": True}
-        if payload_filter:
-            body["filter"] = payload_filter
-        r = requests.post(
-            f"{QDRANT['url']}/collections/{QDRANT['collection']}/points/search",
-            json=body, timeout=30)
-        r.raise_for_status()
-        return r.json().get("result", [])
+    """Поиск в Qdrant; query/search API определяется один раз в http_client."""
+    if SEARCH_BACKEND["backend"] != "qdrant":  # [LOCAL] in-process поиск ([ANN] — IVF)
+        return local_index.search(SEARCH_BACKEND["index_dir"], vec, payload_filter, top_k,
+                                  ann=SEARCH_BACKEND["backend"] == "ann",
+                                  nprobe=SEARCH_BACKEND["nprobe"])
+    return http_client.qdrant_search(QDRANT["url"], QDRANT["collection"],
+                                     vec, payload_filter, top_k)
+
+
+def _search_qdrant_batch(vecs: list, payload_filter: dict | None, top_k: int) -> list:
+    """[MQ] Все формулировки запроса — одним пакетным поиском."""
+    if SEARCH_BACKEND["backend"] != "qdrant":
+        return local_index.search_batch(SEARCH_BACKEND["index_dir"], vecs, payload_filter, top_k,
+                                        ann=SEARCH_BACKEND["backend"] == "ann",
+                                        nprobe=SEARCH_BACKEND["nprobe"])
+    return http_client.qdrant_search_batch(QDRANT["url"], QDRANT["collection"],
+                                           vecs, payload_filter, top_k)
+
+
+# [PF] cache_key → Future: retrieval всех секций запускается заранее
+_PREFETCH: dict = {}
+PREFETCH_WORKERS = 4
+
+
+def prefetch_sections(discipline: str, direction: str = "", level: str = "") -> None:
+    """
+    [PF] Запускает retrieval всех SECTION_QUERIES параллельно в фоне.
+
+    Retrieval зависит только от discipline/direction/level, поэтому его не
+    нужно ждать перед каждым LLM-вызовом: пока генерируются компетенции,
+    контекст остальных секций уже готовится. retrieve() для той же секции
+    возвращает результат prefetch (дожидаясь его при необходимости).
+    """
+    pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+    started = 0
+    for section in SECTION_QUERIES:
+        section_types = SECTION_TYPE_FILTER.get(section)
+        cache_key = _retrieve_cache_key(section, discipline, section_types, direction, level)
+        if cache_key in RETRIEVE_CACHE or cache_key in _PREFETCH:
+            continue
+        _PREFETCH[cache_key] = pool.submit(
+            _retrieve_uncached, cache_key, section, discipline, section_types, direction, level
+        )
+        started += 1
+    pool.shutdown(wait=False)
+    if started:
+        print(f"  ⏩ Prefetch retrieval: {started} секций в фоне ({PREFETCH_WORKERS} потока)")
+
+
+def _retrieve_cache_key(section: str, discipline: str, section_types: list | None,
+                        direction: str, level: str) -> str:
+    # [З-G6]
+    return (f"{section}|{discipline}|{','.join(section_types or [])}"
+            f"|{direction}|{level}|{_RETRIEVAL_CONF_HASH}")
 
 
 def retrieve(section: str, discipline: str, section_types: list = None,
@@ -394,12 +471,18 @@ def retrieve(section: str, discipline: str, section_types: list = None,
 
     Возвращает: (ctx_string, hits_list) для логирования [C].
     """
-    # [З-G6]
-    cache_key = (f"{section}|{discipline}|{','.join(section_types or [])}"
-                 f"|{direction}|{level}|{_RETRIEVAL_CONF_HASH}")
+    cache_key = _retrieve_cache_key(section, discipline, section_types, direction, level)
     if cache_key in RETRIEVE_CACHE:
         return RETRIEVE_CACHE[cache_key]
+    # [PF] Запрос уже выполняется в prefetch_sections — ждём его результат
+    future = _PREFETCH.get(cache_key)
+    if future is not None:
+        return future.result()
+    return _retrieve_uncached(cache_key, section, discipline, section_types, direction, level)
+
 
+def _retrieve_uncached(cache_key: str, section: str, discipline: str,
+                       section_types: list, direction: str, level: str) -> tuple[str, list]:
     try:
         # [B] Строим фильтр с доменными полями
         must_conditions: list = []
@@ -428,24 +511,39 @@ def retrieve(section: str, discipline: str, section_types: list = None,
         queries = SECTION_QUERIES.get(section, [f"{discipline} {section}"])
         queries = [q.format(discipline=discipline) for q in queries]
 
+        # [MQ] Все формулировки: один /api/embed и один пакетный поиск
         all_hits: dict[int, dict] = {}  # id → hit (дедупликация)
-        for query_text in queries:
-            vec = get_embedding(query_text)
-            if not vec:
-                continue
-            hits = _search_qdrant(vec, payload_filter,
-                                  RERANK_TOP_K if RERANK_ENABLED else GENERATION["top_k"])
+        vecs = [v for v in get_embeddings(queries) if v]
+        dense_lists: list = _search_qdrant_batch(
+            vecs, payload_filter, RERANK_TOP_K if RERANK_ENABLED else GENERATION["top_k"]
+        )
+        for hits in dense_lists:
             for h in hits:
                 hit_id = h.get("id")
                 if hit_id not in all_hits or h.get("score", 0) > all_hits[hit_id].get("score", 0):
                     all_hits[hit_id] = h
+        ranked = sorted(all_hits.values(), key=lambda h: h.get("score", 0), reverse=True)
+
+        # [HYB] BM25 по тем же формулировкам и фильтру + RRF с плотным поиском.
+        # Чанк проходит порог по cosine (min_score) или по BM25 — не ниже
+        # bm25_min_rel от лучшего лексического совпадения.
+        bm25_floor = float("inf")
+        if HYBRID["enabled"]:
+            bm25 = lexical_index.get_index()
+            if bm25 is not None:
+                lexical_lists = [bm25.search(q, payload_filter, HYBRID["bm25_top_k"])
+                                 for q in queries]
+                best = max((h["score"] for hits in lexical_lists for h in hits), default=0.0)
+                bm25_floor = best * HYBRID["bm25_min_rel"] if best else float("inf")
+                ranked = lexical_index.rrf_fuse(dense_lists, lexical_lists)
 
         # [FIX-5]
         MAX_PER_SOURCE = _MAX_PER_SOURCE_OVERRIDE.get(section, 2)  # [З-6]
         _source_counts: dict = {}
         _diverse_all: list = []
-        for h in sorted(all_hits.values(), key=lambda h: h.get("score", 0), reverse=True):
-            if h.get("score", 0) < GENERATION["min_score"]:
+        for h in ranked:
+            if (h.get("score", 0) < GENERATION["min_score"]
+                    and h.get("bm25", 0) < bm25_floor):
                 continue
             src = h.get("payload", {}).get("source", "")
             if _source_counts.get(src, 0) < MAX_PER_SOURCE:
@@ -470,8 +568,10 @@ def retrieve(section: str, discipline: str, section_types: list = None,
                     key=lambda h: h.get("score", 0), reverse=True
                 )[:GENERATION["top_k"]]
 
+        _lexical_only = sum(1 for h in good_hits if h.get("bm25") and not h.get("score"))
         print(f"    🔍 RAG [{section}]: найдено {len(good_hits)} чанков "
-              f"(scores: {[round(h.get('score', 0), 3) for h in good_hits]})")
+              f"(scores: {[round(h.get('score', 0), 3) for h in good_hits]})"
+              + (f", только BM25: {_lexical_only}" if _lexical_only else ""))
 
         # Сборка контекста с метаданными источника
         seen_texts: set = set()
@@ -515,7 +615,8 @@ def retrieve(section: str, discipline: str, section_types: list = None,
             ctx = ctx[:MAX_CONTEXT_CHARS].rsplit("\n", 1)[0]
             ctx += "\n[...контекст обрезан до MAX_CONTEXT_CHARS символов...]"
 
-        RETRIEVE_CACHE[cache_key] = (ctx, good_hits)
+        with _state_lock:
+            RETRIEVE_CACHE[cache_key] = (ctx, good_hits)
         return ctx, good_hits
 
     except Exception as e:
@@ -523,36 +624,33 @@ def retrieve(section: str, discipline: str, section_types: list = None,
         return "", []
 
 
-def llm(prompt: str, max_tokens: int = 800) -> str:
-    for attempt in range(3):
-        try:
-            r = requests.post(OLLAMA["generate_url"],
-                json={
-                    "model": OLLAMA["llm_model"],
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.3,
-                        "num_predict": max_tokens,
-                        # [M] num_ctx=8192: mistral:7b поддерживает 8K контекст.
-                        # qwen2.5:3b требовал 4096 из-за OOM; 7B справляется на 8K.
-                        # При qwen2.5:14b можно оставить 8192 или поднять до 16384.
-                        "num_ctx": 8192,
-                    }
-                },
-                # [M] timeout=300: 7B-модель генерирует ~3–5×медленнее 3B.
-                # На CPU ~60–120 сек на раздел — запас до 300 сек достаточен.
-                timeout=300)
-            r.raise_for_status()
-            text = r.json().get("response", "")
-            if text:
-                time.sleep(3.0)   # [ЗАМЕЧАНИЕ] пауза между LLM-вызовами — снижает нагрев GPU
-                return clean(text)
-        except Exception as e:
-            if attempt == 2:
-                return f"[Ошибка: {e}]"
-            time.sleep(5)
-    return "[Ошибка: пустой ответ]"
+def llm(prompt: str, max_tokens: int = 800, section: str = "",
+        schema: dict | None = None, stop=None, model: str | None = None) -> str:
+    options = {
+        "temperature": 0.3,
+        "num_predict": max_tokens,
+        # [M] num_ctx=8192: mistral:7b поддерживает 8K контекст.
+        # qwen2.5:3b требовал 4096 из-за OOM; 7B справляется на 8K.
+        # При qwen2.5:14b можно оставить 8192 или поднять до 16384.
+        # [BUDGET] При llm_budget.enabled фактический num_ctx/num_predict
+        # подбирает llm_budget.adapt (num_predict — не больше указанного).
+        "num_ctx": 8192,
+    }
+    try:
+        # [STREAM] кэш, охлаждение, поток и досрочная остановка — llm_client
+        text, _ = llm_client.generate(
+            # [ROUTE] модель по метке секции (llm_routing), по умолчанию — основная
+            OLLAMA["generate_url"], model or llm_client.route(section, OLLAMA["llm_model"]),
+            prompt, options,
+            section=section, schema=schema, stop=stop,
+            # [M] timeout=300: 7B-модель генерирует ~3–5×медленнее 3B.
+            # На CPU ~60–120 сек на раздел — запас до 300 сек достаточен.
+            timeout=300)
+    except Exception as e:
+        return f"[Ошибка: {e}]"
+    if not text:
+        return "[Ошибка: пустой ответ]"
+    return clean(text)
 
 
 def _sanitize_retrieved_text(text: str) -> str:
@@ -612,12 +710,15 @@ def _apply_term_corrections(text: str) -> str:
 
 
 def gen(label: str, discipline: str, prompt: str,
-        direction: str = "", level: str = "", **extra) -> str:
+        direction: str = "", level: str = "", schema: dict | None = None,
+        model: str | None = None, **extra) -> str:
     """
     Генерация секции с RAG-контекстом.
 
     [R] При пустом retrieval добавляет явную инструкцию в промпт.
     [C] Сохраняет данные в _generation_log для последующей записи в JSON.
+    [SCHEMA] schema (по умолчанию SECTION_SCHEMAS[label]) — JSON-схема ответа.
+    [ROUTE] model (по умолчанию llm_client.route(label)) — модель Ollama.
     """
     section_types = SECTION_TYPE_FILTER.get(label)
     ctx, hits = retrieve(label, discipline, section_types, direction, level)
@@ -642,23 +743,32 @@ def gen(label: str, discipline: str, prompt: str,
     # [БАГ 5 ИСПРАВЛЕНО]
     fmt_vars = {"discipline": discipline, "direction": direction, "level": level, **extra}
     full_prompt = ctx_block + prompt.format(**fmt_vars) + f"\n\nСоздай для «{discipline}»:"
-    result = _apply_term_corrections(llm(full_prompt))
+    if schema is None:
+        schema = SECTION_SCHEMAS.get(label)
+    model = model or llm_client.route(label, OLLAMA["llm_model"])
+    result = _apply_term_corrections(llm(
+        full_prompt, section=label, schema=schema if _schema_active() else None,
+        # [STREAM] все секции — JSON: поток обрывается на закрытии массива
+        stop=llm_client.JsonStop(), model=model,
+    ))
 
     # [C] Логируем для generation_log.json
-    _generation_log[label] = {
-        "prompt_preview":   full_prompt[:600],
-        "retrieved_chunks": [
-            {
-                "id":           h.get("id"),
-                "source":       h.get("payload", {}).get("source", ""),
-                "score":        round(h.get("score", 0), 4),
-                "text_preview": h.get("payload", {}).get("text", "")[:120],
-            }
-            for h in hits
-        ],
-        "llm_response":     result,
-        "timestamp":        time.strftime("%Y-%m-%dT%H:%M:%S"),
-    }
+    with _state_lock:
+        _generation_log[label] = {
+            "prompt_preview":   full_prompt[:600],
+            "retrieved_chunks": [
+                {
+                    "id":           h.get("id"),
+                    "source":       h.get("payload", {}).get("source", ""),
+                    "score":        round(h.get("score", 0), 4),
+                    "text_preview": h.get("payload", {}).get("text", "")[:120],
+                }
+                for h in hits
+            ],
+            "llm_response":     result,
+            "model":            model,
+            "timestamp":        time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
 
     return result
 
@@ -1981,7 +2091,8 @@ def gen_bibliography(discipline: str, direction: str = "", level: str = "", cfg:
         main_entries = _custom_main
         print(f"    ✅ Библиография T15: из config.json (main_bibliography), "
               f"{len(main_entries)} записей")
-        _generation_log["bibliography_main_source"] = "config.json"
+        with _state_lock:
+            _generation_log["bibliography_main_source"] = "config.json"
     else:
         # [FIX-BIB-RAG]
         _rag_section_types = SECTION_TYPE_FILTER.get("bibliography_main", ["bibliography", "place"])
@@ -1992,7 +2103,8 @@ def gen_bibliography(discipline: str, direction: str = "", level: str = "", cfg:
             main_entries = _rag_entries
             print(f"    ✅ Библиография T15: из RAG-чанков напрямую, "
                   f"{len(main_entries)} записей (LLM не вызывался)")
-            _generation_log["bibliography_main_source"] = "rag_direct"
+            with _state_lock:
+                _generation_log["bibliography_main_source"] = "rag_direct"
         else:
             # Fallback: RAG не дал достаточно записей → LLM с фильтром галлюцинаций
             if _rag_entries:
@@ -2002,6 +2114,18 @@ def gen_bibliography(discipline: str, direction: str = "", level: str = "", cfg:
                 direction=direction, level=level,
             )
             llm_entries = parse_bibliography_json(raw_main)
+            # [ROUTE] Малая модель не дала разбираемого списка — повтор на основной
+            _bib_model = llm_client.escalation_model(
+                "bibliography_main", llm_client.route("bibliography_main", OLLAMA["llm_model"]),
+                OLLAMA["llm_model"],
+            ) if not llm_entries else None
+            if _bib_model:
+                llm_cache.discard_last()
+                raw_main = gen(
+                    "bibliography_main", discipline, PROMPTS["bibliography_main"],
+                    direction=direction, level=level, model=_bib_model,
+                )
+                llm_entries = parse_bibliography_json(raw_main)
 
             # Отфильтровываем записи с плейсхолдерами / галлюцинированными авторами
             if llm_entries:
@@ -2042,18 +2166,21 @@ def gen_bibliography(discipline: str, direction: str = "", level: str = "", cfg:
                     added = len(main_entries) - len(clean_entries)
                     suffix = f" + {added} из fallback" if added else ""
                     print(f"    ✅ Библиография T15: принято {len(clean_entries)} от LLM{suffix}")
-                    _generation_log["bibliography_main_source"] = "llm"
+                    with _state_lock:
+                        _generation_log["bibliography_main_source"] = "llm"
                 else:
-                    _generation_log["bibliography_main_source"] = "fallback"
-                    _generation_log["bibliography_main_fallback_reason"] = (
-                        f"LLM вернул {len(llm_entries)} записей, "
-                        f"из них {len(clean_entries)} без плейсхолдеров (нужно ≥1)"
-                    )
+                    with _state_lock:
+                        _generation_log["bibliography_main_source"] = "fallback"
+                        _generation_log["bibliography_main_fallback_reason"] = (
+                            f"LLM вернул {len(llm_entries)} записей, "
+                            f"из них {len(clean_entries)} без плейсхолдеров (нужно ≥1)"
+                        )
                     print(f"    ⚠️  Библиография T15: LLM вернул шаблонные записи → fallback")
                     main_entries = _make_fallback_main()
             else:
-                _generation_log["bibliography_main_source"] = "fallback"
-                _generation_log["bibliography_main_fallback_reason"] = "JSON не распарсился"
+                with _state_lock:
+                    _generation_log["bibliography_main_source"] = "fallback"
+                    _generation_log["bibliography_main_fallback_reason"] = "JSON не распарсился"
                 print(f"    ⚠️  Библиография T15: JSON не распарсился → fallback")
                 main_entries = _make_fallback_main()
 
@@ -2065,11 +2192,13 @@ def gen_bibliography(discipline: str, direction: str = "", level: str = "", cfg:
     if _custom_method and isinstance(_custom_method, list) and len(_custom_method) > 0:
         method_entries = _custom_method
         print("    ✅ Библиография T17: из config.json (method_bibliography)")
-        _generation_log["bibliography_method_source"] = "config.json"
+        with _state_lock:
+            _generation_log["bibliography_method_source"] = "config.json"
     else:
         method_entries = _make_fallback_method(discipline)
         print("    ✅ Библиография T17: используется fallback (реальные УГНТУ-пособия)")
-        _generation_log["bibliography_method_source"] = "fallback"
+        with _state_lock:
+            _generation_log["bibliography_method_source"] = "fallback"
 
     return main_entries, method_entries
 
@@ -2886,27 +3015,69 @@ PROMPTS = {
 }
 
 
+# [SCHEMA] JSON-схемы секций для Ollama "format" (constrained decoding, Ollama ≥0.5):
+# модель физически не может вернуть невалидный JSON или объект без нужных полей,
+# поэтому gen_with_json_retry почти не перегенерирует секции.
+def _array_schema(props: dict, min_items: int = 1) -> dict:
+    return {
+        "type": "array", "minItems": min_items,
+        "items": {"type": "object", "properties": props, "required": list(props)},
+    }
+
+
+_STR = {"type": "string"}
+_SECTION_ITEM = {"title": _STR, "section": {"type": "integer", "minimum": 1}}
+SECTION_SCHEMAS = {
+    "competencies":      _array_schema({"code": _STR, "desc": _STR}),
+    "outcomes":          _array_schema({"type": {"type": "string", "enum": ["З", "У", "В"]},
+                                        "text": _STR}, min_items=3),
+    "content":           _array_schema({"type": {"type": "string", "enum": ["section", "topic"]},
+                                        "label": _STR, "name": _STR}, min_items=2),
+    "lab_works":         _array_schema(_SECTION_ITEM, min_items=6),
+    "practice":          _array_schema(_SECTION_ITEM, min_items=6),
+    "bibliography_main": _array_schema({"type": _STR, "purpose": _STR, "desc": _STR,
+                                        "url": _STR, "coeff": _STR}, min_items=2),
+}
+# config.json: "llm_json_schema": false — старый Ollama без поддержки схем
+JSON_SCHEMA = {"enabled": True}
+
+
+def _schema_active() -> bool:
+    """Схемы включены в конфиге и не отклонены сервером (Ollama < 0.5)."""
+    return JSON_SCHEMA["enabled"] and llm_client.schema_supported(OLLAMA["generate_url"])
+
+
 # ---------------------------------------------------------------------------
 # [A] Обёртка генерации с JSON-retry
 # ---------------------------------------------------------------------------
 
 def gen_with_json_retry(label: str, discipline: str, prompt: str,
                         parser_json, parser_fallback, max_retries: int = 2,
-                        direction: str = "", level: str = "", **extra):
+                        direction: str = "", level: str = "",
+                        schema: dict | None = None, **extra):
     """
     [A] Генерирует секцию с JSON-валидацией и retry.
 
-    1. Вызывает gen() → LLM-ответ
+    1. Вызывает gen() → LLM-ответ (при JSON_SCHEMA — constrained по схеме секции)
     2. Пробует parser_json — если успех, возвращает (raw_text, parsed)
     3. При неудаче: до max_retries перегенераций
        без неё модель получает идентичный запрос и с высокой вероятностью
        даёт тот же невалидный ответ. Подсказка снижает число fallback'ов.
     4. Если JSON так и не распарсился — regex-fallback через parser_fallback
+
+    [SCHEMA] Число перегенераций и fallback — в _generation_log["json_parse"].
+    [ROUTE] Если секцию генерировала малая модель (llm_routing), перегенерации
+    идут на основной.
     """
-    raw = gen(label, discipline, prompt, direction=direction, level=level, **extra)
+    model = llm_client.route(label, OLLAMA["llm_model"])
+    raw = gen(label, discipline, prompt, direction=direction, level=level,
+              schema=schema, model=model, **extra)
     result = parser_json(raw)
     if result is not None:
+        _log_json_parse(label, 0, False, model)
         return raw, result
+    llm_cache.discard_last()   # [LLMC] невалидный ответ не должен вернуться из кэша
+    model = llm_client.escalation_model(label, model, OLLAMA["llm_model"]) or model
 
     # [FIX-3]
     RETRY_HINT = (
@@ -2914,24 +3085,90 @@ def gen_with_json_retry(label: str, discipline: str, prompt: str,
         "Верни ТОЛЬКО валидный JSON-массив — никакого текста до или после.\n"
         "Никаких ```json``` блоков. Никаких пояснений. Только [...]\n"
     )
-    retry_prompt = RETRY_HINT + prompt
+    # [PREFIX] Подсказка — в конце: контекст и промпт секции остаются общим
+    # префиксом с первой попыткой, и Ollama не пересчитывает их prompt eval
+    retry_prompt = prompt + RETRY_HINT
 
     for attempt in range(max_retries):
         print(f"  🔄 [{label}] JSON не распарсился (попытка {attempt + 1}/{max_retries}), "
               f"перегенерация...")
-        raw = gen(label, discipline, retry_prompt, direction=direction, level=level, **extra)
+        raw = gen(label, discipline, retry_prompt, direction=direction, level=level,
+                  schema=schema, model=model, **extra)
         result = parser_json(raw)
         if result is not None:
+            _log_json_parse(label, attempt + 1, False, model)
             return raw, result
+        llm_cache.discard_last()
 
     print(f"  ⚠️  [{label}] JSON недоступен после {max_retries} попыток — regex-fallback")
+    _log_json_parse(label, max_retries, True, model)
     return raw, parser_fallback(raw)
 
 
+def _log_json_parse(label: str, retries: int, fallback: bool, model: str) -> None:
+    with _state_lock:
+        _generation_log.setdefault("json_parse", {})[label] = {
+            "retries":  retries,
+            "fallback": fallback,
+            "schema":   _schema_active(),
+            "model":    model,   # [ROUTE] модель последней попытки
+        }
+
+
 # ---------------------------------------------------------------------------
 # Точка входа
 # ---------------------------------------------------------------------------
 
+def _run_dag(tasks: dict, workers: int = 1) -> dict:
+    """
+    [DAG] Выполняет задачи с зависимостями в пуле из workers потоков.
+
+    tasks: имя → (имена зависимостей, fn(done)), где done — словарь уже
+    готовых результатов. Готовые к запуску задачи берутся в порядке tasks,
+    поэтому при workers=1 порядок совпадает с последовательной генерацией.
+    Исключение задачи пробрасывается наружу. Время каждой задачи и общее —
+    в _generation_log["schedule"]: при параллельном запуске общее ≈ самый
+    длинный путь графа, а не сумма секций.
+    """
+    done: dict = {}
+    timing: dict = {}
+    pending = dict(tasks)
+    running: dict = {}   # Future → имя
+    t0 = time.perf_counter()
+
+    def _timed(name, fn):
+        start = time.perf_counter()
+        try:
+            return fn(done)
+        finally:
+            timing[name] = {"start": round(start - t0, 2),
+                            "end":   round(time.perf_counter() - t0, 2)}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="gen") as pool:
+        while pending or running:
+            for name, (deps, fn) in list(pending.items()):
+                if len(running) >= max(1, workers):
+                    break
+                if all(d in done for d in deps):
+                    running[pool.submit(_timed, name, fn)] = name
+                    del pending[name]
+            if not running:
+                raise RuntimeError(f"Неразрешимые зависимости: {sorted(pending)}")
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                done[running.pop(fut)] = fut.result()
+
+    total = time.perf_counter() - t0
+    serial = sum(t["end"] - t["start"] for t in timing.values())
+    with _state_lock:
+        _generation_log["schedule"] = {"workers": workers, "total_s": round(total, 2),
+                                       "sections": timing}
+    if workers > 1:
+        print(f"  ⏩ Секции: {total:.1f}с при {workers} потоках "
+              f"(последовательно ≈ {serial:.1f}с)")
+    return done
+
+
 def main(config_path: Optional[str] = None, clear_cache: bool = False):
     if config_path is None and os.path.exists("config.json"):
         config_path = "config.json"
@@ -2966,12 +3203,37 @@ def main(config_path: Optional[str] = None, clear_cache: bool = False):
     if "retrieval_min_score" in cfg:
         GENERATION["min_score"] = float(cfg["retrieval_min_score"])
 
+    # [LOCAL] Бэкенд поиска: Qdrant (по умолчанию) или local_index.py
+    SEARCH_BACKEND.update(local_index.backend_from_config(cfg))
+    # [HYB]
+    HYBRID["enabled"] = bool(cfg.get("retrieval_hybrid", HYBRID["enabled"]))
+    # [DAG]
+    LLM_PARALLEL["workers"] = max(1, int(cfg.get("llm_parallel", LLM_PARALLEL["workers"])))
+    http_client.configure_pool(LLM_PARALLEL["workers"] + PREFETCH_WORKERS)
+    # [GOV]
+    llm_governor.configure(cfg.get("llm_throttle"))
+    # [LLMC]
+    llm_cache.configure(cfg.get("llm_cache"))
+    # [SCHEMA]
+    JSON_SCHEMA["enabled"] = bool(cfg.get("llm_json_schema", JSON_SCHEMA["enabled"]))
+    # [STREAM]
+    llm_client.STREAM["enabled"] = bool(cfg.get("llm_stream", llm_client.STREAM["enabled"]))
+    # [PREFIX]
+    llm_client.KEEP_ALIVE["value"] = cfg.get("llm_keep_alive", llm_client.KEEP_ALIVE["value"])
+    # [BUDGET]
+    llm_budget.configure(cfg.get("llm_budget"))
+    # [ROUTE]
+    llm_client.ROUTING.update(cfg.get("llm_routing", {}))
+
     # [З-G6]
     global _RETRIEVAL_CONF_HASH
     _RETRIEVAL_CONF_HASH = _make_retrieval_conf_hash(
         GENERATION["top_k"], GENERATION["min_score"]
     )
 
+    # [PF] Retrieval всех секций — в фоне, параллельно с генерацией
+    prefetch_sections(discipline, direction, level)
+
     hours = {
         "lecture":  cfg.get("hours_lecture",  12),
         "practice": cfg.get("hours_practice", 36),
@@ -3003,7 +3265,8 @@ def main(config_path: Optional[str] = None, clear_cache: bool = False):
 
     # Проверка Ollama
     try:
-        requests.get("http://localhost:11434/api/tags", timeout=5).raise_for_status()
+        http_client.get("http://localhost:11434/api/tags", endpoint="ollama.tags",
+                        timeout=5).raise_for_status()
         print("✅ Ollama доступен")
     except Exception as e:
         print(f"❌ Ollama недоступен: {e}")
@@ -3040,197 +3303,244 @@ def main(config_path: Optional[str] = None, clear_cache: bool = False):
 
     raw: dict = {}
 
-    # --- Шаг 1: компетенции и результаты обучения ---
-    # [FIX-FGOS-2] Компетенции берутся из fgos/<direction_code>.json.
-    # Fallback 1: fgos_competencies в config.json (обратная совместимость).
-    # Fallback 2: LLM-генерация.
-    _direction_code = direction.split()[0]  # "09.03.01 Информатика..." → "09.03.01"
-    _fgos_path = Path("fgos") / f"{_direction_code}.json"
-    if _fgos_path.exists():
-        try:
-            _fgos = {k: v for k, v in json.loads(_fgos_path.read_text(encoding="utf-8")).items()
-                     if not k.startswith("_")}
-            print(f"  ✅ [FGOS] Загружен файл: {_fgos_path}")
-        except Exception as _e:
-            print(f"  ⚠️  [FGOS] Ошибка чтения {_fgos_path}: {_e} — fallback config.json")
+    # [DAG] Секции генерируются по графу зависимостей (_run_dag): content
+    # ждёт competencies (competencies_summary), lab_works/practice — content
+    # (sections_list); outcomes и библиография независимы. При llm_parallel > 1
+    # независимые секции идут в Ollama одновременно (OLLAMA_NUM_PARALLEL).
+    def _step_competencies(_done: dict):
+        # --- Шаг 1: компетенции и результаты обучения ---
+        # [FIX-FGOS-2] Компетенции берутся из fgos/<direction_code>.json.
+        # Fallback 1: fgos_competencies в config.json (обратная совместимость).
+        # Fallback 2: LLM-генерация.
+        _direction_code = direction.split()[0]  # "09.03.01 Информатика..." → "09.03.01"
+        _fgos_path = Path("fgos") / f"{_direction_code}.json"
+        if _fgos_path.exists():
+            try:
+                _fgos = {k: v for k, v in json.loads(_fgos_path.read_text(encoding="utf-8")).items()
+                         if not k.startswith("_")}
+                print(f"  ✅ [FGOS] Загружен файл: {_fgos_path}")
+            except Exception as _e:
+                print(f"  ⚠️  [FGOS] Ошибка чтения {_fgos_path}: {_e} — fallback config.json")
+                _fgos = cfg.get("fgos_competencies", {})
+        else:
             _fgos = cfg.get("fgos_competencies", {})
-    else:
-        _fgos = cfg.get("fgos_competencies", {})
-        if _fgos:
-            print(f"  ℹ️  [FGOS] Файл {_fgos_path} не найден — используется fgos_competencies из config.json")
+            if _fgos:
+                print(f"  ℹ️  [FGOS] Файл {_fgos_path} не найден — используется fgos_competencies из config.json")
+            else:
+                print(f"  ⚠️  [FGOS] Файл {_fgos_path} не найден и fgos_competencies пуст — генерирую LLM")
+        if _fgos and isinstance(_fgos, dict):
+            competencies = [
+                (code, _fgos[code])
+                for code in codes_list
+                if code in _fgos
+            ]
+            # Коды из competency_codes без записи в fgos_competencies — генерируем LLM
+            _missing_codes = [c for c in codes_list if c not in _fgos]
+            if _missing_codes:
+                print(f"  ⚠️  [FGOS] Коды не найдены в fgos_competencies: {_missing_codes} — генерирую LLM")
+                _missing_str = ", ".join(_missing_codes)
+                _miss_vars = {**base_vars,
+                              "competency_codes": _missing_str,
+                              "competency_codes_numbered": "\n".join(f"{i+1}. {c}" for i, c in enumerate(_missing_codes)),
+                              "competency_count": len(_missing_codes)}
+                _, _extra = gen_with_json_retry(
+                    "competencies", discipline, PROMPTS["competencies"],
+                    parser_json=lambda t: parse_competencies_json(t),
+                    parser_fallback=lambda t: parse_competencies(t, codes=_missing_codes),
+                    direction=direction, level=level, **_miss_vars
+                )
+                competencies += _extra
+            raw["competencies"] = json.dumps(
+                [{"code": c, "desc": d} for c, d in competencies], ensure_ascii=False
+            )
+            print(f"  ✅ [FGOS] Компетенции из fgos_competencies: {[c for c, _ in competencies]}")
+            with _state_lock:
+                _generation_log["competencies_source"] = "fgos_competencies (config.json)"
         else:
-            print(f"  ⚠️  [FGOS] Файл {_fgos_path} не найден и fgos_competencies пуст — генерирую LLM")
-    if _fgos and isinstance(_fgos, dict):
-        competencies = [
-            (code, _fgos[code])
-            for code in codes_list
-            if code in _fgos
-        ]
-        # Коды из competency_codes без записи в fgos_competencies — генерируем LLM
-        _missing_codes = [c for c in codes_list if c not in _fgos]
-        if _missing_codes:
-            print(f"  ⚠️  [FGOS] Коды не найдены в fgos_competencies: {_missing_codes} — генерирую LLM")
-            _missing_str = ", ".join(_missing_codes)
-            _miss_vars = {**base_vars,
-                          "competency_codes": _missing_str,
-                          "competency_codes_numbered": "\n".join(f"{i+1}. {c}" for i, c in enumerate(_missing_codes)),
-                          "competency_count": len(_missing_codes)}
-            _, _extra = gen_with_json_retry(
+            raw["competencies"], competencies = gen_with_json_retry(
                 "competencies", discipline, PROMPTS["competencies"],
                 parser_json=lambda t: parse_competencies_json(t),
-                parser_fallback=lambda t: parse_competencies(t, codes=_missing_codes),
-                direction=direction, level=level, **_miss_vars
+                parser_fallback=lambda t: parse_competencies(t, codes=codes_list),
+                direction=direction, level=level, **base_vars
             )
-            competencies += _extra
-        raw["competencies"] = json.dumps(
-            [{"code": c, "desc": d} for c, d in competencies], ensure_ascii=False
+            with _state_lock:
+                _generation_log["competencies_source"] = "llm"
+        return competencies
+
+    def _step_outcomes(_done: dict):
+        raw["outcomes"], outcomes = gen_with_json_retry(
+            "outcomes", discipline, PROMPTS["outcomes"],
+            # [FIX-02]
+            parser_json=lambda t: parse_outcomes_json(t, required_count=len(codes_list) * 3),
+            parser_fallback=parse_outcomes_json,
+            direction=direction, level=level,
+            # [SCHEMA] минимум по 3 результата на компетенцию — как в parser_json
+            schema=_array_schema(SECTION_SCHEMAS["outcomes"]["items"]["properties"],
+                                 min_items=len(codes_list) * 3),
+            **base_vars
         )
-        print(f"  ✅ [FGOS] Компетенции из fgos_competencies: {[c for c, _ in competencies]}")
-        _generation_log["competencies_source"] = "fgos_competencies (config.json)"
-    else:
-        raw["competencies"], competencies = gen_with_json_retry(
-            "competencies", discipline, PROMPTS["competencies"],
-            parser_json=lambda t: parse_competencies_json(t),
-            parser_fallback=lambda t: parse_competencies(t, codes=codes_list),
-            direction=direction, level=level, **base_vars
+        # [FIX-#6] Снимаем дубли после парсинга
+        outcomes = _dedup_outcomes(outcomes)
+        return outcomes
+
+    def _step_content(_done: dict):
+        competencies = _done["competencies"]
+        # --- Шаг 2: обновляем competencies_summary и перегенерируем разделы ---
+        comp_summary = "; ".join(f"{c[0]}: {c[1][:60]}" for c in competencies[:5])
+        content_vars = {**base_vars, "competencies_summary": comp_summary}
+
+        raw["content"], topics = gen_with_json_retry(
+            "content", discipline, PROMPTS["content"],
+            parser_json=parse_topics_json,
+            parser_fallback=parse_topics,
+            direction=direction, level=level, **content_vars
         )
-        _generation_log["competencies_source"] = "llm"
-
-    raw["outcomes"], outcomes = gen_with_json_retry(
-        "outcomes", discipline, PROMPTS["outcomes"],
-        # [FIX-02]
-        parser_json=lambda t: parse_outcomes_json(t, required_count=len(codes_list) * 3),
-        parser_fallback=parse_outcomes_json,
-        direction=direction, level=level, **base_vars
-    )
-    # [FIX-#6] Снимаем дубли после парсинга
-    outcomes = _dedup_outcomes(outcomes)
-
-    # --- Шаг 2: обновляем competencies_summary и перегенерируем разделы ---
-    comp_summary = "; ".join(f"{c[0]}: {c[1][:60]}" for c in competencies[:5])
-    content_vars = {**base_vars, "competencies_summary": comp_summary}
-
-    raw["content"], topics = gen_with_json_retry(
-        "content", discipline, PROMPTS["content"],
-        parser_json=parse_topics_json,
-        parser_fallback=parse_topics,
-        direction=direction, level=level, **content_vars
-    )
 
-    # [FIX-2]
-    # [FIX-DRIFT]
-    _ONIR_KW = {
-        "научно-исследовательск", "этапы научного", "методологии научных",
-        "исследований в России", "научного исследования", "нирс",
-    }
-    _sections_found = [t for t in topics if re.match(r"^Раздел\s*\d+", t)]
-    _is_domain_drift = any(
-        any(kw in t.lower() for kw in _ONIR_KW) for t in _sections_found
-    )
-    if len(_sections_found) < 2 or _is_domain_drift:
-        _reason = "domain drift (ОНИР)" if _is_domain_drift else f"Разделов найдено: {len(_sections_found)}"
-        print(f"  ⚠️  [content] {_reason} — структурный fallback")
-        # Строим осмысленный fallback на основе компетенций
-        _comp_keywords = " ".join(c[1][:40] for c in competencies[:3]).lower()
-        _has_neuro  = any(w in _comp_keywords for w in ("нейр", "сеть", "deep"))
-        _has_fuzzy  = any(w in _comp_keywords for w in ("нечётк", "fuzzy", "логик"))
-        _has_optim  = any(w in _comp_keywords for w in ("оптим", "алгорит", "эволюц"))
-        _has_manage = any(w in _comp_keywords for w in ("управл", "регулят", "систем"))
-
-        if _has_fuzzy:
-            topics = [
-                f"Раздел 1. Теоретические основы {discipline}",
-                f"Тема 1.1. Математический аппарат нечётких множеств",
-                f"Тема 1.2. Архитектуры нечётких систем",
-                f"Раздел 2. Методы нечёткого вывода",
-                f"Тема 2.1. Системы Мамдани и Сугено",
-                f"Тема 2.2. Нейро-нечёткие системы ANFIS",
-                f"Раздел 3. Применение {discipline}",
-                f"Тема 3.1. Синтез нечётких регуляторов",
-                f"Тема 3.2. Оценка эффективности систем",
-            ]
-        elif _has_neuro:
-            topics = [
-                f"Раздел 1. Архитектуры нейронных сетей",
-                f"Тема 1.1. Многослойные перцептроны и обратное распространение",
-                f"Тема 1.2. Сверточные и рекуррентные сети",
-                f"Раздел 2. Обучение и оптимизация нейронных сетей",
-                f"Тема 2.1. Алгоритмы оптимизации и регуляризация",
-                f"Тема 2.2. Трансферное обучение и тонкая настройка",
-                f"Раздел 3. Применение нейронных сетей",
-                f"Тема 3.1. Задачи классификации и регрессии",
-                f"Тема 3.2. Оценка качества и развёртывание моделей",
-            ]
-        elif _has_manage:
-            topics = [
-                f"Раздел 1. Основы интеллектуального управления",
-                f"Тема 1.1. Классификация и архитектуры ИСУ",
-                f"Тема 1.2. Адаптивное управление",
-                f"Раздел 2. Методы синтеза интеллектуальных регуляторов",
-                f"Тема 2.1. Нейросетевые и нечёткие регуляторы",
-                f"Тема 2.2. Обучение с подкреплением в управлении",
-                f"Раздел 3. Применение {discipline}",
-                f"Тема 3.1. Моделирование и верификация",
-                f"Тема 3.2. Сравнительный анализ методов",
-            ]
-        else:
-            topics = [
-                f"Раздел 1. Теоретические основы {discipline}",
-                f"Тема 1.1. Основные понятия и методы",
-                f"Тема 1.2. Архитектуры и инструменты",
-                f"Раздел 2. Алгоритмическая база {discipline}",
-                f"Тема 2.1. Ключевые алгоритмы и их реализация",
-                f"Тема 2.2. Оптимизация и настройка систем",
-                f"Раздел 3. Применение {discipline}",
-                f"Тема 3.1. Прикладные задачи дисциплины",
-                f"Тема 3.2. Оценка эффективности и верификация",
-            ]
+        # [FIX-2]
+        # [FIX-DRIFT]
+        _ONIR_KW = {
+            "научно-исследовательск", "этапы научного", "методологии научных",
+            "исследований в России", "научного исследования", "нирс",
+        }
         _sections_found = [t for t in topics if re.match(r"^Раздел\s*\d+", t)]
-        print(f"  ℹ️  Создано {len(_sections_found)} разделов из fallback")
-
-    # [Фикс №9] Каждый раздел должен иметь хотя бы 1 тему (ОДНОКРАТНАЯ ПРОВЕРКА).
-    # Если LLM вернул только разделы без тем — добавляем базовые подтемы,
-    # иначе fill_lectures_table / fill_t21_fos получат пустой список topics_only.
-    _secs_in_topics   = [t for t in topics if re.match(r"^Раздел\s*\d+", t)]
-    _topics_in_topics = [t for t in topics if re.match(r"^Тема\s*[\d\.]+", t)]
-    if _secs_in_topics and not _topics_in_topics:
-        print(f"  ⚠️  [content] Темы внутри разделов отсутствуют — добавляю базовые")
-        enriched: list = []
-        for i, sec in enumerate(_secs_in_topics, 1):
-            enriched.append(sec)
-            enriched.append(f"Тема {i}.1. Теоретические основы")
-            enriched.append(f"Тема {i}.2. Практическое применение")
-        topics = enriched
-
-    # [Фикс №5+6] sections_list передаётся в промпты ЛР/ПЗ — LLM указывает
-    # номер раздела явно, а не определяется по ротации в fill_lab/practice_table.
-    _secs = [t for t in topics if re.match(r"^Раздел\s*\d+", t)]
-    _SEC_PREFIX = re.compile(r"^Раздел\s*\d+[.\s]+")
-    _sections_list_str = "\n".join(
-        "{0}. {1}".format(i + 1, _SEC_PREFIX.sub("", s).strip())
-        for i, s in enumerate(_secs)
-    ) or "1. Теоретические основы\n2. Методы\n3. Применение"
-    content_vars = {**content_vars, "sections_list": _sections_list_str}
-
-    raw["lab_works"], lab_works = gen_with_json_retry(
-        "lab_works", discipline, PROMPTS["lab_works"],
-        parser_json=lambda t: parse_list_json_with_section(t, min_items=6),
-        parser_fallback=lambda t: [{"title": x, "section": None} for x in parse_list(t, discipline)],
-        direction=direction, level=level, **content_vars
-    )
-    lab_works = _normalize_section_assignment(lab_works, len(_secs))
-
-    raw["practice"], practices = gen_with_json_retry(
-        "practice", discipline, PROMPTS["practice"],
-        parser_json=lambda t: parse_list_json_with_section(t, min_items=6),
-        parser_fallback=lambda t: [{"title": x, "section": None} for x in parse_list(t, discipline)],
-        direction=direction, level=level, **content_vars
-    )
-    practices = _normalize_section_assignment(practices, len(_secs))
-
-    # --- Шаг 3: библиография ---
-    print("  📚 Генерация библиографии...")
-    bib_main, bib_method = gen_bibliography(discipline, direction, level, cfg=cfg)
+        _is_domain_drift = any(
+            any(kw in t.lower() for kw in _ONIR_KW) for t in _sections_found
+        )
+        if len(_sections_found) < 2 or _is_domain_drift:
+            _reason = "domain drift (ОНИР)" if _is_domain_drift else f"Разделов найдено: {len(_sections_found)}"
+            print(f"  ⚠️  [content] {_reason} — структурный fallback")
+            # Строим осмысленный fallback на основе компетенций
+            _comp_keywords = " ".join(c[1][:40] for c in competencies[:3]).lower()
+            _has_neuro  = any(w in _comp_keywords for w in ("нейр", "сеть", "deep"))
+            _has_fuzzy  = any(w in _comp_keywords for w in ("нечётк", "fuzzy", "логик"))
+            _has_optim  = any(w in _comp_keywords for w in ("оптим", "алгорит", "эволюц"))
+            _has_manage = any(w in _comp_keywords for w in ("управл", "регулят", "систем"))
+
+            if _has_fuzzy:
+                topics = [
+                    f"Раздел 1. Теоретические основы {discipline}",
+                    f"Тема 1.1. Математический аппарат нечётких множеств",
+                    f"Тема 1.2. Архитектуры нечётких систем",
+                    f"Раздел 2. Методы нечёткого вывода",
+                    f"Тема 2.1. Системы Мамдани и Сугено",
+                    f"Тема 2.2. Нейро-нечёткие системы ANFIS",
+                    f"Раздел 3. Применение {discipline}",
+                    f"Тема 3.1. Синтез нечётких регуляторов",
+                    f"Тема 3.2. Оценка эффективности систем",
+                ]
+            elif _has_neuro:
+                topics = [
+                    f"Раздел 1. Архитектуры нейронных сетей",
+                    f"Тема 1.1. Многослойные перцептроны и обратное распространение",
+                    f"Тема 1.2. Сверточные и рекуррентные сети",
+                    f"Раздел 2. Обучение и оптимизация нейронных сетей",
+                    f"Тема 2.1. Алгоритмы оптимизации и регуляризация",
+                    f"Тема 2.2. Трансферное обучение и тонкая настройка",
+                    f"Раздел 3. Применение нейронных сетей",
+                    f"Тема 3.1. Задачи классификации и регрессии",
+                    f"Тема 3.2. Оценка качества и развёртывание моделей",
+                ]
+            elif _has_manage:
+                topics = [
+                    f"Раздел 1. Основы интеллектуального управления",
+                    f"Тема 1.1. Классификация и архитектуры ИСУ",
+                    f"Тема 1.2. Адаптивное управление",
+                    f"Раздел 2. Методы синтеза интеллектуальных регуляторов",
+                    f"Тема 2.1. Нейросетевые и нечёткие регуляторы",
+                    f"Тема 2.2. Обучение с подкреплением в управлении",
+                    f"Раздел 3. Применение {discipline}",
+                    f"Тема 3.1. Моделирование и верификация",
+                    f"Тема 3.2. Сравнительный анализ методов",
+                ]
+            else:
+                topics = [
+                    f"Раздел 1. Теоретические основы {discipline}",
+                    f"Тема 1.1. Основные понятия и методы",
+                    f"Тема 1.2. Архитектуры и инструменты",
+                    f"Раздел 2. Алгоритмическая база {discipline}",
+                    f"Тема 2.1. Ключевые алгоритмы и их реализация",
+                    f"Тема 2.2. Оптимизация и настройка систем",
+                    f"Раздел 3. Применение {discipline}",
+                    f"Тема 3.1. Прикладные задачи дисциплины",
+                    f"Тема 3.2. Оценка эффективности и верификация",
+                ]
+            _sections_found = [t for t in topics if re.match(r"^Раздел\s*\d+", t)]
+            print(f"  ℹ️  Создано {len(_sections_found)} разделов из fallback")
+
+        # [Фикс №9] Каждый раздел должен иметь хотя бы 1 тему (ОДНОКРАТНАЯ ПРОВЕРКА).
+        # Если LLM вернул только разделы без тем — добавляем базовые подтемы,
+        # иначе fill_lectures_table / fill_t21_fos получат пустой список topics_only.
+        _secs_in_topics   = [t for t in topics if re.match(r"^Раздел\s*\d+", t)]
+        _topics_in_topics = [t for t in topics if re.match(r"^Тема\s*[\d\.]+", t)]
+        if _secs_in_topics and not _topics_in_topics:
+            print(f"  ⚠️  [content] Темы внутри разделов отсутствуют — добавляю базовые")
+            enriched: list = []
+            for i, sec in enumerate(_secs_in_topics, 1):
+                enriched.append(sec)
+                enriched.append(f"Тема {i}.1. Теоретические основы")
+                enriched.append(f"Тема {i}.2. Практическое применение")
+            topics = enriched
+
+        # [Фикс №5+6] sections_list передаётся в промпты ЛР/ПЗ — LLM указывает
+        # номер раздела явно, а не определяется по ротации в fill_lab/practice_table.
+        _secs = [t for t in topics if re.match(r"^Раздел\s*\d+", t)]
+        _SEC_PREFIX = re.compile(r"^Раздел\s*\d+[.\s]+")
+        _sections_list_str = "\n".join(
+            "{0}. {1}".format(i + 1, _SEC_PREFIX.sub("", s).strip())
+            for i, s in enumerate(_secs)
+        ) or "1. Теоретические основы\n2. Методы\n3. Применение"
+        content_vars = {**content_vars, "sections_list": _sections_list_str}
+        return topics, _secs, content_vars
+
+    def _step_lab_works(_done: dict):
+        topics, _secs, content_vars = _done["content"]
+        raw["lab_works"], lab_works = gen_with_json_retry(
+            "lab_works", discipline, PROMPTS["lab_works"],
+            parser_json=lambda t: parse_list_json_with_section(t, min_items=6),
+            parser_fallback=lambda t: [{"title": x, "section": None} for x in parse_list(t, discipline)],
+            direction=direction, level=level, **content_vars
+        )
+        lab_works = _normalize_section_assignment(lab_works, len(_secs))
+        return lab_works
+
+    def _step_practice(_done: dict):
+        topics, _secs, content_vars = _done["content"]
+        raw["practice"], practices = gen_with_json_retry(
+            "practice", discipline, PROMPTS["practice"],
+            parser_json=lambda t: parse_list_json_with_section(t, min_items=6),
+            parser_fallback=lambda t: [{"title": x, "section": None} for x in parse_list(t, discipline)],
+            direction=direction, level=level, **content_vars
+        )
+        practices = _normalize_section_assignment(practices, len(_secs))
+        return practices
+
+    def _step_bibliography(_done: dict):
+        # --- Шаг 3: библиография ---
+        print("  📚 Генерация библиографии...")
+        bib_main, bib_method = gen_bibliography(discipline, direction, level, cfg=cfg)
+        return bib_main, bib_method
+
+    _results = _run_dag({
+        "competencies": ((),                _step_competencies),
+        "outcomes":     ((),                _step_outcomes),
+        "content":      (("competencies",), _step_content),
+        "lab_works":    (("content",),      _step_lab_works),
+        "practice":     (("content",),      _step_practice),
+        "bibliography": ((),                _step_bibliography),
+    }, workers=LLM_PARALLEL["workers"])
+    competencies         = _results["competencies"]
+    outcomes             = _results["outcomes"]
+    topics, _secs, _     = _results["content"]
+    lab_works            = _results["lab_works"]
+    practices            = _results["practice"]
+    bib_main, bib_method = _results["bibliography"]
+
+    # [SCHEMA] Сколько секций потребовали перегенерации / regex-fallback
+    _json_parse = _generation_log.get("json_parse", {})
+    print(f"\n🧩 JSON ({'схема' if _schema_active() else 'без схемы'}): "
+          f"перегенераций {sum(v['retries'] for v in _json_parse.values())}, "
+          f"regex-fallback {sum(v['fallback'] for v in _json_parse.values())} "
+          f"из {len(_json_parse)} секций")
 
     # --- [D] Валидация ---
     validation_warnings = validate_generation(
@@ -3306,8 +3616,21 @@ def main(config_path: Optional[str] = None, clear_cache: bool = False):
 
     # [З-R5]
     _save_cache()
+    http_client.print_http_stats()  # [HTTP]
+    llm_governor.print_stats()      # [GOV]
+    llm_cache.save()                # [LLMC] вытеснение по max_entries/max_age_days
+    llm_cache.print_stats()
+    llm_client.print_stats()        # [STREAM]
+    llm_client.print_telemetry()    # [TELEM]
+    llm_budget.save()               # [BUDGET] история длин ответов — llm_budget.json
+    llm_budget.print_stats()
 
     # [C] Сохраняем лог генерации
+    _generation_log["llm_throttle"] = llm_governor.stats()   # [GOV]
+    _generation_log["llm_telemetry"] = llm_client.telemetry()   # [TELEM]
+    for _label, _jp in _generation_log.get("json_parse", {}).items():
+        if _label in _generation_log["llm_telemetry"]:
+            _generation_log["llm_telemetry"][_label]["json_retries"] = _jp["retries"]
     try:
         with open(GENERATION_LOG, "w", encoding="utf-8") as f:
             json.dump(_generation_log, f, ensure_ascii=False, indent=2)
@@ -18,26 +18,48 @@ test_generate.py — генерация тестовых заданий (ФОС)
     python test_generate.py --section 1        # только раздел 1
     python test_generate.py --no-rag           # без Qdrant (offline-режим)
     python test_generate.py --questions-per-rank 15  # 15 вопросов на ранг
+    python test_generate.py --seed 7           # другой seed генерации/перемешивания
+    python test_generate.py --resume           # продолжить после падения/таймаута
 
 Выходные файлы:
     output_tests.docx      — тесты в ГОСТ-формате
     coverage_report.json   — покрытие компетенций
-    test_cache.json        — кэш эмбеддингов/retrieval
+    test_cache.json        — кэш retrieval (эмбеддинги — в общем embed_store/)
+    test_checkpoint.jsonl  — ответы LLM по заданиям для --resume
+    question_bank.sqlite3  — банк вопросов между прогонами и дисциплинами
 """
 
 import argparse
 import json
+import math
 import random
 import re
 import sys
+import threading
 import time
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 
-import requests
+# [HTTP] keep-alive пул, единый retry, однократное определение API Qdrant
+import http_client
+# [GOV] Охлаждение GPU по политике config.json["llm_throttle"] вместо sleep
+import llm_governor
+# [LLMC] Персистентный кэш ответов LLM (llm_cache.jsonl)
+import llm_cache
+# [STREAM] Общий вызов /api/generate: поток, досрочная остановка, TTFT
+import llm_client
+# [BUDGET] Адаптивные num_ctx/num_predict по длине промпта и истории ответов
+import llm_budget
+# [LSH] Почти-дубликаты вопросов за линейное время (MinHash + LSH)
+import near_dup
+# [BANK] Банк вопросов между прогонами (question_bank.sqlite3)
+import question_bank
+# [LOCAL] Встроенный бэкенд поиска (config.json: retrieval_backend = "local")
+import local_index
 # [FIX-#18]
-from utils import get_embedding as _embed_raw
+from utils import get_embeddings_cached as _embed_cached, import_legacy_embed_cache, get_embed_store
 from docx import Document
 from docx.shared import Pt, RGBColor, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
@@ -50,8 +72,12 @@ RPD_PATH     = Path("output_rpd.docx")
 OUTPUT_DOCX  = "output_tests.docx"
 COVERAGE_LOG = "coverage_report.json"
 _CACHE_FILE  = "test_cache.json"
+CHECKPOINT_FILE = "test_checkpoint.jsonl"   # [RESUME] ответы LLM по заданиям
 
 QDRANT = {"url": "http://localhost:6333", "collection": "rpd_rag"}
+# [LOCAL] "qdrant" — HTTP к Qdrant; "local"/"ann" — local_index.py (точный/IVF)
+SEARCH_BACKEND = {"backend": "qdrant", "index_dir": local_index.INDEX_DIR,
+                  "nprobe": local_index.DEFAULT_NPROBE}
 OLLAMA = {
     "embed_url":    "http://localhost:11434/api/embed",
     "generate_url": "http://localhost:11434/api/generate",
@@ -61,6 +87,7 @@ OLLAMA = {
     # num_ctx: уменьшен с 8192 → 4096 (меньше VRAM, промпты редко превышают 3k токенов)
     # num_gpu: кол-во слоёв на GPU (qwen2.5:14b ≈ 48 слоёв);
     #          уменьшите до 20–30 если GPU всё равно греется сильно
+    # [BUDGET] при llm_budget.enabled num_ctx подбирается по длине промпта
     "num_ctx": 4096,
     "num_gpu": 30,   # 48 = все слои на GPU (без изменений); снизьте для охлаждения
 }
@@ -68,7 +95,11 @@ OLLAMA = {
 GENERATION = {
     "top_k":     6,
     "min_score": 0.40,
+    "seed":      42,    # [PAR] seed Ollama и перемешивания вариантов (--seed)
 }
+# [PAR] Заданий (раздел, ранг, тема) одновременно в Ollama (config.json:
+# "llm_parallel", общий с rpd_generate); 1 — последовательно
+LLM_PARALLEL = {"workers": 1}
 
 MAX_CONTEXT_CHARS = 4000   # меньше, чем в rpd_generate — промпт для тестов длиннее
 
@@ -84,6 +115,16 @@ MIN_PER_RANK    = 20   # [FIX-§15.5.1] поднят с 15 → 20 (синхро
 MIN_PER_SECTION = 30   # [З-14] при MIN_PER_RANK=20 → 60 вопросов/раздел (3 ранга × 20)
 MIN_PER_COMP    = 100
 
+# [SCHED] Планировщик генерации (generate_questions): вызовы LLM — в
+# наибольшие дефициты по разделам/рангам/компетенциям до выполнения минимумов
+MIN_PER_CALL       = 3
+MAX_PER_CALL       = 12    # больше блоков не помещается в num_predict 1400–2000
+MAX_CALLS_PER_RANK = 12    # страховка от бесконечного цикла при слабых ответах модели
+EXPECTED_YIELD     = 0.8   # доля принятых вопросов до первых наблюдений
+SCHEDULE_ROUND     = 4     # вызовов LLM в раунде; не зависит от llm_parallel —
+                           # состав вопросов одинаков при любом числе потоков
+SCHEDULE_LOG: dict = {}    # итог планировщика → coverage_report.json
+
 # Типы вопросов (поле в нумерации):
 #   1 — один правильный ответ, порядок не важен
 #   2 — несколько правильных ответов
@@ -93,18 +134,19 @@ QTYPE_MULTIPLE = 2
 QTYPE_ORDER    = 3
 
 # ── Кэш (аналогично rpd_generate.py) ─────────────────────────────────────────
-EMBED_CACHE:    dict = {}
+# [STORE] Эмбеддинги — в общем utils.get_embed_store(), здесь только retrieval.
 RETRIEVE_CACHE: dict = {}
 
 
 def _load_cache() -> None:
-    global EMBED_CACHE, RETRIEVE_CACHE
+    global RETRIEVE_CACHE
     if Path(_CACHE_FILE).exists():
         try:
             data = json.loads(Path(_CACHE_FILE).read_text(encoding="utf-8"))
-            EMBED_CACHE    = data.get("embed",    {})
+            # [STORE] Старый формат с секцией "embed" — переносим в embed_store
+            import_legacy_embed_cache(data.get("embed", {}), prefix="query")
             RETRIEVE_CACHE = data.get("retrieve", {})
-            print(f"📦 Кэш загружен: {len(EMBED_CACHE)} эмбеддингов, "
+            print(f"📦 Кэш загружен: {len(get_embed_store())} эмбеддингов (embed_store), "
                   f"{len(RETRIEVE_CACHE)} retrieval-записей")
         except Exception as e:
             print(f"⚠️  Ошибка загрузки кэша: {e}")
@@ -113,14 +155,63 @@ def _load_cache() -> None:
 def _save_cache() -> None:
     try:
         Path(_CACHE_FILE).write_text(
-            json.dumps({"embed": EMBED_CACHE, "retrieve": RETRIEVE_CACHE},
-                       ensure_ascii=False, indent=2),
+            json.dumps({"retrieve": RETRIEVE_CACHE}, ensure_ascii=False, indent=2),
             encoding="utf-8"
         )
+        get_embed_store().flush()  # [STORE]
     except Exception as e:
         print(f"⚠️  Ошибка сохранения кэша: {e}")
 
 
+# ── Контрольная точка генерации ([RESUME]) ───────────────────────────────────
+# Вопросы жили в памяти до write_tests_docx: падение или таймаут Ollama в
+# последнем разделе выбрасывали всю предыдущую работу LLM. Каждое выполненное
+# задание (раздел, ранг, тема или дозапрос) дописывается в CHECKPOINT_FILE
+# сырым ответом; при --resume совпавшие задания не отправляются в модель, а
+# нумерация после сбора (_assemble_section) та же, что без падения.
+_checkpoint: dict = {}          # ключ задания → сырой ответ
+_checkpoint_fh = None
+_checkpoint_lock = threading.Lock()
+
+
+def _checkpoint_key(job: dict) -> str:
+    """Ключ задания: изменившийся РПД, контекст, модель или seed — другое задание."""
+    blob = json.dumps({"section": job["section_num"], "rank": job["rank"],
+                       "topic": job["topic_num"], "model": job["model"],
+                       "seed": GENERATION["seed"], "attempt": job["attempt"],
+                       "prompt": job["prompt"]},
+                      ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _open_checkpoint(resume: bool) -> None:
+    """Без resume файл начинается заново; с resume — читается и дописывается."""
+    global _checkpoint_fh
+    _checkpoint.clear()
+    if resume and Path(CHECKPOINT_FILE).exists():
+        with open(CHECKPOINT_FILE, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue   # оборванная последняя запись
+                _checkpoint[rec["k"]] = rec["raw"]
+        print(f"♻️  Контрольная точка: {len(_checkpoint)} ответов ({CHECKPOINT_FILE})")
+    elif resume:
+        print(f"⚠️  {CHECKPOINT_FILE} не найден — генерация с начала")
+    _checkpoint_fh = open(CHECKPOINT_FILE, "a" if resume else "w", encoding="utf-8")
+
+
+def _checkpoint_put(job: dict, raw: str) -> None:
+    if _checkpoint_fh is None:
+        return
+    rec = {"k": _checkpoint_key(job), "section": job["section_num"], "rank": job["rank"],
+           "topic": job["topic_num"], "raw": raw}
+    with _checkpoint_lock:
+        _checkpoint_fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        _checkpoint_fh.flush()
+
+
 # ── Ollama / Qdrant ───────────────────────────────────────────────────────────
 def clean(text: str) -> str:
     """Базовая очистка ответа LLM."""
@@ -128,35 +219,33 @@ def clean(text: str) -> str:
 
 
 def get_embedding(text: str) -> list:
-    # [FIX-#18]
-    if text in EMBED_CACHE:
-        return EMBED_CACHE[text]
-    vec = _embed_raw(text, prefix="query", retry=3)
-    if vec:
-        EMBED_CACHE[text] = vec
-    return vec
+    # [FIX-#18] [STORE]
+    return _embed_cached([text], prefix="query", retry=3)[0]
+
+
+def get_embeddings(texts: list[str]) -> list:
+    """[BATCH] Пакетный get_embedding: промахи embed_store — одним запросом /api/embed."""
+    return _embed_cached(texts, prefix="query", retry=3)
 
 
 def _search_qdrant(vec: list, payload_filter: Optional[dict], top_k: int) -> list:
-    try:
-        body = {"query": vec, "limit": top_k, "with_payload": True}
-        if payload_filter:
-            body["filter"] = payload_filter
-        r = requests.post(
-            f"{QDRANT['url']}/collections/{QDRANT['collection']}/points/query",
-            json=body, timeout=30)
-        r.raise_for_status()
-        return r.json().get("result", {}).get("points", [])
-    except requests.HTTPError:
-        # Fallback для старых версий Qdrant
-        body = {"vector": vec, "limit": top_k, "with_payload": True}
-        if payload_filter:
-            body["filter"] = payload_filter
-        r = requests.post(
-            f"{QDRANT['url']}/collections/{QDRANT['collection']}/points/search",
-            json=body, timeout=30)
-        r.raise_for_status()
-        return r.json().get("result", [])
+    # [HTTP] /points/query vs /points/search (старые Qdrant) — определяется один раз
+    if SEARCH_BACKEND["backend"] != "qdrant":  # [LOCAL] in-process поиск ([ANN] — IVF)
+        return local_index.search(SEARCH_BACKEND["index_dir"], vec, payload_filter, top_k,
+                                  ann=SEARCH_BACKEND["backend"] == "ann",
+                                  nprobe=SEARCH_BACKEND["nprobe"])
+    return http_client.qdrant_search(QDRANT["url"], QDRANT["collection"],
+                                     vec, payload_filter, top_k)
+
+
+def _search_qdrant_batch(vecs: list, payload_filter: Optional[dict], top_k: int) -> list:
+    """[MQ] Все формулировки запроса — одним пакетным поиском."""
+    if SEARCH_BACKEND["backend"] != "qdrant":
+        return local_index.search_batch(SEARCH_BACKEND["index_dir"], vecs, payload_filter, top_k,
+                                        ann=SEARCH_BACKEND["backend"] == "ann",
+                                        nprobe=SEARCH_BACKEND["nprobe"])
+    return http_client.qdrant_search_batch(QDRANT["url"], QDRANT["collection"],
+                                           vecs, payload_filter, top_k)
 
 
 def retrieve_for_section(section_name: str, discipline: str,
@@ -170,6 +259,8 @@ def retrieve_for_section(section_name: str, discipline: str,
         return ""
 
     cache_key = f"tests|{section_name}|{discipline}"
+    if SEARCH_BACKEND["backend"] != "qdrant":   # [LOCAL] отдельный кэш
+        cache_key += f"|{SEARCH_BACKEND['backend']}"
     if cache_key in RETRIEVE_CACHE:
         return RETRIEVE_CACHE[cache_key]
 
@@ -196,11 +287,9 @@ def retrieve_for_section(section_name: str, discipline: str,
         }
 
     all_hits: dict = {}
-    for query_text in queries:
-        vec = get_embedding(query_text)
-        if not vec:
-            continue
-        hits = _search_qdrant(vec, payload_filter, GENERATION["top_k"])
+    # [BATCH] все формулировки одним запросом; [MQ] и одним пакетным поиском
+    vecs = [v for v in get_embeddings(queries) if v]
+    for hits in _search_qdrant_batch(vecs, payload_filter, GENERATION["top_k"]):
         for h in hits:
             hid = h.get("id")
             if hid not in all_hits or h.get("score", 0) > all_hits[hid].get("score", 0):
@@ -254,34 +343,40 @@ def retrieve_for_section(section_name: str, discipline: str,
 
 
 # ── LLM ───────────────────────────────────────────────────────────────────────
-def llm(prompt: str, max_tokens: int = 1200) -> str:
-    for attempt in range(3):
-        try:
-            r = requests.post(
-                OLLAMA["generate_url"],
-                json={
-                    "model": OLLAMA["llm_model"],
-                    "prompt": prompt,
-                    "stream": False,
-                    # [FIX-§2.2.4]
-                    "options": {
-                        "temperature": 0.4,
-                        "num_predict": max_tokens,
-                        "num_ctx": OLLAMA["num_ctx"],
-                        "num_gpu": OLLAMA["num_gpu"],
-                    }
-                },
-                timeout=300)
-            r.raise_for_status()
-            text = r.json().get("response", "")
-            if text:
-                time.sleep(3)  # [FIX-§2.2.4] пауза 3 сек вместо 1 — охлаждение GPU без выгрузки
-                return clean(text)
-        except Exception as e:
-            if attempt == 2:
-                return f"[Ошибка LLM: {e}]"
-            time.sleep(5)
-    return "[Ошибка: пустой ответ]"
+def llm(prompt: str, max_tokens: int = 1200, section: str = "questions", stop=None,
+        model: Optional[str] = None, seed: Optional[int] = None) -> str:
+    # [FIX-§2.2.4]
+    options = {
+        "temperature": 0.4,
+        "num_predict": max_tokens,
+        "num_ctx": OLLAMA["num_ctx"],
+        "num_gpu": OLLAMA["num_gpu"],
+        "seed": GENERATION["seed"] if seed is None else seed,   # [PAR] воспроизводимость
+    }
+    try:
+        # [STREAM] кэш, охлаждение, поток и досрочная остановка — llm_client
+        text, _ = llm_client.generate(OLLAMA["generate_url"], model or OLLAMA["llm_model"],
+                                      prompt, options, section=section, stop=stop, timeout=300)
+    except Exception as e:
+        return f"[Ошибка LLM: {e}]"
+    if not text:
+        return "[Ошибка: пустой ответ]"
+    return clean(text)
+
+
+# [STREAM] Блок вопроса завершён строкой «ПРАВИЛЬНЫЙ: …» — после n таких строк
+# поток обрывается: пояснения после последнего блока парсер всё равно отбрасывает
+_ANSWER_LINE = r"^\s*ПРАВИЛЬНЫЙ\s*:\s*\S.*$"
+
+
+def _questions_stop(n: int) -> llm_client.BlockStop:
+    return llm_client.BlockStop(_ANSWER_LINE, n)
+
+
+def _questions_model(rank: int) -> str:
+    """[ROUTE] Модель для ранга: llm_routing "questions_r<rank>", затем "questions"."""
+    return llm_client.route(f"questions_r{rank}",
+                            llm_client.route("questions", OLLAMA["llm_model"]))
 
 
 # ── Парсинг РПД ───────────────────────────────────────────────────────────────
@@ -554,15 +649,17 @@ RANK_PROMPTS = {
 
 ANSWER_LABELS = ["А", "Б", "В", "Г", "Д"]
 
+# [PREFIX] Ollama переиспользует KV-кэш для общего префикса соседних запросов.
+# Всё, что одинаково для вызовов раздела (роль, раздел, компетенции, контекст,
+# глоссарий, формат и требования), идёт первым; ранг, тема и число блоков —
+# в конце. Внутри ранга вызовы по темам отличаются только последними строками,
+# и prompt eval пересчитывает лишь их.
 _PROMPT_TEMPLATE = """\
 Ты — преподаватель, составляющий фонд оценочных средств (ФОС) для дисциплины «{discipline}».
 
 Раздел: {section_name}
-Тема раздела: {topic}
 Компетенции, закрываемые разделом: {competencies}
 
-{rank_prompt}
-
 Контекст из учебников (используй для формулировок):
 {context}
 
@@ -591,6 +688,9 @@ _PROMPT_TEMPLATE = """\
 - [FIX-#8] Все дистракторы уникальны внутри одного вопроса и не повторяются в других вопросах этого набора
 - Не используй одни и те же неправильные ответы повторно — каждый вопрос должен иметь свои уникальные дистракторы
 
+{rank_prompt}
+
+Тема раздела: {topic}
 Выведи ровно {n} таких блоков. Без нумерации, без пояснений вне блоков.
 """
 
@@ -601,10 +701,12 @@ def _shuffle_answers(q: dict) -> dict:
     LLM всегда помещает правильный ответ на позицию А) — студент мог угадывать,
     всегда выбирая А). Перемешиваем тексты вариантов случайно, оставляя
     метки (А/Б/В/Г) на месте, затем пересчитываем correct_letters по тексту.
+    [PAR] Генератор сеется GENERATION["seed"], номером и текстом задания —
+    перестановка воспроизводима и не зависит от порядка разбора.
     """
     labels = list(q["answers"].keys())
     texts = list(q["answers"].values())
-    random.shuffle(texts)
+    random.Random(f"{GENERATION['seed']}|{q['number']}|{q['task']}").shuffle(texts)
     new_answers = dict(zip(labels, texts))
     correct_texts_set = set(q["correct_texts"])
     new_correct = [lbl for lbl, txt in new_answers.items() if txt in correct_texts_set]
@@ -617,12 +719,13 @@ def _shuffle_answers(q: dict) -> dict:
             "correct_texts":   [new_answers[l] for l in new_correct]}
 
 
-def _filter_duplicate_distractors(questions: list[dict]) -> list[dict]:
+def _filter_duplicate_distractors(questions: list[dict], verbose: bool = True) -> list[dict]:
     """
 
     LLM повторяет «безопасные» формулировки дистракторов в 5+ вопросах подряд.
     Считаем частоту каждого дистрактора (неправильного варианта) внутри батча.
     Вопросы, у которых ≥2 дистракторов встречаются 3+ раз — исключаются.
+    verbose=False — без печати (подсчёт в планировщике).
     """
     from collections import Counter
     distractor_count: Counter = Counter()
@@ -635,8 +738,9 @@ def _filter_duplicate_distractors(questions: list[dict]) -> list[dict]:
     if not spam:
         return questions
 
-    print(f"  ⚠️  [§2.2.3] Повторяющихся дистракторов: {len(spam)} шт. "
-          f"(примеры: {list(spam)[:2]})")
+    if verbose:
+        print(f"  ⚠️  [§2.2.3] Повторяющихся дистракторов: {len(spam)} шт. "
+              f"(примеры: {list(spam)[:2]})")
 
     filtered = []
     removed = 0
@@ -650,14 +754,27 @@ def _filter_duplicate_distractors(questions: list[dict]) -> list[dict]:
         else:
             filtered.append(q)
 
-    if removed:
+    if removed and verbose:
         print(f"  ✂️  Исключено {removed} вопросов с дублями дистракторов")
     return filtered
 
 
-def _filter_near_duplicate_questions(questions: list[dict], threshold: float = 0.72) -> list[dict]:
+NEAR_DUP_THRESHOLD = 0.72
+
+
+def _task_shingles(text: str) -> set:
+    """Биграммы слов нормализованного текста задания (одно слово — униграмма)."""
+    t = re.sub(r"[^\w\s]", "", text.lower())
+    words = t.split()
+    return {f"{a} {b}" for a, b in zip(words, words[1:])} if len(words) > 1 else set(words)
+
+
+def _filter_near_duplicate_questions(questions: list[dict],
+                                     index: Optional[near_dup.MinHashLSH] = None,
+                                     threshold: float = NEAR_DUP_THRESHOLD,
+                                     verbose: bool = True) -> list[dict]:
     """
-    [FIX-З-7] Удаляет почти-дублирующиеся вопросы внутри батча.
+    [FIX-З-7] Удаляет почти-дублирующиеся вопросы.
 
     Причина: мусорные темы (З-2) порождают повторные промпты по одной и той же
     теме → LLM генерирует 8-10 семантически идентичных вопросов (3031–3035
@@ -665,38 +782,34 @@ def _filter_near_duplicate_questions(questions: list[dict], threshold: float = 0
     биграм (Jaccard) на нормализованных текстах заданий.
 
     threshold=0.72 — эмпирически: ≥0.72 → «по сути один вопрос», <0.72 → разные.
+
+    [LSH] Сравнение — через near_dup.MinHashLSH: кандидаты по полосам MinHash,
+    решение по точному Jaccard. index — общий на прогон (generate_questions),
+    так что отсекаются и дубликаты из других рангов и разделов; без index —
+    только внутри батча. Принятому вопросу пишется lsh_id — его id в index.
     """
-    def _bigrams(text: str) -> set:
-        t = re.sub(r"[^\w\s]", "", text.lower())
-        words = t.split()
-        return set(zip(words, words[1:])) if len(words) > 1 else set(words)
-
-    def _jaccard(a: set, b: set) -> float:
-        if not a and not b:
-            return 1.0
-        union = a | b
-        return len(a & b) / len(union) if union else 0.0
-
-    kept: list[dict] = []
-    removed = 0
+    if index is None:
+        index = near_dup.MinHashLSH(threshold)
+    kept = []
     for q in questions:
-        q_bg = _bigrams(q["task"])
-        is_dup = False
-        for kq in kept:
-            if _jaccard(q_bg, _bigrams(kq["task"])) >= threshold:
-                is_dup = True
-                break
-        if is_dup:
-            removed += 1
-        else:
+        lsh_id = index.add_if_new(_task_shingles(q["task"]))
+        if lsh_id is not None:
+            q["lsh_id"] = lsh_id
             kept.append(q)
 
-    if removed:
+    removed = len(questions) - len(kept)
+    if removed and verbose:
         print(f"  ✂️  [З-7] Исключено {removed} почти-дублирующихся вопросов "
-              f"(порог Jaccard ≥ {threshold})")
+              f"(порог Jaccard ≥ {index.threshold})")
     return kept
 
 
+def _question_number(code: str, section_num: int, topic_num: int, qtype: int,
+                     idx: int, rank: int, n_correct: int, is_ordered: int = 0) -> str:
+    # Нумерация: КодДисц.Раздел.Тема.ТипВопроса.НомерВопроса.Ранг.Послед(КолПравильных)
+    return f"{code}.{section_num}.{topic_num}.{qtype}.{idx:04d}.{rank}.{is_ordered}({n_correct})"
+
+
 def _parse_questions_from_llm(raw: str, rank: int,
                                section_num: int, topic_num: int,
                                discipline_code: str,
@@ -786,9 +899,8 @@ def _parse_questions_from_llm(raw: str, rank: int,
                 correct_letters = correct_letters[:1]
                 n_correct = 1
 
-        # Нумерация: КодДисц.Раздел.Тема.ТипВопроса.НомерВопроса.Ранг.Послед(КолПравильных)
-        number = (f"{discipline_code}.{section_num}.{topic_num}.{qtype}."
-                  f"{q_idx:04d}.{rank}.{is_ordered}({n_correct})")
+        number = _question_number(discipline_code, section_num, topic_num, qtype,
+                                  q_idx, rank, n_correct, is_ordered)
 
         correct_texts = [answer_lines[l] for l in correct_letters if l in answer_lines]
 
@@ -843,116 +955,383 @@ def _build_term_glossary(cfg_path: Path = CONFIG_PATH) -> str:
 _TERM_GLOSSARY: str = _build_term_glossary()
 
 
-def generate_questions_for_section(
-        section: dict,
-        discipline: str,
-        code: str,
-        n_per_rank: int = MIN_PER_RANK,
-        no_rag: bool = False,
-) -> list[dict]:
+def _question_prompt(discipline: str, section: dict, topic: str, rank: int,
+                     n: int, ctx: str) -> str:
+    return _PROMPT_TEMPLATE.format(
+        discipline=discipline,
+        section_name=section["name"],
+        topic=topic,
+        competencies=", ".join(section["competencies"]),
+        rank_prompt=RANK_PROMPTS[rank].format(n=n),
+        context=ctx[:MAX_CONTEXT_CHARS] if ctx else "(контекст недоступен)",
+        n=n,
+        term_glossary=_TERM_GLOSSARY,  # [FIX-З-8]
+    )
+
+
+def _parse_job(job: dict, raw: str, start_idx: int) -> list[dict]:
+    return _parse_questions_from_llm(
+        raw,
+        rank=job["rank"],
+        section_num=job["section_num"],
+        topic_num=job["topic_num"],
+        discipline_code=job["code"],
+        start_idx=start_idx,
+    )
+
+
+def _new_job(plan: dict, rank: int, n: int) -> dict:
     """
-    Генерирует вопросы для одного раздела по всем 3 рангам.
+    Очередное задание LLM на n вопросов для (раздел, ранг). Темы раздела
+    берутся по кругу, после них — раздел целиком (бывший дозапрос, тема
+    len(topics) + 1); на следующем круге тот же промпт идёт с другим seed
+    Ollama (attempt). [BANK] Сначала вопросы берутся из банка, LLM
+    запрашивается на остаток; при n == 0 задание в модель не идёт.
+    """
+    section, topics = plan["section"], plan["topics"]
+    calls = plan["calls"][rank]
+    plan["calls"][rank] += 1
+    attempt, t = divmod(calls, len(topics) + 1)
+    topic = topics[t] if t < len(topics) else section["name"]
+    label = (f"Раздел {section['num']} | ранг {rank} | "
+             + (f"тема {t + 1}/{len(topics)}: {topic[:50]}" if t < len(topics) else "весь раздел")
+             + (f" | круг {attempt + 1}" if attempt else ""))
+
+    banked = question_bank.draw(topic, rank, n, section["competencies"])
+    n_llm = n - len(banked)
+    if banked:
+        print(f"     🏦 {label}: из банка {len(banked)}, в LLM {n_llm}")
+    job = {
+        "label":       label,
+        "section_num": section["num"],
+        "rank":        rank,
+        "topic_num":   t + 1,
+        "topic":       topic,
+        "code":        plan["code"],
+        "n":           n_llm,
+        "attempt":     attempt,
+        "banked":      banked,
+        "prompt":      (_question_prompt(plan["discipline"], section, topic, rank, n_llm, plan["ctx"])
+                        if n_llm > 0 else ""),
+        # [FIX-§15.5.2]
+        "max_tokens":  2000 if rank == 3 else 1400,
+        # [ROUTE] темы — по маршруту ранга с эскалацией, раздел целиком — основная модель
+        "model":       _questions_model(rank) if t < len(topics) else None,
+        "route":       f"questions_r{rank}" if t < len(topics) else None,
+    }
+    if n_llm <= 0:
+        job["raw"] = ""
+    return job
 
-    Стратегия: для каждого ранга отправляем один промпт.
-    Если тем несколько — распределяем вопросы по темам.
+
+def _plan_section(section: dict, discipline: str, code: str, no_rag: bool) -> dict:
+    """
+    Состояние раздела для планировщика: RAG-контекст, темы, принятые
+    вопросы по рангам. Retrieval выполняется здесь, последовательно:
+    RETRIEVE_CACHE не потокобезопасен, а запрос к Qdrant на раздел один.
     """
     sec_num  = section["num"]
     sec_name = section["name"]
-    comps    = ", ".join(section["competencies"])
     topics   = section["topics"] or [sec_name]
     # Используем максимум 3 темы для структуры
     topics = topics[:3] if len(topics) > 3 else topics
 
-    all_questions: list[dict] = []
-    global_idx = sec_num * 1000 + 1  # Нумерация вопросов: 1001, 2001, 3001 по разделам
-
     print(f"\n  📝 Раздел {sec_num}: «{sec_name[:50]}»")
-    print(f"     Компетенции: {comps} | Тем: {len(topics)}")
+    print(f"     Компетенции: {', '.join(section['competencies'])} | Тем: {len(topics)}")
 
     # RAG-контекст для всего раздела (один запрос)
     ctx = retrieve_for_section(sec_name, discipline, no_rag)
     if not ctx:
         ctx = f"Содержание раздела «{sec_name}» дисциплины «{discipline}»."
 
-    for rank in [1, 2, 3]:
-        rank_questions: list[dict] = []
-        n_target = n_per_rank  # минимум вопросов на ранг
-
-        # [FIX-#9] Запрашиваем с запасом: после _filter_duplicate_distractors
-        # теряется 3–7 вопросов на ранг → каждый ранг требовал retry.
-        # +5 компенсирует типичные потери без перегрузки промпта.
-        _OVERDRAFT = 5
-        n_request = n_target + _OVERDRAFT
-
-        # Распределяем вопросы по темам
-        n_topics = len(topics)
-        n_per_topic = max(3, (n_request + n_topics - 1) // n_topics)
-
-        for t_idx, topic in enumerate(topics, start=1):
-            print(f"     Ранг {rank} | тема {t_idx}/{n_topics}: {topic[:50]}")
-
-            prompt = _PROMPT_TEMPLATE.format(
-                discipline=discipline,
-                section_name=sec_name,
-                topic=topic,
-                competencies=comps,
-                rank_prompt=RANK_PROMPTS[rank].format(n=n_per_topic),
-                context=ctx[:MAX_CONTEXT_CHARS] if ctx else "(контекст недоступен)",
-                n=n_per_topic,
-                term_glossary=_TERM_GLOSSARY,  # [FIX-З-8]
-            )
+    return {"section": section, "discipline": discipline, "code": code, "ctx": ctx,
+            "topics": topics, "pool": {1: [], 2: [], 3: []}, "calls": {1: 0, 2: 0, 3: 0}}
 
-            # [FIX-§15.5.2]
-            _max_tok = 2000 if rank == 3 else 1400
-            raw = llm(prompt, max_tokens=_max_tok)
-
-            parsed = _parse_questions_from_llm(
-                raw,
-                rank=rank,
-                section_num=sec_num,
-                topic_num=t_idx,
-                discipline_code=code,
-                start_idx=global_idx,
-            )
 
-            print(f"       → распознано вопросов: {len(parsed)}")
-            rank_questions.extend(parsed)
-            global_idx += len(parsed)
-
-        # Если вопросов меньше минимума — делаем ещё один запрос
-        if len(rank_questions) < n_per_rank:
-            shortage = n_per_rank - len(rank_questions)
-            print(f"     ⚠️  Ранг {rank}: нехватка {shortage} вопросов, дозапрос...")
-            prompt = _PROMPT_TEMPLATE.format(
-                discipline=discipline,
-                section_name=sec_name,
-                topic=sec_name,
-                competencies=comps,
-                rank_prompt=RANK_PROMPTS[rank].format(n=shortage + 2),
-                context=ctx[:MAX_CONTEXT_CHARS],
-                n=shortage + 2,
-                term_glossary=_TERM_GLOSSARY,  # [FIX-З-8]
-            )
-            raw = llm(prompt, max_tokens=2000 if rank == 3 else 1400)  # [FIX-§15.5.2] явный, не из закрытой области
-            extra = _parse_questions_from_llm(
-                raw, rank=rank, section_num=sec_num,
-                topic_num=len(topics) + 1,
-                discipline_code=code, start_idx=global_idx,
-            )
-            rank_questions.extend(extra[:shortage + 2])
-            global_idx += len(extra)
+_last_section: dict = {"num": None}   # раздел последнего вызова (section_pause)
+
 
-        print(f"     ✅ Ранг {rank}: итого {len(rank_questions)} вопросов")
+def _run_question_job(job: dict) -> str:
+    """[PAR] Один вызов LLM (с эскалацией на основную модель); возвращает сырой ответ."""
+    print(f"     ▶ {job['label']}")
+    seed = GENERATION["seed"] + job["attempt"]
+    raw = llm(job["prompt"], max_tokens=job["max_tokens"], stop=_questions_stop(job["n"]),
+              model=job["model"], seed=seed)
+    n_parsed = len(_parse_job(job, raw, 0))
+
+    # [ROUTE] Малая модель дала меньше половины блоков — повтор на основной
+    _escalate = (llm_client.escalation_model(job["route"], job["model"], OLLAMA["llm_model"])
+                 if job["route"] and n_parsed < (job["n"] + 1) // 2 else None)
+    if _escalate:
+        llm_cache.discard_last()
+        raw = llm(job["prompt"], max_tokens=job["max_tokens"], stop=_questions_stop(job["n"]),
+                  model=_escalate, seed=seed)
+        n_parsed = len(_parse_job(job, raw, 0))
+
+    if not n_parsed:
+        llm_cache.discard_last()   # [LLMC] пустой разбор не кэшируем
+    else:
+        _checkpoint_put(job, raw)   # [RESUME] ошибки и пустые ответы — повторить
+    print(f"       → {job['label'].split(':')[0]}: распознано вопросов: {n_parsed}")
+    return raw
+
+
+def _run_question_jobs(jobs: list[dict], workers: int) -> None:
+    """
+    [PAR] Выполняет задания, ответ кладётся в job["raw"]. Порядок завершения
+    на результат не влияет: ответы принимаются в порядке jobs (_accept_job).
+    При workers == 1 — последовательно, с паузой при смене раздела.
+    [RESUME] Задания из контрольной точки в модель не отправляются.
+    """
+    pending = []
+    for job in jobs:
+        raw = _checkpoint.get(_checkpoint_key(job))
+        if raw is None:
+            pending.append(job)
+        else:
+            job["raw"] = raw
+    if len(pending) < len(jobs):
+        print(f"  ♻️  [RESUME] Из контрольной точки: {len(jobs) - len(pending)} из {len(jobs)} заданий")
+    if workers <= 1:
+        for job in pending:
+            if _last_section["num"] not in (None, job["section_num"]):
+                llm_governor.section_pause()   # [GOV] вместо фиксированных 5 с
+            _last_section["num"] = job["section_num"]
+            job["raw"] = _run_question_job(job)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for job, raw in zip(pending, pool.map(_run_question_job, pending)):
+            job["raw"] = raw
+
+
+def _banked_questions(job: dict, start_idx: int) -> list[dict]:
+    """[BANK] Вопросы из банка с номерами задания (перед ответом LLM)."""
+    out = []
+    for i, b in enumerate(job["banked"]):
+        n_correct = len(b["correct_letters"])
+        out.append(_shuffle_answers({
+            "number":          _question_number(job["code"], job["section_num"], job["topic_num"],
+                                                b["qtype"], start_idx + i, job["rank"], n_correct),
+            "task":            b["task"],
+            "answers":         b["answers"],
+            "correct_letters": b["correct_letters"],
+            "correct_texts":   [b["answers"][l] for l in b["correct_letters"]],
+            "rank":            job["rank"],
+            "qtype":           b["qtype"],
+            "n_correct":       n_correct,
+            "section_num":     job["section_num"],
+            "topic_num":       job["topic_num"],
+            "bank_id":         b["id"],
+        }))
+    return out
+
+
+def _bank_store(plan: dict, questions: list[dict]) -> None:
+    """[BANK] Прошедшие фильтры новые вопросы раздела — в банк, взятым — +1 использование."""
+    section, topics = plan["section"], plan["topics"]
+    new = [(topics[q["topic_num"] - 1] if q["topic_num"] <= len(topics) else section["name"], q)
+           for q in questions if "bank_id" not in q]
+    question_bank.put_many(new, section["competencies"], plan["discipline"])
+    question_bank.mark_used([q["bank_id"] for q in questions if "bank_id" in q])
+
+
+def _accept_job(plan: dict, job: dict, dedup: near_dup.MinHashLSH) -> int:
+    """
+    Разбирает ответ задания и добавляет в пул ранга вопросы, прошедшие
+    индекс почти-дубликатов прогона ([LSH]); возвращает число принятых.
+    Номера здесь предварительные — окончательные даёт _assemble_section.
+
+    Вопрос, который отбросит фильтр дистракторов (_assemble_section), не
+    должен гасить свои почти-дубликаты: такие вопросы убираются из индекса,
+    а отсечённые в этом задании проверяются заново. Фильтр дистракторов
+    монотонен — с ростом пула вопрос из отброшенных уже не вернётся.
+    """
+    pool = plan["pool"][job["rank"]]
+    banked = _banked_questions(job, len(pool))
+    parsed = _parse_job(job, job["raw"], len(pool) + len(banked))
+    # [FIX-З-7] Удаляем почти-дублирующиеся вопросы (Jaccard по биграмам)
+    pending = banked + parsed
+    accepted: list[dict] = []
+    verbose = True
+    while pending:
+        kept = _filter_near_duplicate_questions(pending, dedup, verbose=verbose)
+        pool.extend(kept)
+        accepted.extend(kept)
+        # [LSH] отброшенные фильтром дистракторов — из индекса
+        live = {id(q) for q in _filter_duplicate_distractors(pool, verbose=False)}
+        released = [q for q in pool if id(q) not in live and "lsh_id" in q]
+        for q in released:
+            dedup.remove(q.pop("lsh_id"))
+        if not released:
+            break
+        kept_ids = {id(q) for q in kept}
+        pending = [q for q in pending if id(q) not in kept_ids]
+        verbose = False
+    return len(accepted)
+
+
+def _live_count(plan: dict, rank: int) -> int:
+    # [FIX-§2.2.3] считается после фильтра дистракторов — как в итоговом наборе
+    return len(_filter_duplicate_distractors(plan["pool"][rank], verbose=False))
+
+
+def _deficits(plans: list[dict], counts: dict, n_per_rank: int, min_per_comp: int) -> dict:
+    """
+    [SCHED] Потребность (раздел, ранг) в вопросах при текущих counts:
+    максимум из нехватки ранга до n_per_rank, доли нехватки раздела до
+    MIN_PER_SECTION (на 3 ранга) и долей нехватки его компетенций до
+    min_per_comp (на 3 ранга каждого раздела с этой компетенцией).
+    """
+    sec_total = {p["section"]["num"]: sum(counts[(p["section"]["num"], r)] for r in (1, 2, 3))
+                 for p in plans}
+    comp_total: dict[str, float] = {}
+    comp_secs: dict[str, int] = {}
+    for p in plans:
+        for c in p["section"]["competencies"]:
+            comp_total[c] = comp_total.get(c, 0) + sec_total[p["section"]["num"]]
+            comp_secs[c] = comp_secs.get(c, 0) + 1
+    need = {}
+    for p in plans:
+        s = p["section"]["num"]
+        sec_need = (MIN_PER_SECTION - sec_total[s]) / 3
+        comp_need = max([(min_per_comp - comp_total[c]) / (3 * comp_secs[c])
+                         for c in p["section"]["competencies"]] or [0])
+        for r in (1, 2, 3):
+            need[(s, r)] = max(n_per_rank - counts[(s, r)], sec_need, comp_need, 0)
+    return need
+
+
+def _schedule_round(plans: list[dict], n_per_rank: int, min_per_comp: int,
+                    slots: int, yield_rate: float) -> list[dict]:
+    """
+    [SCHED] Задания следующего раунда: до slots вызовов LLM, каждый — в
+    (раздел, ранг) с наибольшей потребностью. Внутри раунда ожидаемый
+    выход вызова (n · yield_rate) сразу засчитывается, так что следующий
+    слот уходит следующему дефициту. Пустой список — минимумы выполнены
+    (или у всех дефицитных рангов исчерпан MAX_CALLS_PER_RANK).
+    """
+    by_num = {p["section"]["num"]: p for p in plans}
+    counts = {(p["section"]["num"], r): float(_live_count(p, r)) for p in plans for r in (1, 2, 3)}
+    jobs: list[dict] = []
+    llm_jobs = 0
+    while llm_jobs < slots:
+        need = _deficits(plans, counts, n_per_rank, min_per_comp)
+        open_keys = [k for k, v in need.items()
+                     if v > 0 and by_num[k[0]]["calls"][k[1]] < MAX_CALLS_PER_RANK]
+        if not open_keys:
+            break
+        # при равной потребности — ранг, где вопросов меньше (общая нехватка
+        # компетенции делится между рангами), затем меньший раздел/ранг
+        key = max(open_keys, key=lambda k: (need[k], -counts[k], -k[0], -k[1]))
+        n = min(MAX_PER_CALL, max(MIN_PER_CALL, math.ceil(need[key] / yield_rate)))
+        job = _new_job(by_num[key[0]], key[1], n)
+        jobs.append(job)
+        counts[key] += len(job["banked"]) + job["n"] * yield_rate
+        if job["n"] > 0:
+            llm_jobs += 1
+    return jobs
+
+
+def _assemble_section(plan: dict) -> list[dict]:
+    """
+    Итоговые вопросы раздела: пулы рангов в порядке приёма, после фильтра
+    дистракторов, с окончательной нумерацией 1001, 1002, … (раздел 2 — 2001…).
+    """
+    sec_num = plan["section"]["num"]
+    all_questions: list[dict] = []
+    global_idx = sec_num * 1000 + 1  # Нумерация вопросов: 1001, 2001, 3001 по разделам
+
+    for rank in [1, 2, 3]:
         # [FIX-§2.2.3]
-        rank_questions = _filter_duplicate_distractors(rank_questions)
-        # [FIX-З-7] Удаляем почти-дублирующиеся вопросы (Jaccard по биграмам)
-        rank_questions = _filter_near_duplicate_questions(rank_questions)
+        rank_questions = _filter_duplicate_distractors(plan["pool"][rank])
+        for q in rank_questions:
+            q["number"] = _question_number(plan["code"], sec_num, q["topic_num"], q["qtype"],
+                                           global_idx, rank, q["n_correct"])
+            global_idx += 1
+        print(f"     ✅ Раздел {sec_num} | ранг {rank}: итого {len(rank_questions)} вопросов "
+              f"({plan['calls'][rank]} заданий)")
         all_questions.extend(rank_questions)
 
     print(f"  ✅ Раздел {sec_num}: всего {len(all_questions)} вопросов")
     return all_questions
 
 
+def generate_questions(
+        sections: list[dict],
+        discipline: str,
+        code: str,
+        n_per_rank: int = MIN_PER_RANK,
+        no_rag: bool = False,
+        workers: int = 1,
+        min_per_comp: int = MIN_PER_COMP,
+) -> list[dict]:
+    """
+    Генерирует вопросы для разделов по всем 3 рангам.
+
+    [SCHED] Вместо фиксированных циклов ранг × тема с запасом (_OVERDRAFT)
+    и дозапроса — раунды планировщика: после каждого раунда пересчитываются
+    принятые (после фильтров дублей) вопросы по разделам/рангам и
+    компетенциям, следующие вызовы LLM уходят в наибольшие дефициты
+    (_schedule_round), генерация останавливается, как только выполнены
+    n_per_rank, MIN_PER_SECTION и min_per_comp. Число вопросов в вызове —
+    по дефициту с поправкой на наблюдаемую долю принятых вопросов.
+
+    [PAR] Раунд — SCHEDULE_ROUND вызовов, выполняемых workers потоками;
+    ответы принимаются в порядке заданий, нумерация — после всех раундов,
+    перемешивание вариантов и генерация Ollama детерминированы
+    GENERATION["seed"]: при том же seed результат не зависит ни от порядка
+    завершения вызовов, ни от числа потоков.
+    [BANK] Вопросы по той же теме и рангу сначала берутся из question_bank,
+    в LLM уходит только нехватка; новые вопросы после фильтров — в банк.
+    """
+    plans = [_plan_section(s, discipline, code, no_rag) for s in sections]
+    _save_cache()
+
+    # [LSH] Один индекс на прогон: дубликаты между рангами и разделами тоже
+    dedup = near_dup.MinHashLSH(NEAR_DUP_THRESHOLD)
+    by_num = {p["section"]["num"]: p for p in plans}
+    asked = accepted = 0
+    rounds = llm_calls = 0
+    print(f"\n  🧵 Планировщик: минимумы {n_per_rank}/ранг, {MIN_PER_SECTION}/раздел, "
+          f"{min_per_comp}/компетенция; до {SCHEDULE_ROUND} вызовов в раунде, потоков: {workers}")
+    while True:
+        # [FIX-#9] доля принятых вопросов: до первого раунда — типичные потери фильтров
+        yield_rate = min(1.0, max(0.3, accepted / asked)) if asked else EXPECTED_YIELD
+        jobs = _schedule_round(plans, n_per_rank, min_per_comp, SCHEDULE_ROUND, yield_rate)
+        if not jobs:
+            break
+        rounds += 1
+        llm_jobs = [j for j in jobs if j["n"] > 0]
+        llm_calls += len(llm_jobs)
+        _run_question_jobs(llm_jobs, workers)
+        for job in jobs:
+            n_ok = _accept_job(by_num[job["section_num"]], job, dedup)
+            asked += len(job["banked"]) + job["n"]
+            accepted += n_ok
+
+    all_questions: list[dict] = []
+    for p in plans:
+        questions = _assemble_section(p)
+        _bank_store(p, questions)   # [BANK]
+        all_questions.extend(questions)
+
+    need = _deficits(plans, {(p["section"]["num"], r): len(_filter_duplicate_distractors(p["pool"][r], verbose=False))
+                             for p in plans for r in (1, 2, 3)}, n_per_rank, min_per_comp)
+    short = sorted(k for k, v in need.items() if v > 0)
+    SCHEDULE_LOG.update({"rounds": rounds, "llm_jobs": llm_calls, "asked": asked,
+                         "accepted": accepted, "unmet": [f"{s}.{r}" for s, r in short]})
+    print(f"\n  📐 [SCHED] Раундов: {rounds}, заданий LLM: {llm_calls}, "
+          f"принято {accepted} из {asked} запрошенных вопросов"
+          + (f"; лимит {MAX_CALLS_PER_RANK} заданий исчерпан: "
+             + ", ".join(f"раздел {s} ранг {r}" for s, r in short) if short else ""))
+    st = dedup.stats
+    if st["queries"]:
+        print(f"  🔁 [LSH] Почти-дубликатов: {st['duplicates']} из {st['queries']}; "
+              f"точных сравнений {st['candidates']} (попарно было бы до "
+              f"{st['queries'] * (st['queries'] - 1) // 2})")
+    return all_questions
+
+
 # ── Запись DOCX ───────────────────────────────────────────────────────────────
 
 def _add_heading(doc: Document, text: str, level: int = 1) -> None:
@@ -1267,6 +1646,14 @@ def main():
         "--config", type=str, default=str(CONFIG_PATH),
         help="Путь к config.json"
     )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help=f"Продолжить прерванный прогон: готовые задания из {CHECKPOINT_FILE}"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=GENERATION["seed"],
+        help=f"Seed генерации и перемешивания ответов (по умолчанию {GENERATION['seed']})"
+    )
     args = parser.parse_args()
 
     # Загрузка конфига
@@ -1282,6 +1669,28 @@ def main():
     print(f"🎓 Дисциплина: {discipline} (код: {code})")
     print(f"   Компетенции: {cfg.get('competency_codes', '')}")
 
+    # [LOCAL] Бэкенд поиска: Qdrant (по умолчанию) или local_index.py
+    if not args.no_rag:
+        SEARCH_BACKEND.update(local_index.backend_from_config(cfg))
+    # [GOV]
+    llm_governor.configure(cfg.get("llm_throttle"))
+    # [LLMC]
+    llm_cache.configure(cfg.get("llm_cache"))
+    # [STREAM]
+    llm_client.STREAM["enabled"] = bool(cfg.get("llm_stream", llm_client.STREAM["enabled"]))
+    # [PREFIX]
+    llm_client.KEEP_ALIVE["value"] = cfg.get("llm_keep_alive", llm_client.KEEP_ALIVE["value"])
+    # [BUDGET]
+    llm_budget.configure(cfg.get("llm_budget"))
+    # [ROUTE]
+    llm_client.ROUTING.update(cfg.get("llm_routing", {}))
+    # [PAR]
+    LLM_PARALLEL["workers"] = max(1, int(cfg.get("llm_parallel", LLM_PARALLEL["workers"])))
+    http_client.configure_pool(LLM_PARALLEL["workers"])
+    GENERATION["seed"] = args.seed
+    # [BANK]
+    question_bank.configure(cfg.get("question_bank"))
+
     # Кэш
     _load_cache()
 
@@ -1308,21 +1717,18 @@ def main():
     print(f"\n🚀 Начало генерации: {args.questions_per_rank} вопросов/ранг × 3 ранга × "
           f"{len(sections)} разделов = ~{args.questions_per_rank * 3 * len(sections)} вопросов")
 
-    all_questions: list[dict] = []
-
-    for i, section in enumerate(sections):
-        qs = generate_questions_for_section(
-            section=section,
-            discipline=discipline,
-            code=code,
-            n_per_rank=args.questions_per_rank,
-            no_rag=args.no_rag,
-        )
-        all_questions.extend(qs)
-        _save_cache()
-        if i < len(sections) - 1:
-            print("  ⏸️  Пауза 5 сек для охлаждения GPU...")
-            time.sleep(5)  # пауза между разделами
+    _open_checkpoint(args.resume)   # [RESUME]
+    all_questions = generate_questions(
+        sections=sections,
+        discipline=discipline,
+        code=code,
+        n_per_rank=args.questions_per_rank,
+        no_rag=args.no_rag,
+        workers=LLM_PARALLEL["workers"],
+        # [SCHED] с --section покрытие компетенций по одному разделу не добирается
+        min_per_comp=MIN_PER_COMP if args.section is None else 0,
+    )
+    _save_cache()
 
     print(f"\n📦 Итого сгенерировано вопросов: {len(all_questions)}")
 
@@ -1337,6 +1743,9 @@ def main():
 
     # Отчёт о покрытии
     report = build_coverage_report(sections, all_questions, cfg)
+    report["llm_telemetry"] = llm_client.telemetry()   # [TELEM]
+    report["question_bank"] = question_bank.stats()     # [BANK]
+    report["schedule"] = SCHEDULE_LOG                   # [SCHED]
     Path(COVERAGE_LOG).write_text(
         json.dumps(report, ensure_ascii=False, indent=2),
         encoding="utf-8"
@@ -1345,6 +1754,15 @@ def main():
 
     print_coverage_summary(report)
     _save_cache()
+    http_client.print_http_stats()  # [HTTP]
+    llm_governor.print_stats()      # [GOV]
+    llm_cache.save()                # [LLMC] вытеснение по max_entries/max_age_days
+    llm_cache.print_stats()
+    llm_client.print_stats()        # [STREAM]
+    llm_client.print_telemetry()    # [TELEM]
+    llm_budget.save()               # [BUDGET] история длин ответов — llm_budget.json
+    llm_budget.print_stats()
+    question_bank.print_stats()     # [BANK]
 
 
 if __name__ == "__main__":
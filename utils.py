@@ -5,10 +5,11 @@ utils.py — общая инфраструктура для всех скрип
 (get_embedding / embed_text / embed), разными endpoint-ами (/api/embeddings vs
 /api/embed), разными prefix-ами и разным retry-count.
 Унифицируем здесь: единое место для изменения при обновлении Ollama API.
+HTTP-вызовы, retry и keep-alive пул — в http_client.py.
 """
 import re
-import time
-import requests
+
+import http_client
 
 OLLAMA_EMBED_URL = "http://localhost:11434/api/embed"
 EMBED_MODEL = "bge-m3"
@@ -57,6 +58,64 @@ def classify_section(title: str) -> str:
     return "other"
 
 
+def _embed_input(text: str, prefix: str, use_prefix: bool) -> str:
+    """Обрезка до MAX_EMBED_CHARS + instruction-prefix [З-15]."""
+    if len(text) > MAX_EMBED_CHARS:
+        text = text[:MAX_EMBED_CHARS]
+    return f"{prefix}: {text}" if use_prefix else text
+
+
+def _parse_embed_response(d: dict, n_inputs: int) -> list | None:
+    """
+    Разбирает ответ Ollama. Возвращает список из n_inputs векторов или None.
+
+    Ollama ≥0.6: {"embeddings": [[...], ...]} — по вектору на элемент input.
+    Ollama <0.6:  {"embedding": [...]} / {"data": [{"embedding": [...]}]} —
+    только для одиночного input.
+    """
+    embeddings = d.get("embeddings")
+    if embeddings and isinstance(embeddings, list):
+        if len(embeddings) == n_inputs and all(embeddings):
+            return embeddings
+        return None
+    if n_inputs != 1:
+        return None
+    vec = d.get("embedding")
+    if not vec:
+        data_list = d.get("data") or []
+        vec = data_list[0].get("embedding") if data_list else None
+    return [vec] if vec else None
+
+
+def _post_embed(inputs: list[str], retry: int, quiet: bool = False) -> list | None:
+    """
+    Один POST /api/embed со списком inputs через http_client (keep-alive пул,
+    retry с экспоненциальной паузой). Возвращает векторы в порядке inputs
+    или None при неудаче.
+    """
+    payload_input = inputs[0] if len(inputs) == 1 else inputs
+
+    def _accept(r) -> bool:
+        # [FIX-NORESP] API ответил без исключения, но без вектора — это тоже повод для retry
+        try:
+            return _parse_embed_response(r.json(), len(inputs)) is not None
+        except ValueError:
+            return False
+
+    try:
+        r = http_client.post(
+            OLLAMA_EMBED_URL, endpoint="ollama.embed",
+            json={"model": EMBED_MODEL, "input": payload_input},
+            timeout=120, retry=retry, accept=_accept, quiet=True,
+        )
+        r.raise_for_status()
+        return _parse_embed_response(r.json(), len(inputs))
+    except Exception as e:
+        if not quiet:
+            print(f"  ⚠️  Ошибка эмбеддинга (попыток: {retry}, текстов: {len(inputs)}): {e}")
+        return None
+
+
 def get_embedding(text: str, prefix: str = "query", retry: int = 3, use_prefix: bool = True) -> list[float]:
     """
     Единая функция эмбеддинга через Ollama /api/embed (≥0.6).
@@ -74,39 +133,138 @@ def get_embedding(text: str, prefix: str = "query", retry: int = 3, use_prefix:
     """
     if not text:
         return []
-    if len(text) > MAX_EMBED_CHARS:
-        text = text[:MAX_EMBED_CHARS]
+    vecs = _post_embed([_embed_input(text, prefix, use_prefix)], retry)
+    return vecs[0] if vecs else []
 
-    input_text = f"{prefix}: {text}" if use_prefix else text  # [З-15]
 
-    delay = 2.0
-    for attempt in range(retry):
-        try:
-            r = requests.post(
-                OLLAMA_EMBED_URL,
-                json={"model": EMBED_MODEL, "input": input_text},
-                timeout=120,
-            )
-            r.raise_for_status()
-            d = r.json()
-            # Ollama ≥0.6: {"embeddings": [[...float...]]}
-            embeddings = d.get("embeddings")
-            if embeddings and isinstance(embeddings, list) and embeddings[0]:
-                return embeddings[0]
-            # Ollama <0.6 fallback: {"embedding": [...float...]}
-            vec = d.get("embedding")
-            if not vec:
-                data_list = d.get("data") or []
-                vec = data_list[0].get("embedding") if data_list else None
-            if vec:
-                return vec
-            # [FIX-NORESP] API ответил без исключения, но без вектора — пауза перед retry
-            time.sleep(delay)
-            delay *= 2
-        except Exception as e:
-            if attempt == retry - 1:
-                print(f"  ⚠️  Ошибка эмбеддинга (попытка {attempt+1}/{retry}): {e}")
-                return []
-            time.sleep(delay)
-            delay *= 2
-    return []
+# [BATCH] /api/embed принимает список в "input" — один HTTP-запрос и один
+# прогон модели на пачку текстов вместо запроса на каждый чанк.
+# Размер пачки адаптивный: ограничен и числом текстов, и суммарной длиной
+# (длинные табличные чанки ~4000 симв. не должны собираться по 64 штуки).
+MAX_BATCH_ITEMS = 64
+MAX_BATCH_CHARS = 48_000
+
+
+def _split_batches(items: list, max_items: int, max_chars: int) -> list:
+    """Режет [(idx, text)] на пачки по числу элементов и суммарной длине."""
+    batches, cur, cur_chars = [], [], 0
+    for idx, text in items:
+        if cur and (len(cur) >= max_items or cur_chars + len(text) > max_chars):
+            batches.append(cur)
+            cur, cur_chars = [], 0
+        cur.append((idx, text))
+        cur_chars += len(text)
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+def _embed_batch_isolated(batch: list, out: list, retry: int, split: bool = False) -> None:
+    """
+    Эмбеддинг пачки с изоляцией сбоев: при ошибке пачка делится пополам,
+    пока проблемный текст не останется один — его результат [] , остальные
+    тексты пачки не теряются.
+    """
+    # Промежуточные половины не логируем — только исходную пачку и одиночные тексты
+    vecs = _post_embed([t for _, t in batch], retry, quiet=split and len(batch) > 1)
+    if vecs is not None:
+        for (idx, _), vec in zip(batch, vecs):
+            out[idx] = vec
+        return
+    if len(batch) == 1:
+        return
+    mid = len(batch) // 2
+    # Повторные попытки уже исчерпаны на уровне всей пачки — половины
+    # пробуем по одному разу, чтобы деление не умножало backoff-паузы.
+    _embed_batch_isolated(batch[:mid], out, retry=1, split=True)
+    _embed_batch_isolated(batch[mid:], out, retry=1, split=True)
+
+
+def get_embeddings(texts: list[str], prefix: str = "query", retry: int = 3,
+                   use_prefix: bool = True,
+                   max_batch_items: int = MAX_BATCH_ITEMS,
+                   max_batch_chars: int = MAX_BATCH_CHARS) -> list[list[float]]:
+    """
+    [BATCH] Пакетный эмбеддинг: аналог get_embedding для списка текстов.
+
+    Порядок результатов совпадает с порядком texts. Для пустых текстов и
+    текстов, эмбеддинг которых не удался, возвращается [] — как у
+    get_embedding, caller проверяет `if not vec` поэлементно.
+    """
+    out: list = [[] for _ in texts]
+    items = [(i, _embed_input(t, prefix, use_prefix)) for i, t in enumerate(texts) if t]
+    for batch in _split_batches(items, max_batch_items, max_batch_chars):
+        _embed_batch_isolated(batch, out, retry)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# [STORE] Общий бинарный кэш эмбеддингов (embed_store.py)
+# ---------------------------------------------------------------------------
+# Один каталог на все скрипты: запрос, уже эмбедденный rpd_generate, не
+# эмбеддится повторно в test_generate/evaluate. float16 вдвое компактнее
+# float32; для косинусной близости bge-m3 потеря точности несущественна.
+EMBED_STORE_DIR      = "embed_store"
+EMBED_STORE_DTYPE    = "float16"
+EMBED_STORE_MAX_ROWS = 200_000
+
+_embed_store = None
+
+
+def get_embed_store():
+    """Lazy-init общего EmbedStore (numpy импортируется только при использовании)."""
+    global _embed_store
+    if _embed_store is None:
+        import atexit
+        from embed_store import EmbedStore
+        _embed_store = EmbedStore(EMBED_STORE_DIR, dtype=EMBED_STORE_DTYPE,
+                                  max_rows=EMBED_STORE_MAX_ROWS)
+        atexit.register(_embed_store.flush)
+    return _embed_store
+
+
+def get_embeddings_cached(texts: list[str], prefix: str = "query", retry: int = 3,
+                          use_prefix: bool = True) -> list[list[float]]:
+    """
+    [STORE] get_embeddings через общий кэш: в Ollama уходят только промахи.
+    Порядок результатов совпадает с texts; для неудач — [].
+    """
+    from embed_store import make_key
+    store = get_embed_store()
+    key_prefix = prefix if use_prefix else ""
+    keys = [make_key(EMBED_MODEL, key_prefix, t) for t in texts]
+    cached = store.get_many(keys)
+
+    missing: dict = {}  # key → text (дубли схлопываются)
+    for key, text, vec in zip(keys, texts, cached):
+        if vec is None and text:
+            missing.setdefault(key, text)
+    fresh: dict = {}
+    if missing:
+        vecs = get_embeddings(list(missing.values()), prefix=prefix, retry=retry,
+                              use_prefix=use_prefix)
+        fresh = {k: v for k, v in zip(missing, vecs) if v}
+        store.put_many(list(fresh), list(fresh.values()))
+
+    out: list = []
+    for key, vec in zip(keys, cached):
+        if vec is not None:
+            out.append(vec.tolist())
+        else:
+            out.append(fresh.get(key, []))
+    return out
+
+
+def import_legacy_embed_cache(cache: dict, prefix: str = "query") -> int:
+    """
+    [STORE] Переносит старый JSON-кэш {text: vector} в общий EmbedStore.
+    Возвращает число перенесённых векторов.
+    """
+    from embed_store import make_key
+    if not cache:
+        return 0
+    items = [(t, v) for t, v in cache.items() if t and v]
+    get_embed_store().put_many(
+        [make_key(EMBED_MODEL, prefix, t) for t, _ in items], [v for _, v in items]
+    )
+    return len(items)